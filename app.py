@@ -1,17 +1,57 @@
+from __future__ import annotations  # annotations name pd.DataFrame without importing pandas
 import streamlit as st
-import pandas as pd
-import PyPDF2
 import re
-import plotly.express as px
-import plotly.graph_objects as go
 from collections import defaultdict
 import io
 import json
 import datetime
 from typing import Dict, List, Optional
 import hashlib
-import requests
+import sqlite3
+import gzip
+import base64
+import math
+import numbers
 import time
+import urllib.parse
+import os
+import sys
+import random
+import multiprocessing
+import threading
+import bisect
+import contextlib
+import functools
+import importlib
+import logging
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger("result_analyzer")
+
+class _LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    numpy, pandas, plotly, PyPDF2 and requests take longer to import than the login page
+    takes to render; only the dashboards, charts, PDF parsing and Firestore calls use them.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+np = _LazyModule("numpy")
+pd = _LazyModule("pandas")
+px = _LazyModule("plotly.express")
+go = _LazyModule("plotly.graph_objects")
+PyPDF2 = _LazyModule("PyPDF2")
+requests = _LazyModule("requests")
 
 # -----------------------------------------------------------------------------
 # 1. PAGE CONFIGURATION & CSS
@@ -77,336 +117,3016 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
-# 2. FIREBASE CONFIGURATION & MANAGER
+# 2. FIREBASE CONFIGURATION, STORAGE BACKENDS & MANAGER
 # -----------------------------------------------------------------------------
 FIREBASE_CONFIG = {}
 
-FIREBASE_REST_URL = f"https://firestore.googleapis.com/v1/projects/{FIREBASE_CONFIG['projectId']}/databases/(default)/documents"
+FIREBASE_DB_PATH = f"projects/{FIREBASE_CONFIG.get('projectId', '')}/databases/(default)/documents"
+FIREBASE_REST_URL = f"https://firestore.googleapis.com/v1/{FIREBASE_DB_PATH}"
 
-class FirebaseManager:
+# Firestore rejects commits with more than 500 writes
+FIRESTORE_MAX_BATCH_WRITES = 500
+FIRESTORE_COMMIT_WORKERS = 8
+PRN_PATTERN = re.compile(r'^[A-Z0-9]*\d[A-Z0-9]*$')
+# Header fields needed to list uploads without pulling students_data
+RESULT_FILE_META_FIELDS = ["file_name", "exam_tag", "uploaded_by", "uploaded_at", "total_students", "summary", "storage", "aggregates"]
+SAVED_RESULTS_PAGE_SIZE = 20
+CONNECTION_CHECK_TTL_SECONDS = 300
+# Background saves: jobs are written here before they run and removed once saved
+SAVE_JOBS_DIR = os.environ.get("RESULT_SAVE_JOBS_DIR", "save_jobs")
+SAVE_JOB_WORKERS = 2
+SAVE_JOB_MAX_ATTEMPTS = 4
+SAVE_JOB_RETRY_SECONDS = 5  # doubled after each failed attempt
+SAVE_JOB_POLL_SECONDS = 1.0
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", 600))
+# Firestore batchGet accepts many documents per call; keep responses to a sane size
+FIRESTORE_BATCH_GET_SIZE = 100
+# "firestore" (default) or "sqlite" for a local database with local accounts
+RESULT_STORE_BACKEND = os.environ.get("RESULT_STORE", "firestore").lower()
+SQLITE_PATH = os.environ.get("RESULT_SQLITE_PATH", "results.db")
+# Materialized aggregates: 20 SGPA buckets of 0.5 over 0-10, and the top of each upload/exam
+SGPA_HISTOGRAM_BINS = 20
+AGGREGATE_TOP_N = 10
+EXAM_AGGREGATE_MAX_RETRIES = 5
+GRADE_FACT_COLUMNS = ['course_code', 'course_name', 'prn', 'exam_tag', 'grade']
+STUDENT_FACT_COLUMNS = ['prn', 'name', 'exam_tag', 'sgpa', 'passed']  # sgpa is None unless valid
+# Name search: the index is rebuilt from the store after this long (uploads from this process
+# are added immediately); fuzzy matches need this share of trigrams in common
+NAME_INDEX_TTL_SECONDS = float(os.environ.get("NAME_INDEX_TTL_SECONDS", 600))
+NAME_SEARCH_LIMIT = 20
+NAME_FUZZY_MIN_SIMILARITY = 0.4
+# Uploads saved before prn_index are in neither index; "on" lets a search the indexes cannot
+# answer scan every upload instead (on Firestore, a download of every student)
+RESULT_LEGACY_SCAN = os.environ.get("RESULT_LEGACY_SCAN", "off").lower() == "on"
+# Delta sync: "delta" keeps a local snapshot of upload headers current by querying only for
+# uploaded_at past the last one seen; "off" lists the whole collection on every read
+RESULT_SYNC_MODE = os.environ.get("RESULT_SYNC", "delta").lower()
+RESULT_SYNC_INTERVAL_SECONDS = float(os.environ.get("RESULT_SYNC_INTERVAL_SECONDS", 2))
+RESULT_SYNC_FULL_SECONDS = float(os.environ.get("RESULT_SYNC_FULL_SECONDS", 3600))
+# uploaded_at is the saving client's clock when the save started, so a long save can land
+# behind uploads that finished first; each sync re-reads this far behind the watermark
+RESULT_SYNC_OVERLAP_SECONDS = 600
+# Student list pages: only the visible page of rows is sent to the browser
+STUDENT_LIST_PAGE_SIZES = [25, 50, 100, 250]
+PLOTLY_FIGURE_CACHE_ENTRIES = 128
+# Timing spans: each rerun can be appended to a JSON-lines log, and the process totals
+# rewritten as a Prometheus text file (for node_exporter's textfile collector)
+PERF_LOG_PATH = os.environ.get("PERF_LOG_PATH")
+PERF_PROMETHEUS_PATH = os.environ.get("PERF_PROMETHEUS_PATH")
+
+# -----------------------------------------------------------------------------
+# Timing spans
+# -----------------------------------------------------------------------------
+class PerfTrace:
+    """Spans and counters recorded during one script rerun.
+
+    A span is a dict with the name, its duration in ms and whatever the instrumented code
+    added (bytes, docs, status, ...). Spans nest, so per-name totals can overlap. Worker
+    threads record into the trace of the rerun that started them via bind_trace.
+    """
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self._start = time.perf_counter()
+        self.spans = []
+        self.counters = Counter()
+        self._lock = threading.Lock()
+    
+    def add(self, span: Dict):
+        with self._lock: self.spans.append(span)
+    
+    def count(self, name: str, n: int = 1):
+        with self._lock: self.counters[name] += n
+    
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+    
+    def breakdown(self) -> List[Dict]:
+        """Calls, total/max ms, bytes and docs per span name, largest total first."""
+        rows = {}
+        with self._lock: spans = list(self.spans)
+        for span in spans:
+            row = rows.setdefault(span['name'], {'span': span['name'], 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'bytes': 0, 'docs': 0})
+            row['calls'] += 1
+            row['total_ms'] += span['ms']
+            row['max_ms'] = max(row['max_ms'], span['ms'])
+            row['bytes'] += span.get('bytes', 0)
+            row['docs'] += span.get('docs', 0)
+        return sorted(rows.values(), key=lambda r: -r['total_ms'])
+    
+    def to_record(self) -> Dict:
+        with self._lock: counters = dict(self.counters)
+        return {
+            'at': self.started_at.isoformat(timespec='milliseconds'), 'page': self.label,
+            'total_ms': round(self.elapsed_ms(), 2), 'counters': counters,
+            'spans': [{**row, 'total_ms': round(row['total_ms'], 3), 'max_ms': round(row['max_ms'], 3)} for row in self.breakdown()],
+        }
+
+class PerfStats:
+    """Span totals over every rerun of every session in this process."""
     def __init__(self):
-        self.id_token = st.session_state.get('id_token')
-        self.user_id = st.session_state.get('user_id')
-        self.initialize_firebase()
+        self.reruns = 0
+        self.rerun_seconds = 0.0
+        self.spans = {}  # name -> [calls, seconds, bytes, docs]
+        self.counters = Counter()
+        self._lock = threading.Lock()
     
-    def initialize_firebase(self):
-        try:
-            requests.get(f"{FIREBASE_REST_URL}/test_connection")
-        except Exception:
-            pass
+    def record(self, trace: PerfTrace, log_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        """Fold a finished rerun into the totals and write the configured exports."""
+        record = trace.to_record()
+        with self._lock:
+            self.reruns += 1
+            self.rerun_seconds += record['total_ms'] / 1000
+            for row in record['spans']:
+                totals = self.spans.setdefault(row['span'], [0, 0.0, 0, 0])
+                totals[0] += row['calls']
+                totals[1] += row['total_ms'] / 1000
+                totals[2] += row['bytes']
+                totals[3] += row['docs']
+            self.counters.update(record['counters'])
+            try:
+                if log_path:
+                    with open(log_path, "a", encoding="utf-8") as fh: fh.write(json.dumps(record) + "\n")
+                if prometheus_path:
+                    tmp_path = f"{prometheus_path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as fh: fh.write(self._prometheus_text())
+                    os.replace(tmp_path, prometheus_path)
+            except OSError:
+                pass  # exports are best-effort; the sidebar panel still works
     
-    def hash_password(self, password: str) -> str:
-        return hashlib.sha256(password.encode()).hexdigest()
+    def to_prometheus(self) -> str:
+        with self._lock: return self._prometheus_text()
     
-    def _set_session_token(self, token, uid):
-        self.id_token = token
-        self.user_id = uid
-        st.session_state['id_token'] = token
-        st.session_state['user_id'] = uid
+    def _prometheus_text(self) -> str:
+        def label(value): return str(value).replace('\\', '\\\\').replace('"', '\\"')
+        lines = [
+            "# HELP result_analyzer_rerun_seconds Script rerun wall time.",
+            "# TYPE result_analyzer_rerun_seconds summary",
+            f"result_analyzer_rerun_seconds_count {self.reruns}",
+            f"result_analyzer_rerun_seconds_sum {self.rerun_seconds:.6f}",
+            "# HELP result_analyzer_span_seconds Time spent in instrumented spans.",
+            "# TYPE result_analyzer_span_seconds summary",
+        ]
+        for name, (calls, seconds, _, _) in sorted(self.spans.items()):
+            lines.append(f'result_analyzer_span_seconds_count{{span="{label(name)}"}} {calls}')
+            lines.append(f'result_analyzer_span_seconds_sum{{span="{label(name)}"}} {seconds:.6f}')
+        for index, metric, help_text in [(2, "bytes", "Bytes sent and received in spans."), (3, "docs", "Documents read or written in spans.")]:
+            lines += [f"# HELP result_analyzer_span_{metric}_total {help_text}", f"# TYPE result_analyzer_span_{metric}_total counter"]
+            lines += [f'result_analyzer_span_{metric}_total{{span="{label(name)}"}} {totals[index]}'
+                      for name, totals in sorted(self.spans.items()) if totals[index]]
+        lines += ["# HELP result_analyzer_events_total Counted events such as cache hits and misses.",
+                  "# TYPE result_analyzer_events_total counter"]
+        lines += [f'result_analyzer_events_total{{event="{label(name)}"}} {n}' for name, n in sorted(self.counters.items())]
+        return "\n".join(lines) + "\n"
 
-    def sign_in_with_email_password(self, email: str, password: str):
-        try:
-            auth_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={FIREBASE_CONFIG['apiKey']}"
-            auth_data = {"email": email, "password": password, "returnSecureToken": True}
-            response = requests.post(auth_url, json=auth_data)
-            result = response.json()
-            if response.status_code == 200:
-                self._set_session_token(result.get('idToken'), result.get('localId'))
-                return True, result
+@st.cache_resource
+def get_perf_stats() -> PerfStats:
+    return PerfStats()
+
+_perf_local = threading.local()
+
+def current_trace() -> Optional[PerfTrace]:
+    return getattr(_perf_local, 'trace', None)
+
+def start_perf_trace(label: str = "") -> PerfTrace:
+    trace = PerfTrace(label)
+    _perf_local.trace = trace
+    return trace
+
+def finish_perf_trace(trace: PerfTrace):
+    _perf_local.trace = None
+    get_perf_stats().record(trace, PERF_LOG_PATH, PERF_PROMETHEUS_PATH)
+
+def bind_trace(fn):
+    """Wrap fn so spans it records on a worker thread land in the calling rerun's trace."""
+    trace = current_trace()
+    def bound(*args, **kwargs):
+        previous = current_trace()
+        _perf_local.trace = trace
+        try: return fn(*args, **kwargs)
+        finally: _perf_local.trace = previous
+    return bound
+
+@contextlib.contextmanager
+def perf_span(name: str, **attrs):
+    """Time a block into the current trace. Yields the span's attribute dict, or None when
+    nothing is being traced (e.g. the CLI tools), so callers can skip measuring bytes."""
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        trace.add({'name': name, 'ms': (time.perf_counter() - start) * 1000, **attrs})
+
+def record_span(name: str, ms: float, **attrs):
+    trace = current_trace()
+    if trace is not None: trace.add({'name': name, 'ms': ms, **attrs})
+
+def perf_count(name: str, n: int = 1):
+    trace = current_trace()
+    if trace is not None: trace.count(name, n)
+
+def perf_timed(name: str):
+    """Decorator form of perf_span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with perf_span(name): return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def timed_iter(name: str, iterable, count_as: str = 'items', **attrs):
+    """Yield from iterable and record one span with the time spent producing the items,
+    excluding the time the consumer spends between them."""
+    busy, n = 0.0, 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try: item = next(iterator)
+            except StopIteration: break
+            finally: busy += time.perf_counter() - start
+            n += 1
+            yield item
+    finally:
+        record_span(name, busy * 1000, **{count_as: n}, **attrs)
+
+class ResultFileCache:
+    """Process-wide LRU cache of decoded Firestore documents shared by all sessions.
+
+    Entries are keyed by document path and tagged with the document's updateTime, so a
+    caller that knows the current updateTime (from a listing) never gets a stale copy.
+    Size is bounded by an estimate of the encoded document size; entries also expire
+    after ttl_seconds. Cached values are shared and must be treated as read-only.
+    """
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (update_time, value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str, update_time: Optional[str] = None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_time, value, size, stored_at = entry
+                fresh = time.monotonic() - stored_at <= self.ttl_seconds
+                if fresh and (update_time is None or update_time == cached_time):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    perf_count('result_cache_hits')
+                    return value
+                self._remove(key)
+            self.misses += 1
+            perf_count('result_cache_misses')
+            return None
+    
+    def put(self, key: str, value, size: int, update_time: Optional[str] = None):
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._entries: self._remove(key)
+            self._entries[key] = (update_time, value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def invalidate(self, key: str):
+        with self._lock:
+            if key in self._entries: self._remove(key)
+    
+    def invalidate_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def _remove(self, key: str):
+        self._bytes -= self._entries.pop(key)[2]
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0
+            }
+
+HTTP_POOL_SIZE = 20
+HTTP_TIMEOUT = (5, 60)  # (connect, read) seconds
+HTTP_MAX_RETRIES = 3
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class HttpTransport:
+    """Keep-alive HTTP session with timeouts and jittered exponential backoff.
+
+    Retries cover connection errors and HTTP_RETRY_STATUSES. Callers pass retry=False for
+    requests that are not safe to repeat (e.g. account sign-up).
+    """
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, max_retries: int = HTTP_MAX_RETRIES,
+                 backoff_base: float = 0.5, backoff_cap: float = 8.0):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    
+    def request(self, method: str, url: str, retry: bool = True, timeout=None, **kwargs):
+        attempts = 1 + (self.max_retries if retry else 0)
+        for attempt in range(attempts):
+            retry_after = None
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == attempts - 1: raise
             else:
-                return False, result.get('error', {}).get('message', 'Unknown error')
-        except Exception as e:
-            return False, str(e)
+                if response.status_code not in HTTP_RETRY_STATUSES or attempt == attempts - 1:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+            time.sleep(self._backoff(attempt, retry_after))
     
-    def create_user_with_email_password(self, email: str, password: str, name: str):
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_cap)
+        # Full jitter keeps concurrent sessions from retrying in lockstep
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+    
+    def get(self, url: str, **kwargs): return self.request("GET", url, **kwargs)
+    def post(self, url: str, **kwargs): return self.request("POST", url, **kwargs)
+
+@st.cache_resource
+def get_http_transport() -> HttpTransport:
+    return HttpTransport()
+
+@st.cache_resource
+def get_result_cache() -> ResultFileCache:
+    # cache_resource keeps one instance per server process across reruns and sessions
+    return ResultFileCache()
+
+# -----------------------------------------------------------------------------
+# Firestore value codec
+# -----------------------------------------------------------------------------
+_FIRESTORE_TIMESTAMP = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)?$')
+
+def _encode_timestamp(value: datetime.datetime) -> Dict:
+    # Naive datetimes are taken to be UTC, as datetime.utcnow() values are throughout the app
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return {"timestampValue": value.isoformat(timespec="microseconds") + "Z"}
+
+def _decode_timestamp(raw: str):
+    """RFC 3339 with up to nanosecond precision -> aware UTC datetime (microseconds kept)."""
+    match = _FIRESTORE_TIMESTAMP.match(raw)
+    if not match: return raw
+    base, fraction, zone = match.groups()
+    value = datetime.datetime.fromisoformat(base).replace(microsecond=int((fraction or "0")[:6].ljust(6, "0")))
+    if zone and zone != "Z":
+        sign = 1 if zone[0] == "+" else -1
+        offset = datetime.timedelta(hours=int(zone[1:3]), minutes=int(zone[4:6]))
+        return value.replace(tzinfo=datetime.timezone(sign * offset)).astimezone(datetime.timezone.utc)
+    return value.replace(tzinfo=datetime.timezone.utc)
+
+def _encode_double(value: float) -> Dict:
+    # JSON has no NaN/Infinity literals; Firestore accepts them as strings
+    if math.isfinite(value): return {"doubleValue": value}
+    return {"doubleValue": "NaN" if math.isnan(value) else ("Infinity" if value > 0 else "-Infinity")}
+
+def _encode_fallback(value) -> Dict:
+    # Subclasses and NumPy scalars miss the exact-type table below
+    if isinstance(value, bool): return {"booleanValue": value}
+    if isinstance(value, numbers.Integral): return {"integerValue": str(int(value))}
+    if isinstance(value, numbers.Real): return _encode_double(float(value))
+    if isinstance(value, str): return {"stringValue": str(value)}
+    if isinstance(value, datetime.datetime): return _encode_timestamp(value)
+    if isinstance(value, dict): return {"mapValue": {"fields": encode_firestore_fields(value)}}
+    if isinstance(value, (list, tuple)): return {"arrayValue": {"values": [encode_firestore_value(v) for v in value]}}
+    if hasattr(value, "item"): return encode_firestore_value(value.item())  # np.bool_ and friends
+    return {"stringValue": str(value)}
+
+_FIRESTORE_ENCODERS = {
+    type(None): lambda v: {"nullValue": None},
+    bool: lambda v: {"booleanValue": v},
+    int: lambda v: {"integerValue": str(v)},
+    float: _encode_double,
+    str: lambda v: {"stringValue": v},
+    bytes: lambda v: {"bytesValue": base64.b64encode(v).decode("ascii")},
+    datetime.datetime: _encode_timestamp,
+    list: lambda v: {"arrayValue": {"values": [encode_firestore_value(x) for x in v]}},
+    tuple: lambda v: {"arrayValue": {"values": [encode_firestore_value(x) for x in v]}},
+    dict: lambda v: {"mapValue": {"fields": encode_firestore_fields(v)}},
+}
+
+def encode_firestore_value(value) -> Dict:
+    t = type(value)
+    # Scalars first, inline: they are nearly every value and skip a table call
+    if t is str: return {"stringValue": value}
+    if t is int: return {"integerValue": str(value)}
+    if t is float and value == value and value not in (math.inf, -math.inf): return {"doubleValue": value}
+    encoder = _FIRESTORE_ENCODERS.get(t)
+    return encoder(value) if encoder else _encode_fallback(value)
+
+def encode_firestore_fields(values: Dict) -> Dict:
+    return {k: encode_firestore_value(v) for k, v in values.items()}
+
+def _decode_double(raw) -> float:
+    return float(raw)  # float() also parses the "NaN"/"Infinity" strings
+
+_FIRESTORE_DECODERS = {
+    'nullValue': lambda raw: None,
+    'booleanValue': lambda raw: raw,
+    'integerValue': int,
+    'doubleValue': _decode_double,
+    'stringValue': lambda raw: raw,
+    'timestampValue': _decode_timestamp,
+    'bytesValue': base64.b64decode,
+    'referenceValue': lambda raw: raw,
+    'geoPointValue': lambda raw: {'latitude': raw.get('latitude', 0.0), 'longitude': raw.get('longitude', 0.0)},
+    'arrayValue': lambda raw: [decode_firestore_value(v) for v in raw.get('values', ())],
+    'mapValue': lambda raw: decode_firestore_fields(raw.get('fields', {})),
+}
+
+def decode_firestore_value(value: Dict):
+    # A Firestore Value carries exactly one type key; scalars skip the table call
+    if 'stringValue' in value: return value['stringValue']
+    if 'integerValue' in value: return int(value['integerValue'])
+    if 'doubleValue' in value: return float(value['doubleValue'])
+    if 'booleanValue' in value: return value['booleanValue']
+    if 'mapValue' in value: return decode_firestore_fields(value['mapValue'].get('fields', {}))
+    for kind, raw in value.items():
+        return _FIRESTORE_DECODERS[kind](raw)
+    return None
+
+def decode_firestore_fields(fields: Dict) -> Dict:
+    # The checks of decode_firestore_value repeated inline: a call per field costs more than
+    # the lookups, and headers and maps are decoded field by field
+    result = {}
+    for key, value in fields.items():
+        if 'stringValue' in value: result[key] = value['stringValue']
+        elif 'integerValue' in value: result[key] = int(value['integerValue'])
+        elif 'doubleValue' in value: result[key] = float(value['doubleValue'])
+        elif 'booleanValue' in value: result[key] = value['booleanValue']
+        elif 'arrayValue' in value: result[key] = [decode_firestore_value(v) for v in value['arrayValue'].get('values', ())]
+        elif 'mapValue' in value: result[key] = decode_firestore_fields(value['mapValue'].get('fields', {}))
+        else: result[key] = decode_firestore_value(value)
+    return result
+
+# Schema-aware fast path for student records: Subjects is the bulk of every save and load,
+# and its entries are flat maps of strings.
+def encode_student_fields(student: Dict) -> Dict:
+    fields = {}
+    for key, value in student.items():
+        if key == 'Subjects' and type(value) is list:
+            fields[key] = {"arrayValue": {"values": [
+                {"mapValue": {"fields": {k: {"stringValue": v} if type(v) is str else encode_firestore_value(v)
+                                         for k, v in sub.items()}}}
+                if type(sub) is dict else encode_firestore_value(sub)
+                for sub in value
+            ]}}
+        else:
+            fields[key] = encode_firestore_value(value)
+    return fields
+
+def decode_firestore_doc(doc: Dict) -> Dict:
+    return decode_firestore_fields(doc.get('fields', {}))
+
+def decode_student_fields(fields: Dict) -> Dict:
+    result = {}
+    for key, value in fields.items():
+        if key == 'Subjects':
+            try:
+                result[key] = [{k: v['stringValue'] for k, v in sub['mapValue']['fields'].items()}
+                               for sub in value['arrayValue'].get('values', ())]
+                continue
+            except (KeyError, TypeError, AttributeError):
+                pass
+        result[key] = decode_firestore_value(value)
+    return result
+
+class SaveError(Exception):
+    """An upload that was not saved; the message says why."""
+
+def report_store_error(message: str):
+    """Show a storage error in the page, or log it on threads without a script run (background saves)."""
+    if get_script_run_ctx(suppress_warning=True) is None: logger.warning(message)
+    else: st.error(message)
+
+class ResultStore:
+    """Persistence interface behind FirebaseManager.
+
+    An upload is a header dict (file_name, exam_tag, uploaded_by, uploaded_at,
+    total_students, summary, aggregates) plus its students_data list; a student is addressed by
+    (upload id, slot), its position in that list. Lookups that return students yield
+    (header, student) pairs so callers can attach exam metadata.
+    """
+    id_token = None
+    snapshot = None  # UploadSnapshot when delta sync is on
+
+    def check_connection(self) -> bool: return True
+    def detached(self, id_token: Optional[str]) -> "ResultStore":
+        """A store on the same backend holding its own token, for work that outlives the session
+        (background saves keep writing after a sign-out or a new sign-in)."""
+        raise NotImplementedError
+
+    # Accounts
+    def sign_in(self, email: str, password: str): raise NotImplementedError
+    def sign_up(self, email: str, password: str, name: str): raise NotImplementedError
+    def get_user_profile(self, uid: str) -> Optional[Dict]: raise NotImplementedError
+    def save_user_profile(self, uid: str, profile: Dict) -> bool: raise NotImplementedError
+
+    # Uploads
+    def save_upload(self, doc_id: str, header: Dict, students_data: List[Dict], progress_callback=None,
+                    warnings: Optional[List[str]] = None) -> bool:
+        """Write one upload under doc_id. Saving the same doc_id again must be a no-op re-write.
+
+        Returns True once saved and raises SaveError when it was not. Saves run on background
+        threads, so nothing is shown from here: progress_callback(done, total) is called as
+        writes are acknowledged, and problems that did not stop the save are appended to warnings.
+        """
+        raise NotImplementedError
+    def list_uploads(self, page_size: int, page_token: Optional[str] = None, metadata_only: bool = True): raise NotImplementedError
+    def get_all_uploads(self) -> List[Dict]: raise NotImplementedError
+    def get_upload(self, doc_id: str, update_time: Optional[str] = None) -> Optional[Dict]: raise NotImplementedError
+    def get_upload_header(self, doc_id: str) -> Optional[Dict]: raise NotImplementedError
+    def get_students(self, doc_id: str, slots: List[int]) -> List[Dict]: raise NotImplementedError
+    def uploads_since(self, since: Optional[datetime.datetime] = None) -> Optional[List[Dict]]:
+        """Headers with uploaded_at after `since` (all when None), oldest first; None if the read failed."""
+        raise NotImplementedError
+
+    def synced_uploads(self):
+        """The upload snapshot brought up to date, or None when delta sync is off."""
+        if self.snapshot is None: return None
+        self.snapshot.sync(self)
+        return self.snapshot
+
+    # Aggregates (see StudentTable.aggregates and merge_exam_aggregate)
+    def get_exam_aggregate(self, exam_tag) -> Optional[Dict]: raise NotImplementedError
+    def list_exam_aggregates(self) -> List[Dict]: raise NotImplementedError
+
+    # Rank tables (see exam_rank_entries and merge_exam_ranks); saves fold them like aggregates
+    def get_exam_ranks(self, exam_tag) -> Optional[Dict]: raise NotImplementedError
+    def fold_exam_ranks(self, doc_id: str, exam_tag, entries: Dict, newest: bool = True) -> bool: raise NotImplementedError
+
+    # Search
+    def find_by_prn(self, prn: str):
+        """(file_data, student) records for a canonical PRN; [] when it is unknown, None if the index could not be read."""
+        raise NotImplementedError
+    def search_students(self, search_term: str): raise NotImplementedError
+
+    def name_directory(self):
+        """(PRN, name, mother) of every indexed student, for NameIndex."""
+        for file_data in self.get_all_uploads():
+            for student in file_data.get('students_data', []):
+                yield student.get('PRN'), student.get('Name'), student.get('Mother Name')
+
+    # Analytics
+    def grade_facts(self, file_ids: Optional[List[str]] = None) -> Dict[str, list]:
+        """Every subject row as parallel GRADE_FACT_COLUMNS lists, oldest upload first.
+
+        With file_ids only those uploads are read, in the order given.
+        """
+        columns = {key: [] for key in GRADE_FACT_COLUMNS}
+        codes, names, prns, exams, grades = (columns[key] for key in GRADE_FACT_COLUMNS)
+        for file_data in self._uploads_in_order(file_ids):
+            exam = str(file_data.get('exam_tag') or file_data.get('file_name') or '')
+            for student in file_data.get('students_data', []):
+                prn = str(student.get('PRN') or '').strip()
+                for sub in student.get('Subjects') or ():
+                    codes.append(sub.get('Course Code') or '')
+                    names.append(sub.get('Course Name') or '')
+                    prns.append(prn)
+                    exams.append(exam)
+                    grades.append(sub.get('Grade') or '')
+        return columns
+
+    def student_facts(self, file_ids: Optional[List[str]] = None) -> Dict[str, list]:
+        """One row per student per upload as parallel STUDENT_FACT_COLUMNS lists, ordered as grade_facts."""
+        columns = {key: [] for key in STUDENT_FACT_COLUMNS}
+        for file_data in self._uploads_in_order(file_ids):
+            exam = str(file_data.get('exam_tag') or file_data.get('file_name') or '')
+            for student in file_data.get('students_data', []):
+                columns['prn'].append(str(student.get('PRN') or '').strip())
+                columns['name'].append(student.get('Name') or '')
+                columns['exam_tag'].append(exam)
+                columns['sgpa'].append(student.get('SGPA') if student.get('Has Valid SGPA') else None)
+                columns['passed'].append(student.get('Result Status') == 'Pass')
+        return columns
+
+    def _uploads_in_order(self, file_ids: Optional[List[str]] = None) -> List[Dict]:
+        if file_ids is None:
+            return sorted(self.get_all_uploads(), key=lambda f: _iso(f.get('uploaded_at')) or '')
+        # Just these uploads; the snapshot's update_time keeps a cached copy only while it is current
+        versions = {h['id']: h.get('update_time') for h in self.snapshot.view()[1]} if self.snapshot is not None else {}
+        return [f for f in (self.get_upload(file_id, versions.get(file_id)) for file_id in file_ids) if f]
+
+
+# Top-level "name" of each document in a GET, list, batchGet or runQuery response; counted
+# on the raw bytes so spans do not have to parse the body a second time
+_FIRESTORE_DOC_NAME = re.compile(rb'"name":\s*"projects/')
+
+def _firestore_span_target(path: str) -> str:
+    """'result_files/abc/students?pageSize=300' -> 'result_files/students'; ':commit' -> ':commit'."""
+    path = path.split('?', 1)[0]
+    return path if path.startswith(':') else "/".join(path.split('/')[::2])
+
+class FirestoreResultStore(ResultStore):
+    """Firestore REST storage.
+
+    Layout: result_files/{id} holds the upload header, result_files/{id}/students/{slot}
+    one document per student, prn_index/{PRN} the (file id, slot) entries of every
+    upload that contains that PRN, exam_aggregates/{tag} the rollup of every upload
+    for an exam and exam_ranks/{tag} its rank table. Reads go through the shared
+    ResultFileCache.
+    """
+    def __init__(self, transport: HttpTransport, cache: ResultFileCache, id_token: Optional[str] = None,
+                 snapshot: Optional["UploadSnapshot"] = None):
+        self.http = transport
+        self.cache = cache
+        self.id_token = id_token
+        self.snapshot = snapshot
+
+    def detached(self, id_token: Optional[str]) -> "FirestoreResultStore":
+        return FirestoreResultStore(self.http, self.cache, id_token, self.snapshot)
+
+    def check_connection(self) -> bool:
+        try:
+            self.http.get(f"{FIREBASE_REST_URL}/test_connection", retry=False, timeout=(3, 5))
+            return True
+        except Exception:
+            return False
+
+    def _auth_request(self, endpoint: str, payload: Dict, retry: bool = True):
         try:
-            auth_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={FIREBASE_CONFIG['apiKey']}"
-            auth_data = {"email": email, "password": password, "displayName": name, "returnSecureToken": True}
-            response = requests.post(auth_url, json=auth_data)
+            auth_url = f"https://identitytoolkit.googleapis.com/v1/accounts:{endpoint}?key={FIREBASE_CONFIG['apiKey']}"
+            response = self.http.post(auth_url, json=payload, retry=retry)
             result = response.json()
             if response.status_code == 200:
-                self._set_session_token(result.get('idToken'), result.get('localId'))
                 return True, result
             else:
                 return False, result.get('error', {}).get('message', 'Unknown error')
         except Exception as e:
             return False, str(e)
-    
+
+    def sign_in(self, email: str, password: str):
+        return self._auth_request("signInWithPassword", {"email": email, "password": password, "returnSecureToken": True})
+
+    def sign_up(self, email: str, password: str, name: str):
+        # Not retried: a sign-up that reached the server would fail again with EMAIL_EXISTS
+        return self._auth_request("signUp", {"email": email, "password": password, "displayName": name, "returnSecureToken": True}, retry=False)
+
+    def get_user_profile(self, uid: str):
+        user_doc = self.firestore_request("GET", f"users/{uid}")
+        if not user_doc: return None
+        return decode_firestore_doc(user_doc)
+
+    def save_user_profile(self, uid: str, profile: Dict) -> bool:
+        user_data = {"fields": encode_firestore_fields(profile)}
+        response = self.firestore_request("POST", f"users?documentId={uid}", user_data)
+        if not response or 'error' in response:
+             response = self.firestore_request("PATCH", f"users/{uid}", user_data)
+        return bool(response)
+
+    def _firestore_response(self, method, path, data=None):
+        """Raw round trip; status handling is left to the caller."""
+        # Paths like ":commit" are RPCs on the documents root rather than document paths
+        url = f"{FIREBASE_REST_URL}{path}" if path.startswith(':') else f"{FIREBASE_REST_URL}/{path}"
+        headers = {"Authorization": f"Bearer {self.id_token}", "Content-Type": "application/json"}
+        with perf_span(f"firestore {method} {_firestore_span_target(path)}") as span:
+            response = self.http.request(method, url, headers=headers, json=data)
+            if span is not None:
+                span['status'] = response.status_code
+                span['bytes'] = len(response.content) + len(response.request.body or b"")
+                writes = (data or {}).get('writes')
+                span['docs'] = len(writes) if writes else len(_FIRESTORE_DOC_NAME.findall(response.content))
+            return response
+
     def firestore_request(self, method, path, data=None):
         if not self.id_token: return None
-        url = f"{FIREBASE_REST_URL}/{path}"
-        headers = {"Authorization": f"Bearer {self.id_token}", "Content-Type": "application/json"}
         try:
-            if method == "GET": response = requests.get(url, headers=headers)
-            elif method == "POST": response = requests.post(url, headers=headers, json=data)
-            elif method == "PATCH": response = requests.patch(url, headers=headers, json=data)
-            elif method == "DELETE": response = requests.delete(url, headers=headers)
-            else: return None
-            
+            if method not in ("GET", "POST", "PATCH", "DELETE"): return None
+            response = self._firestore_response(method, path, data)
+
             if response.status_code not in [200, 201, 409]:
                 if response.status_code != 404:
-                    st.error(f"DB Error {response.status_code}: {response.text}")
+                    report_store_error(f"DB Error {response.status_code}: {response.text}")
                 return None
             return response.json()
         except Exception as e:
-            st.error(f"Request Exception: {str(e)}")
+            report_store_error(f"Request Exception: {str(e)}")
             return None
+
+    def save_upload(self, doc_id: str, header: Dict, students_data: List[Dict], progress_callback=None,
+                    warnings: Optional[List[str]] = None) -> bool:
+        """Write the students/{slot} documents and PRN index, then the header.
+
+        Student and PRN index writes go out in concurrent commits of up to 500 writes; the
+        header is written last so a listed upload always has all of its students in place.
+        """
+        if not self.id_token: raise SaveError("Not signed in")
+        header_write = {
+            "update": {
+                "name": f"{FIREBASE_DB_PATH}/result_files/{doc_id}",
+                "fields": encode_firestore_fields({**header, "storage": "sharded"})
+            }
+        }
+        writes = [self._student_write(doc_id, slot, student) for slot, student in enumerate(students_data)]
+        writes.extend(self._prn_index_writes(doc_id, header.get('exam_tag'), students_data))
+
+        total, done, lock = len(writes) + 1, [0], threading.Lock()
+        def advance(n):
+            with lock:
+                done[0] += n
+                if progress_callback: progress_callback(done[0], total)
+        error = self._commit_concurrently(writes, advance) or self._commit_concurrently([header_write], advance)
+        if error: raise SaveError(error)
+        self.cache.invalidate_prefix("list:")
+        self.cache.invalidate_prefix("prn_index/")
+        if header.get('aggregates') and not self._update_exam_aggregate(doc_id, header.get('exam_tag'), header['aggregates']):
+            if warnings is not None: warnings.append("Results saved, but the exam overview could not be updated.")
+        if not self.fold_exam_ranks(doc_id, header.get('exam_tag'), exam_rank_entries(doc_id, students_data)):
+            if warnings is not None: warnings.append("Results saved, but exam ranks could not be updated.")
+        return True
+
+    def _update_exam_aggregate(self, doc_id: str, exam_tag, aggregates: Dict) -> bool:
+        return self._fold_document(f"exam_aggregates/{exam_tag_key(exam_tag)}",
+                                   lambda current: merge_exam_aggregate(current, doc_id, exam_tag, aggregates))
+
+    def fold_exam_ranks(self, doc_id: str, exam_tag, entries: Dict, newest: bool = True) -> bool:
+        if not self.id_token: return False
+        return self._fold_document(f"exam_ranks/{exam_tag_key(exam_tag)}",
+                                   lambda current: merge_exam_ranks(current, doc_id, exam_tag, entries, newest))
+
+    def _fold_document(self, path: str, merge) -> bool:
+        """Fold an upload into a per-exam document with an optimistic read-modify-write.
+
+        merge(current or None) returns the new fields, or None when the upload is already in.
+        The commit is conditioned on the updateTime that was read, so concurrent saves for
+        the same exam retry rather than overwrite each other.
+        """
+        for attempt in range(EXAM_AGGREGATE_MAX_RETRIES):
+            try:
+                response = self._firestore_response("GET", path)
+                if response.status_code == 404:
+                    current, precondition = None, {"exists": False}
+                elif response.status_code == 200:
+                    doc = response.json()
+                    current, precondition = decode_firestore_doc(doc), {"updateTime": doc['updateTime']}
+                else:
+                    return False
+                merged = merge(current)
+                if merged is None: return True
+                write = {"update": {"name": f"{FIREBASE_DB_PATH}/{path}", "fields": encode_firestore_fields(merged)},
+                         "currentDocument": precondition}
+                if self._firestore_response("POST", ":commit", {"writes": [write]}).status_code == 200:
+                    self.cache.invalidate_prefix(path.split('/', 1)[0])
+                    return True
+            except requests.RequestException:
+                pass
+            # Lost the race to another save (or a transient error): re-read and fold again
+            time.sleep(self.http._backoff(attempt))
+        return False
+
+    def get_exam_ranks(self, exam_tag):
+        if not self.id_token: return None
+        cache_key = f"exam_ranks/{exam_tag_key(exam_tag)}"
+        cached = self.cache.get(cache_key)
+        if cached is not None: return cached
+        doc = self.firestore_request("GET", cache_key)
+        if not doc: return None
+        table = decode_firestore_doc(doc)
+        self.cache.put(cache_key, table, len(json.dumps(doc)), doc.get('updateTime'))
+        return table
+
+    def get_exam_aggregate(self, exam_tag):
+        if not self.id_token: return None
+        cache_key = f"exam_aggregates/{exam_tag_key(exam_tag)}"
+        cached = self.cache.get(cache_key)
+        if cached is not None: return cached
+        doc = self.firestore_request("GET", cache_key)
+        if not doc: return None
+        aggregate = decode_firestore_doc(doc)
+        self.cache.put(cache_key, aggregate, len(json.dumps(doc)), doc.get('updateTime'))
+        return aggregate
+
+    def list_exam_aggregates(self) -> List[Dict]:
+        """Exam tags with a rollup, with their student and upload counts only."""
+        if not self.id_token: return []
+        cached = self.cache.get("exam_aggregates:list")
+        if cached is not None: return cached
+        exams, page_token, size = [], None, 0
+        while True:
+            params = {"pageSize": 300, "mask.fieldPaths": ["exam_tag", "total_students", "file_ids"]}
+            if page_token: params["pageToken"] = page_token
+            result = self.firestore_request("GET", f"exam_aggregates?{urllib.parse.urlencode(params, doseq=True)}")
+            if not result: break
+            exams.extend(decode_firestore_doc(doc) for doc in result.get('documents', []))
+            size += len(json.dumps(result))
+            page_token = result.get('nextPageToken')
+            if not page_token: break
+        exams.sort(key=lambda e: str(e.get('exam_tag', '')))
+        self.cache.put("exam_aggregates:list", exams, size)
+        return exams
+
+    def _student_write(self, doc_id: str, slot: int, student: Dict) -> Dict:
+        fields = encode_student_fields(student)
+        fields['slot'] = {"integerValue": str(slot)}
+        return {"update": {"name": f"{FIREBASE_DB_PATH}/result_files/{doc_id}/students/{slot:06d}", "fields": fields}}
+
+    def _commit_concurrently(self, writes: List[Dict], on_batch=None) -> Optional[str]:
+        """Commit writes in concurrent batches; returns the first failure's reason, or None if all committed."""
+        batches = [writes[i:i + FIRESTORE_MAX_BATCH_WRITES] for i in range(0, len(writes), FIRESTORE_MAX_BATCH_WRITES)]
+        if not batches: return None
+        def commit(batch):
+            try:
+                response = self._firestore_response("POST", ":commit", {"writes": batch})
+            except requests.RequestException as e:
+                return f"Request Exception: {e}"
+            if response.status_code != 200: return f"DB Error {response.status_code}: {response.text[:500]}"
+            if on_batch: on_batch(len(batch))
+            return None
+        with ThreadPoolExecutor(max_workers=min(FIRESTORE_COMMIT_WORKERS, len(batches))) as pool:
+            errors = list(pool.map(bind_trace(commit), batches))
+        return next((e for e in errors if e), None)
+
+    def _prn_index_writes(self, doc_id: str, exam_tag: str, students_data: List[Dict]) -> List[Dict]:
+        """Writes that append (file id, slot) to prn_index/{PRN} for every student in the upload."""
+        writes = []
+        for slot, student in enumerate(students_data):
+            prn = prn_key(student.get('PRN'))
+            if not prn: continue
+            entry = {'file_id': doc_id, 'slot': slot, 'exam_tag': exam_tag}
+            writes.append({
+                "update": {
+                    "name": f"{FIREBASE_DB_PATH}/prn_index/{prn}",
+                    "fields": {
+                        "prn": encode_firestore_value(prn),
+                        "name": encode_firestore_value(student.get('Name', '')),
+                        "mother": encode_firestore_value(student.get('Mother Name', ''))
+                    }
+                },
+                "updateMask": {"fieldPaths": ["prn", "name", "mother"]},
+                # appendMissingElements keeps the entry list duplicate-free if a save is retried
+                "updateTransforms": [{
+                    "fieldPath": "entries",
+                    "appendMissingElements": {"values": [encode_firestore_value(entry)]}
+                }]
+            })
+        return writes
+
+    def list_uploads(self, page_size: int = SAVED_RESULTS_PAGE_SIZE, page_token: Optional[str] = None, metadata_only: bool = True):
+        """Fetch one page of result_files, newest first.
+
+        With metadata_only the request carries a field mask so student data never leaves
+        Firestore. Returns (files, next_page_token); next_page_token is None on the last page.
+        """
+        if not self.id_token: return [], None
+        snapshot = self.synced_uploads() if metadata_only else None
+        if snapshot is not None:
+            # Page tokens are offsets into the snapshot, newest first
+            offset = int(page_token or 0)
+            files = snapshot.newest_first()
+            return files[offset:offset + page_size], (str(offset + page_size) if offset + page_size < len(files) else None)
+        cache_key = f"list:{page_size}:{metadata_only}:{page_token}"
+        cached = self.cache.get(cache_key)
+        if cached is not None: return cached
+
+        params = {"pageSize": page_size, "orderBy": "uploaded_at desc"}
+        if page_token: params["pageToken"] = page_token
+        if metadata_only: params["mask.fieldPaths"] = RESULT_FILE_META_FIELDS
+        result = self.firestore_request("GET", f"result_files?{urllib.parse.urlencode(params, doseq=True)}")
+        if not result: return [], None
+
+        files = [self._file_from_doc(doc) for doc in result.get('documents', [])]
+        page = (files, result.get('nextPageToken'))
+        self.cache.put(cache_key, page, len(json.dumps(result)))
+        return page
+
+    def get_all_uploads(self):
+        if not self.id_token: return []
+        snapshot = self.synced_uploads()
+        if snapshot is not None:
+            listed = snapshot.newest_first()
+        else:
+            listed, page_token = [], None
+            while True:
+                page, page_token = self.list_uploads(page_size=300, page_token=page_token)
+                listed.extend(page)
+                if not page_token: break
+
+        # Only documents that changed since they were cached are downloaded again
+        files, missing = {}, []
+        for meta in listed:
+            cached = self.cache.get(f"result_files/{meta['id']}", meta.get('update_time'))
+            if cached is not None: files[meta['id']] = cached
+            else: missing.append(meta['id'])
+
+        for i in range(0, len(missing), FIRESTORE_BATCH_GET_SIZE):
+            names = [f"{FIREBASE_DB_PATH}/result_files/{doc_id}" for doc_id in missing[i:i + FIRESTORE_BATCH_GET_SIZE]]
+            for item in self.firestore_request("POST", ":batchGet", {"documents": names}) or []:
+                if 'found' in item:
+                    file_data = self._assemble_file(item['found'])
+                    files[file_data['id']] = file_data
+
+        return sorted(files.values(), key=lambda x: x.get('uploaded_at', ''), reverse=True)
+
+    def uploads_since(self, since: Optional[datetime.datetime] = None):
+        if not self.id_token: return None
+        query = {
+            "from": [{"collectionId": "result_files"}],
+            "select": {"fields": [{"fieldPath": field} for field in RESULT_FILE_META_FIELDS]},
+            "orderBy": [{"field": {"fieldPath": "uploaded_at"}, "direction": "ASCENDING"}],
+        }
+        if since is not None:
+            query["where"] = {"fieldFilter": {"field": {"fieldPath": "uploaded_at"}, "op": "GREATER_THAN",
+                                              "value": encode_firestore_value(since)}}
+        result = self.firestore_request("POST", ":runQuery", {"structuredQuery": query})
+        if result is None: return None
+        # One item per match, plus a bare {"readTime": ...} when nothing matched
+        return [self._file_from_doc(item['document']) for item in result if 'document' in item]
+
+    def get_upload(self, doc_id: str, update_time: Optional[str] = None):
+        if not self.id_token: return None
+        cached = self.cache.get(f"result_files/{doc_id}", update_time)
+        if cached is not None: return cached
+        doc = self.firestore_request("GET", f"result_files/{doc_id}")
+        if not doc: return None
+        return self._assemble_file(doc)
+
+    def get_upload_header(self, doc_id: str):
+        """Upload metadata only; never downloads student records."""
+        if not self.id_token: return None
+        cache_key = f"result_files/{doc_id}#header"
+        cached = self.cache.get(cache_key)
+        if cached is not None: return cached
+        params = urllib.parse.urlencode({"mask.fieldPaths": RESULT_FILE_META_FIELDS}, doseq=True)
+        doc = self.firestore_request("GET", f"result_files/{doc_id}?{params}")
+        if not doc: return None
+        header = self._file_from_doc(doc)
+        self.cache.put(cache_key, header, len(json.dumps(doc)), header['update_time'])
+        return header
+
+    def get_students(self, doc_id: str, slots: List[int]) -> List[Dict]:
+        """Fetch individual students/{slot} documents of a sharded upload."""
+        students, missing = {}, []
+        for slot in slots:
+            cached = self.cache.get(f"result_files/{doc_id}/students/{slot:06d}")
+            if cached is not None: students[slot] = cached
+            else: missing.append(slot)
+
+        for i in range(0, len(missing), FIRESTORE_BATCH_GET_SIZE):
+            names = [f"{FIREBASE_DB_PATH}/result_files/{doc_id}/students/{slot:06d}" for slot in missing[i:i + FIRESTORE_BATCH_GET_SIZE]]
+            for item in self.firestore_request("POST", ":batchGet", {"documents": names}) or []:
+                if 'found' not in item: continue
+                student = decode_student_fields(item['found'].get('fields', {}))
+                student.pop('slot', None)
+                # The document id is the slot; the field may be missing from a hand-edited or partial write
+                try: slot = int(item['found'].get('name', '').rsplit('/', 1)[-1])
+                except ValueError: continue
+                students[slot] = student
+                self.cache.put(f"result_files/{doc_id}/students/{slot:06d}", student, len(json.dumps(item['found'])))
+        return [students[slot] for slot in slots if slot in students]
+
+    def _list_students(self, doc_id: str):
+        """All students of a sharded upload in slot order, plus their encoded size."""
+        students, size, page_token = [], 0, None
+        while True:
+            params = {"pageSize": 1000}
+            if page_token: params["pageToken"] = page_token
+            result = self.firestore_request("GET", f"result_files/{doc_id}/students?{urllib.parse.urlencode(params)}")
+            if not result: break
+            for doc in result.get('documents', []):
+                student = decode_student_fields(doc.get('fields', {}))
+                student.pop('slot', None)
+                students.append(student)
+            size += len(json.dumps(result))
+            page_token = result.get('nextPageToken')
+            if not page_token: break
+        return students, size
+
+    def _file_from_doc(self, doc) -> Dict:
+        file_data = decode_firestore_doc(doc)
+        file_data['id'] = doc['name'].split('/')[-1]
+        file_data['update_time'] = doc.get('updateTime')
+        return file_data
+
+    def _assemble_file(self, doc) -> Dict:
+        """Decode a result_files document, loading students/{slot} for sharded uploads, and cache it."""
+        file_data = self._file_from_doc(doc)
+        size = len(json.dumps(doc))
+        if file_data.get('storage') == 'sharded':
+            file_data['students_data'], students_size = self._list_students(file_data['id'])
+            size += students_size
+        self.cache.put(f"result_files/{file_data['id']}", file_data, size, file_data['update_time'])
+        return file_data
+
+    def search_students(self, search_term: str):
+        for file_data in self.get_all_uploads():
+            for student in file_data.get('students_data', []):
+                s_name = student.get('Name', '').lower()
+                s_prn = student.get('PRN', '').strip()
+
+                if search_term in s_name or search_term == s_prn.lower():
+                    yield file_data, student
+
+    def find_by_prn(self, prn: str):
+        """Resolve a PRN through prn_index, reading only the student records that match.
+
+        A PRN with no index document is unknown ([]); None means the index could not be read.
+        """
+        index_data = self.cache.get(f"prn_index/{prn}")
+        if index_data is None:
+            try:
+                response = self._firestore_response("GET", f"prn_index/{prn}")
+            except requests.RequestException as e:
+                report_store_error(f"Request Exception: {str(e)}")
+                return None
+            if response.status_code == 404: return []
+            if response.status_code != 200:
+                report_store_error(f"DB Error {response.status_code}: {response.text}")
+                return None
+            index_doc = response.json()
+            index_data = decode_firestore_doc(index_doc)
+            self.cache.put(f"prn_index/{prn}", index_data, len(json.dumps(index_doc)), index_doc.get('updateTime'))
+        entries = index_data.get('entries', [])
+        if not entries: return []
+
+        records = []
+        slots_by_file = defaultdict(set)
+        for entry in entries:
+            slots_by_file[entry.get('file_id')].add(entry.get('slot'))
+
+        for file_id, slots in slots_by_file.items():
+            slots = sorted(s for s in slots if isinstance(s, int))
+            header = self.get_upload_header(file_id)
+            if not header: continue
+            if header.get('storage') == 'sharded':
+                file_data = header
+                matched = [s for s in self.get_students(file_id, slots) if prn_key(s.get('PRN')) == prn]
+            else:
+                # Uploads saved before sharding keep students_data inline
+                file_data = self.get_upload(file_id)
+                if not file_data: continue
+                students = file_data.get('students_data', [])
+                matched = [students[s] for s in slots if 0 <= s < len(students) and prn_key(students[s].get('PRN')) == prn]
+                if not matched:
+                    matched = [s for s in students if prn_key(s.get('PRN')) == prn]
+            records.extend((file_data, student) for student in matched)
+        return records
+
+    def name_directory(self):
+        """Names come from prn_index, so no student records are read."""
+        page_token = None
+        while True:
+            params = {"pageSize": 1000, "mask.fieldPaths": ["prn", "name", "mother"]}
+            if page_token: params["pageToken"] = page_token
+            result = self.firestore_request("GET", f"prn_index?{urllib.parse.urlencode(params, doseq=True)}")
+            if not result: break
+            for doc in result.get('documents', []):
+                entry = decode_firestore_doc(doc)
+                yield entry.get('prn'), entry.get('name'), entry.get('mother')
+            page_token = result.get('nextPageToken')
+            if not page_token: break
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    salt TEXT NOT NULL,
+    name TEXT,
+    role TEXT,
+    created_at TEXT,
+    last_login TEXT
+);
+CREATE TABLE IF NOT EXISTS result_files (
+    id TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    exam_tag TEXT,
+    uploaded_by TEXT,
+    uploaded_at TEXT NOT NULL,
+    total_students INTEGER NOT NULL,
+    summary TEXT,
+    aggregates TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_result_files_uploaded_at ON result_files(uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_result_files_exam_tag ON result_files(exam_tag);
+CREATE TABLE IF NOT EXISTS students (
+    file_id TEXT NOT NULL REFERENCES result_files(id) ON DELETE CASCADE,
+    slot INTEGER NOT NULL,
+    seat_no TEXT,
+    name TEXT,
+    mother_name TEXT,
+    prn TEXT,
+    sgpa REAL,
+    sgpa_raw TEXT,
+    credits INTEGER,
+    passed_subjects INTEGER,
+    total_subjects INTEGER,
+    result_status TEXT,
+    has_valid_sgpa INTEGER,
+    prn_key TEXT,
+    PRIMARY KEY (file_id, slot)
+);
+CREATE TABLE IF NOT EXISTS subject_grades (
+    file_id TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    course_code TEXT,
+    course_name TEXT,
+    grade TEXT,
+    PRIMARY KEY (file_id, slot, position),
+    FOREIGN KEY (file_id, slot) REFERENCES students(file_id, slot) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_subject_grades_course ON subject_grades(course_code);
+CREATE TABLE IF NOT EXISTS exam_aggregates (
+    exam_key TEXT PRIMARY KEY,
+    exam_tag TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exam_ranks (
+    exam_key TEXT PRIMARY KEY,
+    exam_tag TEXT,
+    data TEXT NOT NULL
+);
+"""
+
+# students table column -> students_data key
+SQLITE_STUDENT_COLUMNS = [
+    ('seat_no', 'Seat No'), ('name', 'Name'), ('mother_name', 'Mother Name'), ('prn', 'PRN'),
+    ('sgpa', 'SGPA'), ('sgpa_raw', 'SGPA_Raw'), ('credits', 'Credits'), ('passed_subjects', 'Passed Subjects'),
+    ('total_subjects', 'Total Subjects'), ('result_status', 'Result Status'), ('has_valid_sgpa', 'Has Valid SGPA')
+]
+
+class SQLiteDatabase:
+    """An open SQLite database with the schema applied: one connection and the lock that guards it."""
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA foreign_keys=ON")
+            self.conn.executescript(SQLITE_SCHEMA)
+            # Databases created before aggregates were stored lack the column
+            if 'aggregates' not in {row['name'] for row in self.conn.execute("PRAGMA table_info(result_files)")}:
+                self.conn.execute("ALTER TABLE result_files ADD COLUMN aggregates TEXT")
+            # ... and prn_key (prn_key(PRN), which SQL cannot compute, so it is filled in here)
+            if 'prn_key' not in {row['name'] for row in self.conn.execute("PRAGMA table_info(students)")}:
+                self.conn.execute("ALTER TABLE students ADD COLUMN prn_key TEXT")
+                rows = self.conn.execute("SELECT file_id, slot, prn FROM students").fetchall()
+                self.conn.executemany("UPDATE students SET prn_key = ? WHERE file_id = ? AND slot = ?",
+                                      [(prn_key(row['prn']), row['file_id'], row['slot']) for row in rows])
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_students_prn_key ON students(prn_key)")
+            self.conn.execute("DROP INDEX IF EXISTS idx_students_prn")
+
+class SQLiteResultStore(ResultStore):
+    """Embedded SQLite storage for offline use and load testing.
+
+    Accounts are local: passwords are stored as salted PBKDF2 hashes. Each session gets its
+    own store (token, snapshot); pass a shared SQLiteDatabase to use one connection, behind
+    its lock, for all of them.
+    """
+    def __init__(self, path: str = SQLITE_PATH, database: Optional[SQLiteDatabase] = None, id_token: Optional[str] = None,
+                 snapshot: Optional["UploadSnapshot"] = None):
+        self.database = database or SQLiteDatabase(path)
+        self.path = self.database.path
+        self._lock, self._conn = self.database.lock, self.database.conn
+        self.id_token = id_token
+        self.snapshot = snapshot
+
+    def detached(self, id_token: Optional[str]) -> "SQLiteResultStore":
+        return SQLiteResultStore(self.path, self.database, id_token, self.snapshot)
+
+    def _query(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _hash_password(self, password: str, salt: str) -> str:
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), 200_000).hex()
+
+    def _new_session(self, uid: str) -> Dict:
+        # The token only marks the Streamlit session as signed in; nothing leaves this process
+        return {'idToken': os.urandom(24).hex(), 'localId': uid}
+
+    def sign_in(self, email: str, password: str):
+        rows = self._query("SELECT uid, password_hash, salt FROM users WHERE email = ?", (email.strip().lower(),))
+        if not rows or self._hash_password(password, rows[0]['salt']) != rows[0]['password_hash']:
+            return False, "INVALID_LOGIN_CREDENTIALS"
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE users SET last_login = ? WHERE uid = ?",
+                               (datetime.datetime.now(datetime.timezone.utc).isoformat(), rows[0]['uid']))
+        return True, self._new_session(rows[0]['uid'])
+
+    def sign_up(self, email: str, password: str, name: str):
+        uid = os.urandom(14).hex()
+        salt = os.urandom(16).hex()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("INSERT INTO users (uid, email, password_hash, salt, name) VALUES (?, ?, ?, ?, ?)",
+                                   (uid, email.strip().lower(), self._hash_password(password, salt), salt, name))
+        except sqlite3.IntegrityError:
+            return False, "EMAIL_EXISTS"
+        return True, self._new_session(uid)
+
+    def get_user_profile(self, uid: str):
+        rows = self._query("SELECT email, role, name, uid AS user_id FROM users WHERE uid = ?", (uid,))
+        return dict(rows[0]) if rows else None
+
+    def save_user_profile(self, uid: str, profile: Dict) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("UPDATE users SET role = ?, name = ?, created_at = COALESCE(created_at, ?) WHERE uid = ?",
+                                        (profile.get('role'), profile.get('name'), _iso(profile.get('created_at')), uid))
+        return cursor.rowcount == 1
+
+    def save_upload(self, doc_id: str, header: Dict, students_data: List[Dict], progress_callback=None,
+                    warnings: Optional[List[str]] = None) -> bool:
+        student_rows = [(doc_id, slot, prn_key(student.get('PRN')), *[student.get(key) for _, key in SQLITE_STUDENT_COLUMNS])
+                        for slot, student in enumerate(students_data)]
+        subject_rows = [(doc_id, slot, pos, sub.get('Course Code'), sub.get('Course Name'), sub.get('Grade'))
+                        for slot, student in enumerate(students_data) for pos, sub in enumerate(student.get('Subjects', []))]
+        columns = ", ".join(column for column, _ in SQLITE_STUDENT_COLUMNS)
+        placeholders = ", ".join("?" * (len(SQLITE_STUDENT_COLUMNS) + 3))
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO result_files (id, file_name, exam_tag, uploaded_by, uploaded_at, total_students, summary, aggregates) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (doc_id, header['file_name'], header.get('exam_tag'), header.get('uploaded_by'), _iso(header['uploaded_at']),
+                     header['total_students'], json.dumps(header.get('summary', {})),
+                     json.dumps(header['aggregates']) if header.get('aggregates') else None))
+                self._conn.executemany(f"INSERT OR REPLACE INTO students (file_id, slot, prn_key, {columns}) VALUES ({placeholders})", student_rows)
+                self._conn.executemany("INSERT OR REPLACE INTO subject_grades VALUES (?, ?, ?, ?, ?, ?)", subject_rows)
+                if header.get('aggregates'):
+                    # Same transaction as the upload, so the rollup can never miss or double-count it
+                    exam_key = exam_tag_key(header.get('exam_tag'))
+                    row = self._conn.execute("SELECT data FROM exam_aggregates WHERE exam_key = ?", (exam_key,)).fetchone()
+                    merged = merge_exam_aggregate(json.loads(row['data']) if row else None, doc_id, header.get('exam_tag'), header['aggregates'])
+                    if merged is not None:
+                        self._conn.execute("INSERT OR REPLACE INTO exam_aggregates VALUES (?, ?, ?)",
+                                           (exam_key, merged['exam_tag'], json.dumps(merged)))
+                self._fold_exam_ranks(doc_id, header.get('exam_tag'), exam_rank_entries(doc_id, students_data))
+            # One transaction, so there is nothing to report until it has committed
+            if progress_callback: progress_callback(len(students_data), len(students_data))
+            return True
+        except sqlite3.Error as e:
+            raise SaveError(f"DB Error: {e}") from e
+
+    def _header_from_row(self, row) -> Dict:
+        return {
+            'id': row['id'], 'file_name': row['file_name'], 'exam_tag': row['exam_tag'], 'uploaded_by': row['uploaded_by'],
+            'uploaded_at': datetime.datetime.fromisoformat(row['uploaded_at']), 'total_students': row['total_students'],
+            'summary': json.loads(row['summary'] or '{}'), 'update_time': row['uploaded_at'],
+            **({'aggregates': json.loads(row['aggregates'])} if row['aggregates'] else {})
+        }
+
+    def _students_from_rows(self, file_id: str, rows) -> List[Dict]:
+        """Rebuild students_data dicts (with Subjects) for rows of one upload."""
+        slots = [row['slot'] for row in rows]
+        subjects = defaultdict(list)
+        if slots:
+            placeholders = ", ".join("?" * len(slots))
+            for sub in self._query(f"SELECT slot, course_code, course_name, grade FROM subject_grades WHERE file_id = ? AND slot IN ({placeholders}) ORDER BY slot, position",
+                                   (file_id, *slots)):
+                subjects[sub['slot']].append({'Course Code': sub['course_code'], 'Course Name': sub['course_name'], 'Grade': sub['grade']})
+        students = []
+        for row in rows:
+            student = {key: row[column] for column, key in SQLITE_STUDENT_COLUMNS}
+            student['Has Valid SGPA'] = bool(student['Has Valid SGPA'])
+            student['Subjects'] = subjects[row['slot']]
+            students.append(student)
+        return students
+
+    def list_uploads(self, page_size: int = SAVED_RESULTS_PAGE_SIZE, page_token: Optional[str] = None, metadata_only: bool = True):
+        offset = int(page_token or 0)
+        rows = self._query("SELECT * FROM result_files ORDER BY uploaded_at DESC LIMIT ? OFFSET ?", (page_size + 1, offset))
+        files = [self._header_from_row(row) for row in rows[:page_size]]
+        if not metadata_only:
+            for file_data in files: file_data['students_data'] = self._load_students(file_data['id'])
+        return files, (str(offset + page_size) if len(rows) > page_size else None)
+
+    def get_all_uploads(self) -> List[Dict]:
+        files = [self._header_from_row(row) for row in self._query("SELECT * FROM result_files ORDER BY uploaded_at DESC")]
+        for file_data in files: file_data['students_data'] = self._load_students(file_data['id'])
+        return files
+
+    def uploads_since(self, since: Optional[datetime.datetime] = None) -> List[Dict]:
+        if since is None:
+            rows = self._query("SELECT * FROM result_files ORDER BY uploaded_at")
+        else:
+            rows = self._query("SELECT * FROM result_files WHERE uploaded_at > ? ORDER BY uploaded_at", (_iso(since),))
+        return [self._header_from_row(row) for row in rows]
+
+    def _load_students(self, file_id: str) -> List[Dict]:
+        return self._students_from_rows(file_id, self._query("SELECT * FROM students WHERE file_id = ? ORDER BY slot", (file_id,)))
+
+    def get_upload_header(self, doc_id: str):
+        rows = self._query("SELECT * FROM result_files WHERE id = ?", (doc_id,))
+        return self._header_from_row(rows[0]) if rows else None
+
+    def get_upload(self, doc_id: str, update_time: Optional[str] = None):
+        file_data = self.get_upload_header(doc_id)
+        if file_data: file_data['students_data'] = self._load_students(doc_id)
+        return file_data
+
+    def get_students(self, doc_id: str, slots: List[int]) -> List[Dict]:
+        if not slots: return []
+        placeholders = ", ".join("?" * len(slots))
+        rows = self._query(f"SELECT * FROM students WHERE file_id = ? AND slot IN ({placeholders}) ORDER BY slot", (doc_id, *slots))
+        return self._students_from_rows(doc_id, rows)
+
+    def get_exam_aggregate(self, exam_tag):
+        rows = self._query("SELECT data FROM exam_aggregates WHERE exam_key = ?", (exam_tag_key(exam_tag),))
+        return json.loads(rows[0]['data']) if rows else None
+
+    def get_exam_ranks(self, exam_tag):
+        rows = self._query("SELECT data FROM exam_ranks WHERE exam_key = ?", (exam_tag_key(exam_tag),))
+        return json.loads(rows[0]['data']) if rows else None
+
+    def fold_exam_ranks(self, doc_id: str, exam_tag, entries: Dict, newest: bool = True) -> bool:
+        try:
+            with self._lock, self._conn:
+                self._fold_exam_ranks(doc_id, exam_tag, entries, newest)
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _fold_exam_ranks(self, doc_id: str, exam_tag, entries: Dict, newest: bool = True):
+        """Read-modify-write of the exam's rank table; the caller holds the lock and transaction."""
+        exam_key = exam_tag_key(exam_tag)
+        row = self._conn.execute("SELECT data FROM exam_ranks WHERE exam_key = ?", (exam_key,)).fetchone()
+        merged = merge_exam_ranks(json.loads(row['data']) if row else None, doc_id, exam_tag, entries, newest)
+        if merged is not None:
+            self._conn.execute("INSERT OR REPLACE INTO exam_ranks VALUES (?, ?, ?)", (exam_key, merged['exam_tag'], json.dumps(merged)))
+
+    def list_exam_aggregates(self) -> List[Dict]:
+        rows = self._query("SELECT exam_tag, json_extract(data, '$.total_students') AS total_students, "
+                           "json_extract(data, '$.file_ids') AS file_ids FROM exam_aggregates ORDER BY exam_tag")
+        return [{'exam_tag': row['exam_tag'], 'total_students': row['total_students'], 'file_ids': json.loads(row['file_ids'])} for row in rows]
+
+    def name_directory(self):
+        # Latest upload wins when a PRN appears under slightly different names
+        rows = self._query("""
+            SELECT trim(s.prn) AS prn, s.name, s.mother_name FROM students s JOIN result_files f ON f.id = s.file_id
+            ORDER BY f.uploaded_at""")
+        return [(row['prn'], row['name'], row['mother_name']) for row in rows]
+
+    def grade_facts(self, file_ids: Optional[List[str]] = None) -> Dict[str, list]:
+        if file_ids is None:
+            rows = self._query("""
+                SELECT g.course_code, g.course_name, trim(s.prn), COALESCE(f.exam_tag, f.file_name), g.grade
+                FROM subject_grades g
+                JOIN students s ON s.file_id = g.file_id AND s.slot = g.slot
+                JOIN result_files f ON f.id = g.file_id
+                ORDER BY f.uploaded_at, g.file_id, g.slot, g.position""")
+        else:
+            # json_each keeps the id list to one bound parameter and supplies the requested order
+            rows = self._query("""
+                SELECT g.course_code, g.course_name, trim(s.prn), COALESCE(f.exam_tag, f.file_name), g.grade
+                FROM json_each(?) ids
+                JOIN subject_grades g ON g.file_id = ids.value
+                JOIN students s ON s.file_id = g.file_id AND s.slot = g.slot
+                JOIN result_files f ON f.id = g.file_id
+                ORDER BY ids.key, g.slot, g.position""", (json.dumps(list(file_ids)),))
+        columns = list(zip(*rows)) or [()] * len(GRADE_FACT_COLUMNS)
+        return {key: [value or '' for value in column] for key, column in zip(GRADE_FACT_COLUMNS, columns)}
+
+    def student_facts(self, file_ids: Optional[List[str]] = None) -> Dict[str, list]:
+        select = """SELECT trim(s.prn), s.name, COALESCE(f.exam_tag, f.file_name),
+                           CASE WHEN s.has_valid_sgpa THEN s.sgpa END, s.result_status = 'Pass'"""
+        if file_ids is None:
+            rows = self._query(select + """
+                FROM students s JOIN result_files f ON f.id = s.file_id
+                ORDER BY f.uploaded_at, s.file_id, s.slot""")
+        else:
+            rows = self._query(select + """
+                FROM json_each(?) ids
+                JOIN students s ON s.file_id = ids.value
+                JOIN result_files f ON f.id = s.file_id
+                ORDER BY ids.key, s.slot""", (json.dumps(list(file_ids)),))
+        prns, names, exams, sgpas, passed = list(zip(*rows)) or [()] * len(STUDENT_FACT_COLUMNS)
+        return {'prn': [p or '' for p in prns], 'name': [n or '' for n in names], 'exam_tag': [e or '' for e in exams],
+                'sgpa': list(sgpas), 'passed': [bool(v) for v in passed]}
+
+    def _records(self, rows):
+        headers, records = {}, []
+        for row in rows:
+            file_id = row['file_id']
+            if file_id not in headers: headers[file_id] = self.get_upload_header(file_id)
+            records.extend((headers[file_id], student) for student in self._students_from_rows(file_id, [row]))
+        return records
+
+    def find_by_prn(self, prn: str):
+        rows = self._query("SELECT * FROM students WHERE prn_key = ? ORDER BY file_id, slot", (prn_key(prn) or None,))
+        return self._records(rows)
+
+    def search_students(self, search_term: str):
+        like = "%" + search_term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rows = self._query("SELECT * FROM students WHERE lower(name) LIKE ? ESCAPE '\\' OR prn_key = ? ORDER BY file_id, slot",
+                           (like, prn_key(search_term) or None))
+        return self._records(rows)
+
+
+def _iso(value) -> Optional[str]:
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None: value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.isoformat()
+    return value
+
+def prn_key(prn) -> str:
+    """Canonical PRN for index lookups, or '' if the value does not look like a PRN."""
+    prn = str(prn or '').strip().upper()
+    return prn if PRN_PATTERN.match(prn) else ''
+
+def exam_tag_key(exam_tag) -> str:
+    """Document id of an exam's rollup: 'SE May 2024' -> 'SE_MAY_2024'."""
+    return re.sub(r'[^A-Z0-9]+', '_', str(exam_tag or '').strip().upper()).strip('_') or 'UNTAGGED'
+
+def merge_exam_aggregate(rollup: Optional[Dict], file_id: str, exam_tag, aggregates: Dict, top_n: int = AGGREGATE_TOP_N) -> Optional[Dict]:
+    """Fold one upload's aggregates into its exam rollup.
+
+    Returns the new rollup, or None if file_id is already part of it.
+    """
+    rollup = rollup or {}
+    if file_id in rollup.get('file_ids', []): return None
+    merged = {'exam_tag': rollup.get('exam_tag') or exam_tag, 'file_ids': [*rollup.get('file_ids', []), file_id]}
+    for key in ('total_students', 'passed_students', 'failed_students', 'valid_sgpa_count', 'sgpa_sum'):
+        merged[key] = rollup.get(key, 0) + aggregates.get(key, 0)
+    empty = [0] * SGPA_HISTOGRAM_BINS
+    merged['sgpa_histogram'] = [a + b for a, b in zip(rollup.get('sgpa_histogram') or empty, aggregates.get('sgpa_histogram') or empty)]
+    subjects = {code: {'name': entry.get('name', ''), 'grades': dict(entry.get('grades', {}))}
+                for code, entry in rollup.get('subject_grades', {}).items()}
+    for code, entry in aggregates.get('subject_grades', {}).items():
+        target = subjects.setdefault(code, {'name': entry.get('name', ''), 'grades': {}})
+        for grade, count in entry.get('grades', {}).items():
+            target['grades'][grade] = target['grades'].get(grade, 0) + count
+    merged['subject_grades'] = subjects
+    # Stable sort: on equal SGPA, students already in the rollup stay ahead
+    candidates = rollup.get('top_students', []) + [{**s, 'file_id': file_id} for s in aggregates.get('top_students', [])]
+    merged['top_students'] = sorted(candidates, key=lambda s: -(s.get('SGPA') or 0))[:top_n]
+    return merged
+
+def exam_rank_entries(file_id: str, students_data: List[Dict]) -> Dict[str, Optional[float]]:
+    """One upload's contribution to its exam's rank table: student key -> SGPA, None for a fail.
+
+    Students are keyed on prn_key(PRN); one without a usable PRN is keyed on its slot so it
+    still counts, but is never taken for someone else.
+    """
+    entries = {}
+    for slot, student in enumerate(students_data):
+        passed = student.get('Has Valid SGPA') and student.get('Result Status') == 'Pass'
+        entries[prn_key(student.get('PRN')) or f"{file_id}#{slot}"] = round(float(student['SGPA']), 2) if passed else None
+    return entries
+
+def merge_exam_ranks(table: Optional[Dict], file_id: str, exam_tag, entries: Dict, newest: bool = True) -> Optional[Dict]:
+    """Fold one upload's rank entries into its exam's rank table (see ExamRanks).
+
+    A student already in the table takes the newest upload's result, so a revaluation sheet
+    replaces rather than duplicates; pass newest=False for an upload older than the ones
+    already folded. Returns the new table, or None if file_id is already part of it.
+    """
+    table = table or {}
+    if file_id in table.get('file_ids', []): return None
+    current = table.get('sgpa', {})
+    return {'exam_tag': table.get('exam_tag') or exam_tag, 'file_ids': [*table.get('file_ids', []), file_id],
+            'sgpa': {**current, **entries} if newest else {**entries, **current}}
+
+def aggregate_summary(aggregates: Dict) -> Dict:
+    """get_result_summary() equivalent computed from stored aggregates."""
+    total = aggregates.get('total_students', 0)
+    if not total: return {}
+    passed = aggregates.get('passed_students', 0)
+    valid = aggregates.get('valid_sgpa_count', 0)
+    return {
+        'total_students': total, 'passed_students': passed,
+        'failed_students': aggregates.get('failed_students', total - passed),
+        'average_sgpa': round(aggregates.get('sgpa_sum', 0) / valid, 2) if valid else 0,
+        'pass_percentage': round(passed / total * 100, 1)
+    }
+
+def _normalize_name(name) -> str:
+    return " ".join(str(name or '').lower().split())
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class NameIndex:
+    """In-memory student name search over the distinct words of all names, one entry per PRN.
+
+    Every query word is expanded against the word vocabulary: exact word, word prefix
+    (bisect on the sorted vocabulary), infix (trigram postings of words), and, only if none
+    of those match, typo-tolerant words sharing enough trigrams. A name matches when each
+    query word matches one of its words; its score is the sum of the tiers, so an exact name
+    ranks ahead of prefixes, infixes and fuzzy matches. Candidates are drawn from the query
+    word with the fewest postings and collection stops early once enough are found.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.built_at = None
+        self.synced = None  # (snapshot generation, uploads folded in) under delta sync
+    
+    def _reset(self):
+        self._labels, self._names, self._words = [], [], []  # per doc
+        self._by_prn = {}
+        self._word_docs = defaultdict(set)
+        self._vocab = []  # sorted distinct words
+        self._word_grams = defaultdict(set)  # trigram of " word " -> words
+    
+    def __len__(self):
+        return len(self._labels)
+    
+    def stale(self, ttl_seconds: float = NAME_INDEX_TTL_SECONDS) -> bool:
+        return self.built_at is None or time.monotonic() - self.built_at > ttl_seconds
+    
+    def rebuild(self, entries):
+        entries = list(entries)
+        with self._lock:
+            self._reset()
+            for prn, name, mother in entries: self._add(prn, name, mother, bulk=True)
+            self._vocab = sorted(self._word_docs)
+            self.built_at = time.monotonic()
+    
+    def add_many(self, entries):
+        entries = list(entries)
+        with self._lock:
+            for prn, name, mother in entries: self._add(prn, name, mother)
+    
+    def _add(self, prn, name, mother, bulk: bool = False):
+        prn = prn_key(prn)
+        normalized = _normalize_name(name)
+        if not prn or not normalized: return
+        doc = self._by_prn.get(prn)
+        if doc is None:
+            doc = self._by_prn[prn] = len(self._labels)
+            self._labels.append(None)
+            self._names.append('')
+            self._words.append(())
+        elif self._names[doc] == normalized:
+            return
+        else:
+            # Renamed in a later upload: index the new name only
+            for word in self._words[doc]: self._word_docs[word].discard(doc)
+        words = tuple(dict.fromkeys(normalized.split()))
+        self._labels[doc] = {'prn': prn, 'name': str(name).strip(), 'mother': mother}
+        self._names[doc] = normalized
+        self._words[doc] = words
+        for word in words:
+            if word not in self._word_docs:
+                for gram in _trigrams(f" {word} "): self._word_grams[gram].add(word)
+                if not bulk: bisect.insort(self._vocab, word)
+            self._word_docs[word].add(doc)
+    
+    def search(self, term: str, limit: int = NAME_SEARCH_LIMIT, fuzzy: bool = True) -> List[Dict]:
+        """Ranked {'prn', 'name', 'mother', 'score'} matches; lower score ranks first."""
+        query = _normalize_name(term)
+        if not query: return []
+        tokens = list(dict.fromkeys(query.split()))
+        with self._lock:
+            expansions = [self._expand(token, fuzzy) for token in tokens]
+            if not all(expansions): return []
+            sizes = [sum(len(self._word_docs[w]) for w in e) for e in expansions]
+            lead = min(range(len(tokens)), key=sizes.__getitem__)
+            others = expansions[:lead] + expansions[lead + 1:]
+            # Docs matching every other query word, intersected at C speed before any scoring
+            required = [self._word_docs[next(iter(e))] if len(e) == 1 else set().union(*(self._word_docs[w] for w in e))
+                        for e in others]
+            # With other words to score, take a wider pool so their tiers still affect the order
+            enough = limit * 8 if others else limit
+            found = {}
+            for word, tier in sorted(expansions[lead].items(), key=lambda item: (item[1], item[0])):
+                for doc in (self._word_docs[word].intersection(*required) if required else self._word_docs[word]):
+                    if doc in found: continue
+                    found[doc] = tier + sum(min(e[w] for w in self._words[doc] if w in e) for e in others)
+                    if len(found) >= enough: break
+                if len(found) >= enough: break
+            ranked = sorted(found.items(), key=lambda item: (self._name_rank(query, item[0]), item[1], self._names[item[0]]))
+            return [{**self._labels[doc], 'score': round(score, 3)} for doc, score in ranked[:limit]]
+    
+    def _name_rank(self, query: str, doc: int) -> int:
+        name = self._names[doc]
+        return 0 if name == query else 1 if name.startswith(query) else 2
+    
+    def _expand(self, token: str, fuzzy: bool) -> Dict[str, float]:
+        """Vocabulary words a query word may stand for, with their tier."""
+        expansions = {}
+        for i in range(bisect.bisect_left(self._vocab, token), len(self._vocab)):
+            word = self._vocab[i]
+            if not word.startswith(token): break
+            if self._word_docs[word]: expansions[word] = 0 if word == token else 1
+        if len(token) >= 3:
+            postings = sorted((self._word_grams.get(g, set()) for g in _trigrams(token)), key=len)
+            words = set(postings[0]).intersection(*postings[1:]) if postings else set()
+            for word in words:
+                if token in word and self._word_docs[word]: expansions.setdefault(word, 2)
+        if fuzzy and not expansions and len(token) >= 3:
+            grams = _trigrams(f" {token} ")
+            shared = Counter()
+            for gram in grams: shared.update(self._word_grams.get(gram, ()))
+            for word, common in shared.items():
+                similarity = 2 * common / (len(grams) + len(word))  # Dice; " word " has len(word) trigrams
+                if similarity >= NAME_FUZZY_MIN_SIMILARITY and self._word_docs[word]:
+                    expansions[word] = 4 - similarity
+        return expansions
+
+@st.cache_resource
+def get_name_index() -> NameIndex:
+    # One index per server process, shared by all sessions
+    return NameIndex()
+
+class UploadSnapshot:
+    """Local copy of every upload header, kept current by delta sync on uploaded_at.
+
+    Uploads are append-only, so after one full read each sync only asks the store for
+    headers with uploaded_at past the watermark (less RESULT_SYNC_OVERLAP_SECONDS). New
+    headers are appended to `headers` in the order they arrive; indexes built from the
+    snapshot remember (generation, count) and fold in just the tail. A full re-read every
+    RESULT_SYNC_FULL_SECONDS picks up edits or deletions made outside the app and bumps the
+    generation, which tells those indexes to rebuild.
+    """
+    def __init__(self, interval_seconds: float = RESULT_SYNC_INTERVAL_SECONDS, full_seconds: float = RESULT_SYNC_FULL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.full_seconds = full_seconds
+        self.headers = []
+        self.generation = 0
+        self.watermark = None
+        self._positions = {}  # id -> index in headers
+        self._newest_first = None
+        self._synced_at = None
+        self._full_at = None
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.headers)
+    
+    def expire(self):
+        """Make the next sync query the store even inside the interval (e.g. after a save)."""
+        self._synced_at = None
+    
+    def sync(self, store: "ResultStore") -> int:
+        """Fetch headers newer than the watermark and append them; returns how many were new."""
+        with self._lock:
+            now = time.monotonic()
+            if self._synced_at is not None and now - self._synced_at < self.interval_seconds: return 0
+            full = self._full_at is None or now - self._full_at > self.full_seconds
+            since = None if full or self.watermark is None else self.watermark - datetime.timedelta(seconds=RESULT_SYNC_OVERLAP_SECONDS)
+            with perf_span("upload sync", full=full) as span:
+                fetched = store.uploads_since(since)
+                if span is not None: span['docs'] = len(fetched or ())
+            if fetched is None: return 0  # keep serving the last good snapshot
+            if full:
+                self.headers, self._positions, self.watermark = [], {}, None
+                self.generation += 1
+                self._full_at = now
+            added = 0
+            for header in fetched:
+                if not self._merge(header): continue
+                added += 1
+                uploaded_at = _as_utc(header.get('uploaded_at'))
+                if uploaded_at and (self.watermark is None or uploaded_at > self.watermark): self.watermark = uploaded_at
+            if added or full: self._newest_first = None
+            self._synced_at = now
+            return added
+    
+    def add(self, header: Dict):
+        """Fold in a header this process has just saved.
+
+        A retried save keeps the uploaded_at it was queued with, which can be older than the
+        watermark and so invisible to delta syncs. The watermark is left alone: the next sync
+        still asks from where it was and finds this header again as a repeat.
+        """
+        with self._lock:
+            if self._full_at is None: return  # the first full sync will read it
+            if self._merge(header): self._newest_first = None
+            self._synced_at = None
+    
+    def _merge(self, header: Dict) -> bool:
+        """Replace the header with the same id or append it; True if it was new."""
+        position = self._positions.get(header['id'])
+        if position is not None:
+            self.headers[position] = header
+            self._newest_first = None
+            return False
+        self._positions[header['id']] = len(self.headers)
+        self.headers.append(header)
+        return True
+    
+    def view(self):
+        """(generation, headers) as of now; the list is a copy."""
+        with self._lock:
+            return self.generation, list(self.headers)
+    
+    def newest_first(self) -> List[Dict]:
+        with self._lock:
+            if self._newest_first is None:
+                self._newest_first = sorted(self.headers, key=lambda h: _iso(_as_utc(h.get('uploaded_at'))) or '', reverse=True)
+            return self._newest_first
+
+def _as_utc(value) -> Optional[datetime.datetime]:
+    if not isinstance(value, datetime.datetime): return None
+    return value.replace(tzinfo=datetime.timezone.utc) if value.tzinfo is None else value.astimezone(datetime.timezone.utc)
+
+@st.cache_resource
+def get_upload_snapshot(source: str) -> UploadSnapshot:
+    # One snapshot per data source per server process, shared by all sessions
+    return UploadSnapshot()
+
+@st.cache_resource
+def get_sqlite_database(path: str) -> SQLiteDatabase:
+    return SQLiteDatabase(path)
+
+def result_store_source() -> str:
+    """Identifies the configured data source, for process-wide state kept per source."""
+    return f"sqlite:{SQLITE_PATH}" if RESULT_STORE_BACKEND == "sqlite" else FIREBASE_REST_URL
+
+def make_result_store(transport: Optional[HttpTransport] = None, id_token: Optional[str] = None) -> ResultStore:
+    snapshot = get_upload_snapshot(result_store_source()) if RESULT_SYNC_MODE == "delta" else None
+    if RESULT_STORE_BACKEND == "sqlite":
+        return SQLiteResultStore(SQLITE_PATH, get_sqlite_database(SQLITE_PATH), id_token, snapshot)
+    return FirestoreResultStore(transport or get_http_transport(), get_result_cache(), id_token, snapshot)
+
+@st.cache_resource(show_spinner=False, ttl=CONNECTION_CHECK_TTL_SECONDS)
+def check_store_connection(source: str, _store: ResultStore) -> bool:
+    # Per process and source, not per rerun; reruns never wait on the round trip
+    return _store.check_connection()
+
+def _after_upload_saved(store: ResultStore, doc_id: str, students_data: List[Dict]):
+    """Make a finished save visible: put its header in the snapshot and its names in a built index."""
+    if store.snapshot is not None:
+        header = store.get_upload_header(doc_id)
+        if header: store.snapshot.add(header)
+        else: store.snapshot.expire()
+    index = get_name_index()
+    if not index.stale():
+        index.add_many((s.get('PRN'), s.get('Name'), s.get('Mother Name')) for s in students_data)
+
+def _job_json_default(value):
+    if isinstance(value, datetime.datetime): return {"$datetime": value.isoformat()}
+    if isinstance(value, numbers.Integral): return int(value)
+    if isinstance(value, numbers.Real): return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _job_json_hook(obj):
+    return datetime.datetime.fromisoformat(obj["$datetime"]) if obj.keys() == {"$datetime"} else obj
+
+class SaveJobQueue:
+    """Uploads saved in the background by a small thread pool, one job per doc_id.
+
+    A job is written to jobs_dir (gzipped JSON of owner uid, header and students) before it is
+    queued and removed once the save succeeds. Each job runs on its own detached store, so
+    it keeps the owner's token whatever the session does next. Jobs found there at start-up
+    wait as "pending" until their owner signs in and resume() is called with that owner's
+    store (tokens are not written to disk). Failed attempts are retried with the same
+    doc_id and header, which the stores treat as a re-write, so a retry never duplicates an
+    upload. After max_attempts the job is "failed" and stays on disk until retried or dismissed.
+    `jobs` holds only status dicts, changed under the lock and handed out as copies; students are
+    read back from disk when a job runs.
+    """
+    def __init__(self, jobs_dir: str = SAVE_JOBS_DIR, workers: int = SAVE_JOB_WORKERS,
+                 max_attempts: int = SAVE_JOB_MAX_ATTEMPTS, retry_seconds: float = SAVE_JOB_RETRY_SECONDS):
+        self.jobs_dir = jobs_dir
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="save-job")
+        os.makedirs(jobs_dir, exist_ok=True)
+        for name in sorted(os.listdir(jobs_dir), key=lambda n: os.path.getmtime(os.path.join(jobs_dir, n))):
+            if not name.endswith(".json.gz"): continue
+            try:
+                job = self._read(name[:-len(".json.gz")])
+            except (OSError, ValueError):
+                continue
+            self.jobs[job['doc_id']] = self._status(job['doc_id'], job['header'], "pending", job.get('owner'))
+    
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{doc_id}.json.gz")
+    
+    def _read(self, doc_id: str) -> Dict:
+        with gzip.open(self._path(doc_id), "rt", encoding="utf-8") as fh:
+            return json.load(fh, object_hook=_job_json_hook)
     
-    def _to_firestore_value(self, value):
-        if value is None: return {"nullValue": None}
-        elif isinstance(value, bool): return {"booleanValue": value}
-        elif isinstance(value, int): return {"integerValue": str(value)}
-        elif isinstance(value, float): return {"doubleValue": value}
-        elif isinstance(value, str): return {"stringValue": value}
-        elif isinstance(value, datetime.datetime): return {"timestampValue": value.isoformat() + "Z"}
-        elif isinstance(value, list): return {"arrayValue": {"values": [self._to_firestore_value(v) for v in value]}}
-        elif isinstance(value, dict): return {"mapValue": {"fields": {k: self._to_firestore_value(v) for k, v in value.items()}}}
-        else: return {"stringValue": str(value)}
+    def _status(self, doc_id: str, header: Dict, state: str, owner: Optional[str]) -> Dict:
+        return {'doc_id': doc_id, 'owner': owner, 'file_name': header.get('file_name'), 'exam_tag': header.get('exam_tag'),
+                'uploaded_by': header.get('uploaded_by'), 'total_students': header.get('total_students'),
+                'state': state, 'done': 0, 'total': 0, 'attempts': 0, 'error': None, 'warnings': []}
+    
+    def submit(self, doc_id: str, header: Dict, students_data: List[Dict], store: ResultStore, owner: str) -> Dict:
+        """Persist the job, then queue it on a detached copy of `store`. owner is the uid whose
+        session may see, retry and resume it. Returns a copy of its status; statuses() has the current one."""
+        tmp_path = f"{self._path(doc_id)}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+            json.dump({'doc_id': doc_id, 'owner': owner, 'header': header, 'students_data': students_data}, fh,
+                      default=_job_json_default)
+        os.replace(tmp_path, self._path(doc_id))
+        with self._lock:
+            status = self.jobs[doc_id] = self._status(doc_id, header, "queued", owner)
+            queued = dict(status)
+        self._pool.submit(self._run, doc_id, store.detached(store.id_token))
+        return queued
+    
+    def resume(self, store: ResultStore, owner: str, states=("pending",)) -> int:
+        """Queue owner's jobs in the given states on a detached copy of `store`, which must be
+        signed in as owner."""
+        with self._lock:
+            waiting = [status for status in self.jobs.values() if status['state'] in states and status['owner'] == owner]
+            for status in waiting: status.update(state="queued", error=None, attempts=0)
+        for status in waiting: self._pool.submit(self._run, status['doc_id'], store.detached(store.id_token))
+        return len(waiting)
+    
+    def retry(self, doc_id: str, store: ResultStore, owner: str):
+        with self._lock:
+            status = self.jobs.get(doc_id)
+            if status is None or status['state'] != "failed" or status['owner'] != owner: return
+            status['state'] = "pending"
+        self.resume(store, owner)
+    
+    def dismiss(self, doc_id: str):
+        """Forget a finished or failed job (a failed job's file is deleted with it)."""
+        with self._lock:
+            status = self.jobs.get(doc_id)
+            if status is None or status['state'] not in ("done", "failed"): return
+            del self.jobs[doc_id]
+        with contextlib.suppress(OSError): os.remove(self._path(doc_id))
+    
+    def statuses(self, owner: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            return [dict(s) for s in self.jobs.values() if owner is None or s['owner'] == owner]
+    
+    def _update(self, status: Dict, **changes):
+        # Workers change a status only under the lock, so statuses() and dismiss() see whole updates
+        with self._lock: status.update(changes)
+    
+    def _run(self, doc_id: str, store: ResultStore):
+        with self._lock: status = self.jobs[doc_id]
+        try:
+            job = self._read(doc_id)
+        except (OSError, ValueError) as e:
+            self._update(status, state="failed", error=f"Job file unreadable: {e}")
+            return
+        for attempt in range(self.max_attempts):
+            self._update(status, state="running", attempts=attempt + 1, done=0)
+            warnings = []
+            try:
+                ok = store.save_upload(doc_id, job['header'], job['students_data'],
+                                       progress_callback=lambda done, total: self._update(status, done=done, total=total), warnings=warnings)
+                error = None if ok else "Save failed"
+            except Exception as e:
+                ok, error = False, str(e) or type(e).__name__
+            if ok:
+                with contextlib.suppress(OSError): os.remove(self._path(doc_id))
+                _after_upload_saved(store, doc_id, job['students_data'])
+                self._update(status, state="done", error=None, warnings=warnings)
+                return
+            self._update(status, error=error)
+            if attempt < self.max_attempts - 1:
+                self._update(status, state="retrying")
+                time.sleep(self.retry_seconds * (2 ** attempt))
+        self._update(status, state="failed")
+
+@st.cache_resource
+def get_save_queue() -> SaveJobQueue:
+    # One queue per server process: jobs outlive the session (and browser tab) that started them
+    return SaveJobQueue()
+
+
+class FirebaseManager:
+    """Accounts and result storage for the UI, backed by the configured ResultStore."""
+    def __init__(self, transport: Optional[HttpTransport] = None, store: Optional[ResultStore] = None):
+        self.id_token = st.session_state.get('id_token')
+        self.user_id = st.session_state.get('user_id')
+        self.cache = get_result_cache()
+        self.store = store or make_result_store(transport, self.id_token)
+        self.store.id_token = self.id_token
+        self.initialize_firebase()
+
+    def initialize_firebase(self):
+        self.connected = check_store_connection(result_store_source(), self.store)
+
+    def bind_session(self):
+        """Pick up a sign-in or sign-out from the session; the manager itself outlives reruns."""
+        self.id_token = self.store.id_token = st.session_state.get('id_token')
+        self.user_id = st.session_state.get('user_id')
+
+    def hash_password(self, password: str) -> str:
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def _set_session_token(self, token, uid):
+        self.id_token = token
+        self.user_id = uid
+        self.store.id_token = token
+        st.session_state['id_token'] = token
+        st.session_state['user_id'] = uid
+
+    def sign_in_with_email_password(self, email: str, password: str):
+        success, result = self.store.sign_in(email, password)
+        if success: self._set_session_token(result.get('idToken'), result.get('localId'))
+        return success, result
+
+    def create_user_with_email_password(self, email: str, password: str, name: str):
+        success, result = self.store.sign_up(email, password, name)
+        if success: self._set_session_token(result.get('idToken'), result.get('localId'))
+        return success, result
 
     def create_user(self, email: str, password: str, role: str, name: str):
         success, result = self.create_user_with_email_password(email, password, name)
         if not success:
             st.error(f"❌ Auth Creation Failed: {result}")
             return None
-        
+
         user_id = result.get('localId')
-        user_data = {
-            "fields": {
-                "email": self._to_firestore_value(email),
-                "role": self._to_firestore_value(role.lower()),
-                "name": self._to_firestore_value(name),
-                "user_id": self._to_firestore_value(user_id),
-                "created_at": self._to_firestore_value(datetime.datetime.utcnow()),
-                "last_login": self._to_firestore_value(datetime.datetime.utcnow())
-            }
+        profile = {
+            "email": email,
+            "role": role.lower(),
+            "name": name,
+            "user_id": user_id,
+            "created_at": datetime.datetime.utcnow(),
+            "last_login": datetime.datetime.utcnow()
         }
-        
-        response = self.firestore_request("POST", f"users?documentId={user_id}", user_data)
-        if not response or 'error' in response:
-             response = self.firestore_request("PATCH", f"users/{user_id}", user_data)
-
-        if response:
+        if self.store.save_user_profile(user_id, profile):
             return user_id
         return None
-    
+
     def verify_user(self, email: str, password: str):
         success, result = self.sign_in_with_email_password(email, password)
         if not success: return False, f"Login failed: {result}"
-        
-        user_doc = self.firestore_request("GET", f"users/{self.user_id}")
-        if not user_doc: return False, "User profile not found."
-        
-        role = user_doc.get('fields', {}).get('role', {}).get('stringValue', '')
+
+        profile = self.store.get_user_profile(self.user_id)
+        if not profile: return False, "User profile not found."
+
+        role = profile.get('role') or ''
         if not role: return False, "User role missing."
 
         user_data = {
-            'email': user_doc.get('fields', {}).get('email', {}).get('stringValue', ''),
+            'email': profile.get('email', ''),
             'role': role,
-            'name': user_doc.get('fields', {}).get('name', {}).get('stringValue', ''),
+            'name': profile.get('name', ''),
             'uid': self.user_id
         }
         return True, user_data
 
-    def save_result_data(self, file_name: str, exam_tag: str, students_data: List[Dict], uploaded_by: str, summary: Dict):
-        if not self.id_token: return None
-        
-        batch_data = {
-            "fields": {
-                "file_name": self._to_firestore_value(file_name),
-                "exam_tag": self._to_firestore_value(exam_tag),
-                "uploaded_by": self._to_firestore_value(uploaded_by),
-                "uploaded_at": self._to_firestore_value(datetime.datetime.utcnow()),
-                "total_students": self._to_firestore_value(len(students_data)),
-                "students_data": self._to_firestore_value(students_data),
-                "summary": self._to_firestore_value(summary)
-            }
-        }
-        
+    def new_upload(self, file_name: str, exam_tag: str, students_data: List[Dict], uploaded_by: str, summary: Dict,
+                   aggregates: Optional[Dict] = None):
+        """(doc_id, header) for a new upload; saving them again later rewrites the same upload."""
         doc_id = f"result_{int(time.time())}_{hashlib.md5(file_name.encode()).hexdigest()[:10]}"
-        with st.spinner("Saving data to Cloud..."):
-            result = self.firestore_request("POST", f"result_files?documentId={doc_id}", batch_data)
-        
-        if result:
-            st.success("✅ Saved successfully!")
-            return doc_id
-        return None
+        return doc_id, {
+            "file_name": file_name,
+            "exam_tag": exam_tag,
+            "uploaded_by": uploaded_by,
+            "uploaded_at": datetime.datetime.utcnow(),
+            "total_students": len(students_data),
+            "summary": summary,
+            # Precomputed so overviews render from the header alone
+            "aggregates": aggregates or StudentTable(students_data).aggregates()
+        }
+
+    def save_result_data(self, file_name: str, exam_tag: str, students_data: List[Dict], uploaded_by: str, summary: Dict,
+                         aggregates: Optional[Dict] = None):
+        if not self.id_token: return None
+        doc_id, header = self.new_upload(file_name, exam_tag, students_data, uploaded_by, summary, aggregates)
+        warnings = []
+        try:
+            with st.spinner("Saving data to Cloud..."):
+                self.store.save_upload(doc_id, header, students_data, warnings=warnings)
+        except SaveError as e:
+            st.error(f"❌ Save failed: {e}. Please try again.")
+            return None
+        _after_upload_saved(self.store, doc_id, students_data)
+        for warning in warnings: st.warning(f"⚠️ {warning}")
+        st.success("✅ Saved successfully!")
+        return doc_id
+
+    def queue_result_data(self, file_name: str, exam_tag: str, students_data: List[Dict], uploaded_by: str, summary: Dict,
+                          aggregates: Optional[Dict] = None) -> Optional[Dict]:
+        """Save in the background; returns the queued job's status (a copy, see SaveJobQueue.statuses)."""
+        if not self.id_token: return None
+        doc_id, header = self.new_upload(file_name, exam_tag, students_data, uploaded_by, summary, aggregates)
+        return get_save_queue().submit(doc_id, header, students_data, self.store, self.user_id)
+
+    def list_result_files(self, page_size: int = SAVED_RESULTS_PAGE_SIZE, page_token: Optional[str] = None, metadata_only: bool = True):
+        if not self.id_token: return [], None
+        return self.store.list_uploads(page_size, page_token, metadata_only)
 
     def get_all_result_files(self):
         if not self.id_token: return []
-        result = self.firestore_request("GET", "result_files")
-        if not result or 'documents' not in result: return []
+        return self.store.get_all_uploads()
+
+    def get_result_file(self, doc_id: str, update_time: Optional[str] = None):
+        if not self.id_token: return None
+        return self.store.get_upload(doc_id, update_time)
+
+    def get_exam_aggregate(self, exam_tag):
+        if not self.id_token: return None
+        return self.store.get_exam_aggregate(exam_tag)
+
+    def list_exam_aggregates(self):
+        if not self.id_token: return []
+        return self.store.list_exam_aggregates()
+
+    def get_grade_facts(self):
+        """GradeFactTable over every upload, shared by all sessions until an upload changes."""
+        return self._fact_table("grade_facts", self.store.grade_facts, GradeFactTable)
+
+    def get_student_facts(self):
+        """StudentFactTable over every upload, cached like get_grade_facts."""
+        return self._fact_table("student_facts", self.store.student_facts, StudentFactTable)
+
+    def get_exam_ranks(self, exam_tags) -> Optional["ExamRanks"]:
+        """ExamRanks for just these exams, from their saved rank tables: one small read per exam."""
+        if not self.id_token: return None
+        tables = {}
+        for tag in dict.fromkeys(exam_tags):
+            table = self.store.get_exam_ranks(tag) if tag is not None else None
+            if table: tables[tag] = table
+        return ExamRanks(tables)
+
+    def backfill_exam_ranks(self) -> int:
+        """Fold uploads saved before rank tables existed into their exams' tables; returns how many.
+
+        Each such upload is read in full once, so this runs on the teacher dashboard (see
+        backfill_exam_ranks_once), never on a student lookup. Uploads are folded oldest first;
+        one older than those already in a table does not replace their students' results.
+        """
+        if not self.id_token: return 0
+        uploads = defaultdict(list)
+        for header in self._upload_headers():
+            uploads[exam_tag_key(header.get('exam_tag'))].append(header)
+        count = 0
+        for headers in uploads.values():
+            folded = set((self.store.get_exam_ranks(headers[0].get('exam_tag')) or {}).get('file_ids', []))
+            times = [_as_utc(h.get('uploaded_at')) for h in headers if h['id'] in folded]
+            latest = max((t for t in times if t is not None), default=None)
+            for header in headers:
+                if header['id'] in folded: continue
+                doc_id, uploaded_at = header['id'], _as_utc(header.get('uploaded_at'))
+                # Without a timestamp an upload cannot be placed, so it only fills in students not yet ranked
+                newest = uploaded_at is not None and (latest is None or uploaded_at >= latest)
+                entries = exam_rank_entries(doc_id, (self.store.get_upload(doc_id) or {}).get('students_data', []))
+                if self.store.fold_exam_ranks(doc_id, header.get('exam_tag'), entries, newest): count += 1
+                if newest: latest = uploaded_at
+        return count
+
+    def _upload_headers(self) -> List[Dict]:
+        """Every upload header, oldest first; from the snapshot when delta sync is on."""
+        snapshot = self.store.synced_uploads()
+        if snapshot is not None: return snapshot.newest_first()[::-1]
+        headers, page_token = [], None
+        while True:
+            files, page_token = self.store.list_uploads(300, page_token)
+            headers.extend(files)
+            if not page_token: return headers[::-1]
+
+    def _fact_table(self, cache_key: str, load, table_cls):
+        if not self.id_token: return None
+        snapshot = self.store.synced_uploads()
+        if snapshot is not None: return self._fact_table_from(snapshot, cache_key, load, table_cls)
+        fingerprint, page_token = hashlib.sha256(), None
+        while True:
+            files, page_token = self.store.list_uploads(300, page_token)
+            for f in files: fingerprint.update(f"{f['id']}@{f.get('update_time')};".encode())
+            if not page_token: break
+        version = fingerprint.hexdigest()
+        table = self.cache.get(cache_key, version)
+        if table is None:
+            table = table_cls(load())
+            self.cache.put(cache_key, table, table.nbytes, version)
+        return table
+
+    def _fact_table_from(self, snapshot: "UploadSnapshot", cache_key: str, load, table_cls):
+        """The cached table plus the uploads synced since it was built; a full build on a new generation."""
+        generation, headers = snapshot.view()
+        cached = self.cache.get(cache_key)
+        if cached is not None and cached[1] == generation and cached[2] == len(headers): return cached[0]
+        if cached is not None and cached[1] == generation and cached[2] < len(headers):
+            table = cached[0].appended(load([h['id'] for h in headers[cached[2]:]]))
+        else:
+            table = table_cls(load([h['id'] for h in headers]))
+        self.cache.put(cache_key, (table, generation, len(headers)), table.nbytes)
+        return table
+
+    def search_names(self, search_term: str, limit: int = NAME_SEARCH_LIMIT) -> List[Dict]:
+        """Ranked PRN candidates for a name (or name fragment), from the shared NameIndex."""
+        if not self.id_token: return []
+        index = get_name_index()
+        snapshot = self.store.synced_uploads()
+        if snapshot is None:
+            if index.stale():
+                with st.spinner("Indexing student names..."):
+                    index.rebuild(self.store.name_directory())
+            return index.search(search_term, limit)
         
-        files = []
-        for doc in result['documents']:
-            file_data = self._convert_from_firestore(doc)
-            file_data['id'] = doc['name'].split('/')[-1]
-            files.append(file_data)
-        return sorted(files, key=lambda x: x.get('uploaded_at', ''), reverse=True)
+        generation, headers = snapshot.view()
+        if index.synced is None or index.synced[0] != generation:
+            with st.spinner("Indexing student names..."):
+                index.rebuild(self.store.name_directory())
+        elif index.synced[1] < len(headers):
+            # Re-adding a name the rebuild already saw is a no-op, so overlap is harmless
+            for header in headers[index.synced[1]:]:
+                file_data = self.store.get_upload(header['id'], header.get('update_time')) or {}
+                index.add_many((s.get('PRN'), s.get('Name'), s.get('Mother Name')) for s in file_data.get('students_data', []))
+        index.synced = (generation, len(headers))
+        return index.search(search_term, limit)
 
     def get_student_history(self, search_term: str):
-        files = self.get_all_result_files()
-        student_history = {}
-        
+        if not self.id_token: return []
         search_term = search_term.lower().strip()
+        records = None
+        prn = prn_key(search_term)
+        if prn:
+            records = self.store.find_by_prn(prn)
+        if records is None and not prn:
+            matches = self.search_names(search_term)
+            if matches:
+                records = []
+                for match in matches:
+                    records.extend(self.store.find_by_prn(match['prn']) or [])
+        if records is None and RESULT_LEGACY_SCAN:
+            # Names the index does not know (or an index that could not be read); a PRN the index
+            # does not list is simply unknown
+            records = self.store.search_students(search_term)
+
+        student_history = {}
+        for file_data, student in records or ():
+            self._add_history_entry(student_history, file_data, student)
+        return self._finalize_history(student_history)
+
+    def _add_history_entry(self, student_history: Dict, file_data: Dict, student: Dict):
+        s_prn = student.get('PRN', '').strip()
+        if s_prn not in student_history:
+            student_history[s_prn] = {
+                'Name': student.get('Name'),
+                'PRN': s_prn,
+                'Mother': student.get('Mother Name'),
+                'Results': []
+            }
         
-        for file_data in files:
-            exam_tag = file_data.get('exam_tag', file_data.get('file_name', 'Unknown Exam'))
-            upload_date = file_data.get('uploaded_at')
-            
-            for student in file_data.get('students_data', []):
-                s_name = student.get('Name', '').lower()
-                s_prn = student.get('PRN', '').strip()
-                
-                if search_term in s_name or search_term == s_prn.lower():
-                    if s_prn not in student_history:
-                        student_history[s_prn] = {
-                            'Name': student.get('Name'),
-                            'PRN': s_prn,
-                            'Mother': student.get('Mother Name'),
-                            'Results': []
-                        }
-                    
-                    result_entry = {
-                        'Exam': exam_tag,
-                        'Date': upload_date,
-                        'SGPA': student.get('SGPA', 0),
-                        'Result': student.get('Result Status'),
-                        'Credits': student.get('Credits'),
-                        'Seat': student.get('Seat No'),
-                        'Subjects': student.get('Subjects', [])
-                    }
-                    student_history[s_prn]['Results'].append(result_entry)
-        
+        result_entry = {
+            'Exam': file_data.get('exam_tag', file_data.get('file_name', 'Unknown Exam')),
+            'Date': file_data.get('uploaded_at'),
+            'SGPA': student.get('SGPA', 0),
+            'Result': student.get('Result Status'),
+            'Credits': student.get('Credits'),
+            'Seat': student.get('Seat No'),
+            'Subjects': student.get('Subjects', [])
+        }
+        student_history[s_prn]['Results'].append(result_entry)
+
+    def _finalize_history(self, student_history: Dict) -> List[Dict]:
         for prn in student_history:
             student_history[prn]['Results'].sort(key=lambda x: x['Date'] if isinstance(x['Date'], datetime.datetime) else datetime.datetime.min)
-            
         return list(student_history.values())
 
-    def _convert_from_firestore(self, doc):
-        fields = doc.get('fields', {})
-        result = {}
-        for key, value in fields.items():
-            if 'stringValue' in value: result[key] = value['stringValue']
-            elif 'integerValue' in value: result[key] = int(value['integerValue'])
-            elif 'doubleValue' in value: result[key] = float(value['doubleValue'])
-            elif 'booleanValue' in value: result[key] = value['booleanValue']
-            elif 'timestampValue' in value:
-                try: result[key] = datetime.datetime.fromisoformat(value['timestampValue'].replace('Z', '+00:00'))
-                except: result[key] = value['timestampValue']
-            elif 'arrayValue' in value:
-                vals = value['arrayValue'].get('values', [])
-                result[key] = [self._convert_single_value(i) for i in vals]
-            elif 'mapValue' in value:
-                result[key] = self._convert_from_firestore({'fields': value['mapValue']['fields']})
-        return result
-
-    def _convert_single_value(self, value):
-        if 'stringValue' in value: return value['stringValue']
-        elif 'integerValue' in value: return int(value['integerValue'])
-        elif 'doubleValue' in value: return float(value['doubleValue'])
-        elif 'booleanValue' in value: return value['booleanValue']
-        elif 'mapValue' in value: return self._convert_from_firestore({'fields': value['mapValue']['fields']})
-        return None
-
 # -----------------------------------------------------------------------------
 # 3. ADVANCED RESULT ANALYZER
 # -----------------------------------------------------------------------------
+# PDFs shorter than this are extracted in-process; pool start-up would dominate
+PDF_PARALLEL_MIN_PAGES = 24
+PDF_PAGES_PER_TASK = 8
+PDF_WORKERS = os.cpu_count() or 1
+SEAT_MARKER = "SEAT NO.:"
+FAIL_GRADES = frozenset(['F', 'FF', 'AB', 'IC', 'ABS', 'Fail'])
+SUBJECT_ROW = re.compile(r'^[ \t\r\f\v]*(?P<row>\d{5,}[A-Z]?[^\n]*)', re.MULTILINE)
+# Header fields, each searched for on its own: every field is its first match anywhere in the
+# block, even inside another field or a subject row, which one alternation cannot guarantee
+STUDENT_HEADER_FIELDS = [
+    ('seat', re.compile(r'SEAT NO\.:\s*([A-Z0-9]+)')),
+    ('name', re.compile(r'NAME\s*:\s*(.*?)\s+MOTHER')),
+    ('mother', re.compile(r'MOTHER\s*:\s*(.*?)\s+PRN')),
+    ('prn', re.compile(r'PRN\s*:\s*([A-Z0-9]+)')),
+    # The optional "THIRD " before YEAR never changes which SGPA is found first, and leaving it
+    # out gives the search a literal to skip ahead to instead of trying every position
+    ('sgpa', re.compile(r'YEAR\s*SGPA\s*:\s*([0-9.]+|--)')),
+    ('credits', re.compile(r'TOTAL CREDITS EARNED\s*:\s*(\d+)')),
+]
+
+_worker_pdf_reader = None
+
+def _init_pdf_worker(pdf_bytes: bytes):
+    # Each worker parses the PDF once and then serves many page ranges from it
+    global _worker_pdf_reader
+    _worker_pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+
+def _extract_page_range(bounds):
+    start, stop = bounds
+    return [_worker_pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def _parse_pdf_file(pdf_bytes: bytes) -> List[Dict]:
+    # workers=1: with several files the pool is already spread over files, not pages
+    return list(AdvancedResultAnalyzer().stream_students(pdf_bytes, workers=1))
+
+def _pdf_pool_context():
+    # Streamlit runs the script as __main__, which spawn/forkserver workers cannot re-import
+    return multiprocessing.get_context("fork") if sys.platform.startswith("linux") else None
+
+def _pool_fallback(where: str):
+    """Log why a PDF process pool failed and count it; the caller carries on in-process."""
+    logger.warning("PDF process pool failed during %s, continuing in-process", where, exc_info=True)
+    perf_count("pdf_pool_fallbacks")
+
+def _read_pdf_bytes(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)): return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh: return fh.read()
+    if hasattr(source, "getvalue"): return source.getvalue()
+    return source.read()
+
+# Bump whenever parse_student_block output changes so cached parses are not reused
+PARSER_VERSION = "2"
+PARSE_CACHE_MEMORY_ENTRIES = 8
+PARSE_CACHE_DIR = os.environ.get("RESULT_PARSE_CACHE_DIR")  # unset = memory only
+PARSE_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_PARSE_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024))
+
+class ParseCache:
+    """Parsed student lists keyed by SHA-256 of the PDF bytes.
+
+    Recent parses are kept in memory (LRU by entry count); with disk_dir set they are also
+    written as gzipped JSON and the directory is trimmed, oldest access first, to
+    disk_max_bytes. Returned lists are shared and must be treated as read-only.
+    """
+    def __init__(self, max_entries: int = PARSE_CACHE_MEMORY_ENTRIES, disk_dir: Optional[str] = PARSE_CACHE_DIR,
+                 disk_max_bytes: int = PARSE_CACHE_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir: os.makedirs(disk_dir, exist_ok=True)
+    
+    def key_for(self, pdf_bytes: bytes) -> str:
+        return hashlib.sha256(pdf_bytes).hexdigest() + f"-v{PARSER_VERSION}"
+    
+    def get(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                perf_count('parse_cache_hits')
+                return self._entries[key]
+        students = self._read_disk(key)
+        with self._lock:
+            if students is None:
+                self.misses += 1
+                perf_count('parse_cache_misses')
+                return None
+            self.hits += 1
+            perf_count('parse_cache_hits')
+            self._remember(key, students)
+            return students
+    
+    def put(self, key: str, students: List[Dict]):
+        with self._lock:
+            self._remember(key, students)
+        if self.disk_dir:
+            try:
+                path = self._disk_path(key)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with gzip.open(tmp_path, "wt", encoding="utf-8") as fh: json.dump(students, fh)
+                os.replace(tmp_path, path)
+                self._trim_disk()
+            except OSError:
+                pass  # the disk store is best-effort; memory still has the entry
+    
+    def _remember(self, key: str, students: List[Dict]):
+        self._entries[key] = students
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json.gz")
+    
+    def _read_disk(self, key: str):
+        if not self.disk_dir: return None
+        path = self._disk_path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fh: students = json.load(fh)
+            os.utime(path)  # mtime doubles as last-access time for eviction
+            return students
+        except (OSError, ValueError):
+            return None
+    
+    def _trim_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json.gz"): continue
+            stat = os.stat(os.path.join(self.disk_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_max_bytes: break
+            os.remove(os.path.join(self.disk_dir, name))
+            total -= size
+
+@st.cache_resource
+def get_parse_cache() -> ParseCache:
+    return ParseCache()
+
+def parse_pdf_files(pdfs: List[bytes], progress_callback=None, workers: Optional[int] = None,
+                    cached: Optional[tuple] = None) -> List[tuple]:
+    """Parse several PDFs at once, one file per pool worker. Returns (students, error) per file, in input order.
+
+    Files already in the parse cache are not re-read. A caller that has looked them up already
+    passes cached=(keys, students or None per file), so the bytes are not hashed and the cache
+    not counted twice. progress_callback(done_files, total_files) is called as files complete.
+    """
+    parse_cache = get_parse_cache()
+    if cached is None:
+        keys = [parse_cache.key_for(pdf_bytes) for pdf_bytes in pdfs]
+        cached = (keys, [parse_cache.get(key) for key in keys])
+    keys, found = cached
+    results = [(students, None) for students in found]
+    missing = [i for i, (students, _) in enumerate(results) if students is None]
+    done = len(pdfs) - len(missing)
+    if progress_callback: progress_callback(done, len(pdfs))
+    workers = PDF_WORKERS if workers is None else workers
+    
+    def finish(i, students, error):
+        nonlocal done
+        results[i] = (students or [], error)
+        if error is None: parse_cache.put(keys[i], students)
+        done += 1
+        if progress_callback: progress_callback(done, len(pdfs))
+    
+    with perf_span("parse files", docs=len(missing)):
+        if len(missing) > 1 and workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(workers, len(missing)), mp_context=_pdf_pool_context()) as pool:
+                    futures = {pool.submit(_parse_pdf_file, pdfs[i]): i for i in missing}
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        try: students, error = future.result(), None
+                        except BrokenProcessPool: raise
+                        except Exception as e: students, error = [], str(e)
+                        finish(i, students, error)
+            except Exception:
+                # Pool unavailable or broken (e.g. restricted host); the files not finished are parsed in-process below
+                _pool_fallback("file parsing")
+        for i in missing:
+            if results[i][0] is not None: continue
+            try: finish(i, _parse_pdf_file(pdfs[i]), None)
+            except Exception as e: finish(i, [], str(e))
+    return results
+
+def _merge_rank(student: Dict):
+    return (bool(student.get('Has Valid SGPA')), len(student.get('Subjects') or ()))
+
+def _known_seat(student: Dict) -> str:
+    seat = str(student.get('Seat No') or '').strip()
+    return '' if seat == "Unknown" else seat
+
+def merge_cohort(parts: List[tuple]) -> tuple:
+    """Merge (file_name, students) parts into one cohort. Returns (students, issues).
+
+    Students are keyed on prn_key(PRN), or seat number when the PRN is missing (the parser
+    fills in "Unknown"); a student with neither is never merged with anyone. An exact repeat
+    (the same record in two sheets) is dropped. Differing records for one PRN keep the
+    one with a valid SGPA, then the one with more subjects, then the one from the later
+    file. The kept record takes the slot of the first occurrence. Two PRNs sharing a seat
+    number are both kept. Every case is listed in `issues` (one row per key).
+    """
+    students, slots, sources, issues = [], {}, {}, {}
+    for index, (file_name, part) in enumerate(parts):
+        for row, student in enumerate(part):
+            seat = _known_seat(student)
+            key = prn_key(student.get('PRN')) or (f"seat:{seat}" if seat else f"row:{index}:{row}")
+            slot = slots.get(key)
+            if slot is None:
+                slots[key] = len(students)
+                sources[key] = file_name
+                students.append(student)
+                continue
+            kept = students[slot]
+            issue = issues.setdefault(key, {'Issue': "Duplicate PRN", 'PRN': student.get('PRN'), 'Seat No': kept.get('Seat No'),
+                                            'Name': kept.get('Name'), 'Files': [sources[key]], 'Resolution': "identical, one kept"})
+            issue['Files'].append(file_name)
+            if student == kept: continue
+            issue['Issue'] = "Conflicting records"
+            if _merge_rank(student) >= _merge_rank(kept):
+                students[slot] = student
+                sources[key] = file_name
+            issue['Resolution'] = f"kept {sources[key]}"
+    
+    prns_by_seat = defaultdict(set)
+    for student in students:
+        prn, seat = prn_key(student.get('PRN')), _known_seat(student)
+        if prn and seat: prns_by_seat[seat].add(prn)
+    for seat, prns in prns_by_seat.items():
+        if len(prns) > 1:
+            issues[f"seat:{seat}"] = {'Issue': "Seat number clash", 'PRN': ", ".join(sorted(prns)), 'Seat No': seat,
+                                      'Name': None, 'Files': [sources[prn] for prn in sorted(prns)], 'Resolution': "both kept"}
+    for issue in issues.values():
+        issue['Files'] = ", ".join(dict.fromkeys(issue['Files']))
+    return students, list(issues.values())
+
+def batch_file_name(names: List[str]) -> str:
+    return names[0] if len(names) == 1 else f"{names[0]} + {len(names) - 1} more"
+
+def cached_student_table(students_data: List[Dict]) -> "StudentTable":
+    """The StudentTable for this exact list, kept in the session so reruns from slider
+    moves and page changes reuse the frame, sort orders and histogram."""
+    table = st.session_state.get('student_table')
+    if table is None or table.students is not students_data:
+        table = StudentTable(students_data)
+        st.session_state['student_table'] = table
+    return table
+
+STUDENT_COLUMNS = ['Seat No', 'Name', 'Mother Name', 'PRN', 'SGPA', 'SGPA_Raw', 'Credits',
+                   'Passed Subjects', 'Total Subjects', 'Result Status', 'Has Valid SGPA']
+
+class StudentTable:
+    """Columnar view of a students_data list, built once and shared by every dashboard tab.
+
+    `frame` holds every column except Subjects; `sgpa`, `valid`, `failed` and `passed` are NumPy
+    arrays aligned with it (and with the original list) for vectorized stats and filters.
+    """
+    def __init__(self, students_data: List[Dict]):
+        self.students = students_data
+        with perf_span("student frame", docs=len(students_data)):
+            self.frame = pd.DataFrame(students_data).reindex(columns=STUDENT_COLUMNS)
+            self.frame['Has Valid SGPA'] = self.frame['Has Valid SGPA'].eq(True)
+            self.sgpa = self.frame['SGPA'].fillna(0.0).to_numpy(dtype=float)
+            self.valid = self.frame['Has Valid SGPA'].to_numpy()
+            self.failed = (self.frame['Result Status'] == 'Fail').to_numpy()
+            self.passed = (self.frame['Result Status'] == 'Pass').to_numpy()
+        self._orders = {}
+        self._histogram = None
+    
+    def __len__(self):
+        return len(self.students)
+    
+    def summary(self) -> Dict:
+        total = len(self)
+        if not total: return {}
+        passed = int(self.passed.sum())
+        valid_sgpa = self.sgpa[self.valid]
+        avg_sgpa = float(valid_sgpa.mean()) if valid_sgpa.size else 0
+        # Plain Python numbers: the summary is written to Firestore as-is
+        return {
+            'total_students': total, 'passed_students': passed,
+            'failed_students': total - passed, 'average_sgpa': round(avg_sgpa, 2),
+            'pass_percentage': round(passed / total * 100, 1)
+        }
+    
+    def top_indices(self, n: int = 10) -> np.ndarray:
+        """Row indices of the n highest valid SGPAs; ties keep their original order."""
+        candidates = np.flatnonzero(self.valid)
+        if n <= 0: return candidates[:0]
+        if n < candidates.size:
+            # argpartition finds the n-th best SGPA without a full sort; everything tied with it
+            # stays a candidate so the final ordering matches a stable sort
+            best = np.argpartition(-self.sgpa[candidates], n - 1)[:n]
+            threshold = self.sgpa[candidates[best]].min()
+            candidates = candidates[self.sgpa[candidates] >= threshold]
+        order = np.lexsort((candidates, -self.sgpa[candidates]))
+        return candidates[order[:n]]
+    
+    def failed_indices(self) -> np.ndarray:
+        return np.flatnonzero(self.failed)
+    
+    def sgpa_order(self, descending: bool = True) -> np.ndarray:
+        """Row indices sorted by SGPA, ties in original order; sorted once per direction."""
+        if descending not in self._orders:
+            self._orders[descending] = np.argsort(-self.sgpa if descending else self.sgpa, kind='stable')
+        return self._orders[descending]
+    
+    def select(self, min_sgpa: float = 0.0, status: str = "All", descending: bool = True) -> np.ndarray:
+        """Row indices passing the student list filters, in display order."""
+        mask = self.sgpa >= min_sgpa
+        if status == "Pass": mask &= self.passed
+        elif status == "Fail": mask &= self.failed
+        order = self.sgpa_order(descending)
+        return order[mask[order]]
+    
+    def sgpa_histogram(self) -> np.ndarray:
+        """Valid SGPAs counted into SGPA_HISTOGRAM_BINS buckets over 0-10; computed once."""
+        if self._histogram is None:
+            self._histogram, _ = np.histogram(np.clip(self.sgpa[self.valid], 0, 10), bins=SGPA_HISTOGRAM_BINS, range=(0, 10))
+        return self._histogram
+    
+    def aggregates(self, top_n: int = AGGREGATE_TOP_N) -> Dict:
+        """Overview numbers small enough to store with the upload header.
+
+        Counts and sums rather than averages, so uploads of one exam can be added together
+        (see merge_exam_aggregate).
+        """
+        total = len(self)
+        passed = int(self.passed.sum())
+        valid_sgpa = self.sgpa[self.valid]
+        subjects = {}
+        for student in self.students:
+            for sub in student.get('Subjects') or ():
+                code = sub.get('Course Code')
+                if not code: continue
+                entry = subjects.setdefault(code, {'name': sub.get('Course Name', ''), 'grades': {}})
+                grade = sub.get('Grade') or '?'
+                entry['grades'][grade] = entry['grades'].get(grade, 0) + 1
+        return {
+            'total_students': total, 'passed_students': passed, 'failed_students': total - passed,
+            'valid_sgpa_count': int(valid_sgpa.size), 'sgpa_sum': float(valid_sgpa.sum()),
+            'sgpa_histogram': self.sgpa_histogram().tolist(), 'subject_grades': subjects,
+            'top_students': [{key: self.students[i].get(key) for key in ('Seat No', 'Name', 'PRN', 'SGPA')}
+                             for i in self.top_indices(top_n)]
+        }
+
+class FactTable:
+    """Factorizing helpers shared by the columnar tables built over every upload."""
+    @staticmethod
+    def _factorize(values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=False)
+        return codes.astype(np.int32), list(uniques)
+    
+    @staticmethod
+    def _extend_codes(codes: np.ndarray, labels: list, values):
+        """Codes for `values` against existing labels (new labels appended), concatenated to codes."""
+        new_codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=False)
+        lookup = {label: i for i, label in enumerate(labels)}
+        labels = list(labels)
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, label in enumerate(uniques):
+            if label not in lookup:
+                lookup[label] = len(labels)
+                labels.append(label)
+            mapping[i] = lookup[label]
+        return np.concatenate([codes, mapping[new_codes]]), labels
+    
+    @staticmethod
+    def _first_values(codes: np.ndarray, values: list, start: int, stop: int) -> list:
+        """values[] at the first row of each code in [start, stop), in code order."""
+        _, first = np.unique(codes, return_index=True)
+        found = {int(codes[i]): values[i] for i in first}
+        return [found[code] for code in range(start, stop)]
+
+class GradeFactTable(FactTable):
+    """Flattened (course, PRN, exam, grade) facts, one row per subject per student per upload.
+
+    Each dimension is factorized to integer codes (`course`, `prn`, `exam`, `grade`) with
+    its labels in `courses`, `prns`, `exams` and `grades`; exams keep upload order. Group-bys
+    are np.bincount over a combined code, so queries stay in milliseconds at millions of rows.
+    Every query takes an optional boolean row mask (see mask_for_exams).
+    """
+    def __init__(self, columns: Dict[str, list]):
+        self.course, self.courses = self._factorize(columns['course_code'])
+        self.prn, self.prns = self._factorize(columns['prn'])
+        self.exam, self.exams = self._factorize(columns['exam_tag'])
+        self.grade, self.grades = self._factorize(columns['grade'])
+        # Course names vary between sheets (truncation); keep the first one seen per code
+        _, first = np.unique(self.course, return_index=True)
+        names = columns['course_name']
+        self.course_names = [names[i] for i in first]
+        self.failing = np.isin(self.grade, [i for i, g in enumerate(self.grades) if g in FAIL_GRADES])
+    
+    def appended(self, columns: Dict[str, list]) -> "GradeFactTable":
+        """A new table with more rows; codes and label order of this one are kept, so the
+        cached table can be extended by newly synced uploads instead of rebuilt."""
+        table = GradeFactTable.__new__(GradeFactTable)
+        table.course, table.courses = self._extend_codes(self.course, self.courses, columns['course_code'])
+        table.prn, table.prns = self._extend_codes(self.prn, self.prns, columns['prn'])
+        table.exam, table.exams = self._extend_codes(self.exam, self.exams, columns['exam_tag'])
+        table.grade, table.grades = self._extend_codes(self.grade, self.grades, columns['grade'])
+        new_courses = table.course[len(self.course):]
+        _, first = np.unique(new_courses, return_index=True)
+        first_name = {code: columns['course_name'][i] for code, i in zip(new_courses[first], first)}
+        table.course_names = self.course_names + [first_name[code] for code in range(len(self.courses), len(table.courses))]
+        table.failing = np.isin(table.grade, [i for i, g in enumerate(table.grades) if g in FAIL_GRADES])
+        return table
+    
+    def __len__(self):
+        return len(self.course)
+    
+    @property
+    def nbytes(self) -> int:
+        labels = sum(len(str(v)) + 50 for v in (*self.courses, *self.prns, *self.exams, *self.grades, *self.course_names))
+        return self.course.nbytes + self.prn.nbytes + self.exam.nbytes + self.grade.nbytes + self.failing.nbytes + labels
+    
+    def mask_for_exams(self, exam_tags) -> Optional[np.ndarray]:
+        """Row mask for the given exam tags; None (all rows) when every exam is selected."""
+        exam_tags = set(exam_tags)
+        wanted = [i for i, tag in enumerate(self.exams) if tag in exam_tags]
+        if len(wanted) == len(self.exams): return None
+        return np.isin(self.exam, wanted)
+    
+    def _count(self, keys: np.ndarray, size: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        if mask is not None: keys = keys[mask]
+        return np.bincount(keys, minlength=size)
+    
+    def _and(self, mask, other):
+        return other if mask is None else mask & other
+    
+    def grade_distribution(self, mask: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Course x grade count matrix."""
+        n_courses, n_grades = len(self.courses), len(self.grades)
+        counts = self._count(self.course.astype(np.int64) * n_grades + self.grade, n_courses * n_grades, mask)
+        return pd.DataFrame(counts.reshape(n_courses, n_grades), index=pd.Index(self.courses, name='Course Code'), columns=self.grades)
+    
+    def subject_stats(self, mask: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Per course: records graded, failing grades (F/AB/...), fail and pass rate in %."""
+        n = len(self.courses)
+        graded = self._count(self.course, n, mask)
+        failing = self._count(self.course, n, self._and(mask, self.failing))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fail_rate = np.where(graded > 0, failing / graded * 100, np.nan)
+        stats = pd.DataFrame({'Course Name': self.course_names, 'Graded': graded, 'Failing': failing,
+                              'Fail %': fail_rate.round(1), 'Pass %': (100 - fail_rate).round(1)},
+                             index=pd.Index(self.courses, name='Course Code'))
+        return stats[stats['Graded'] > 0]
+    
+    def hardest_subjects(self, n: int = 10, min_graded: int = 1, mask: Optional[np.ndarray] = None) -> pd.DataFrame:
+        stats = self.subject_stats(mask)
+        stats = stats[stats['Graded'] >= min_graded]
+        return stats.sort_values(['Fail %', 'Graded'], ascending=[False, False], kind='stable').head(n)
+    
+    def pass_rate_by_exam(self, mask: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Course x exam pass rate in %, NaN where a course was not graded in an exam."""
+        n_courses, n_exams = len(self.courses), len(self.exams)
+        keys = self.course.astype(np.int64) * n_exams + self.exam
+        graded = self._count(keys, n_courses * n_exams, mask).reshape(n_courses, n_exams)
+        failing = self._count(keys, n_courses * n_exams, self._and(mask, self.failing)).reshape(n_courses, n_exams)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(graded > 0, (graded - failing) / graded * 100, np.nan)
+        return pd.DataFrame(rate.round(1), index=pd.Index(self.courses, name='Course Code'), columns=self.exams)
+    
+    def distinct_students(self, mask: Optional[np.ndarray] = None) -> int:
+        prn = self.prn if mask is None else self.prn[mask]
+        return int(np.count_nonzero(np.bincount(prn, minlength=len(self.prns)))) if prn.size else 0
+
+class StudentFactTable(FactTable):
+    """One row per student per upload: factorized PRN and exam codes, SGPA (NaN unless valid)
+    and the pass flag, in upload order. Backs the cohort progression view.
+
+    A student listed in several uploads of one exam (a revaluation sheet, an overlapping
+    division PDF) counts once, with the latest upload's result.
+    """
+    def __init__(self, columns: Dict[str, list]):
+        self.prn, self.prns = self._factorize(columns['prn'])
+        self.exam, self.exams = self._factorize(columns['exam_tag'])
+        self.sgpa = np.array([np.nan if v is None else v for v in columns['sgpa']], dtype=float)
+        self.passed = np.array(columns['passed'], dtype=bool)
+        # Names vary between sheets (truncation); keep the first one seen per PRN
+        self.names = self._first_values(self.prn, columns['name'], 0, len(self.prns))
+    
+    def appended(self, columns: Dict[str, list]) -> "StudentFactTable":
+        """A new table with more rows and this one's codes kept (see GradeFactTable.appended)."""
+        table = StudentFactTable.__new__(StudentFactTable)
+        table.prn, table.prns = self._extend_codes(self.prn, self.prns, columns['prn'])
+        table.exam, table.exams = self._extend_codes(self.exam, self.exams, columns['exam_tag'])
+        table.sgpa = np.concatenate([self.sgpa, np.array([np.nan if v is None else v for v in columns['sgpa']], dtype=float)])
+        table.passed = np.concatenate([self.passed, np.array(columns['passed'], dtype=bool)])
+        table.names = self.names + self._first_values(table.prn[len(self.prn):], columns['name'], len(self.prns), len(table.prns))
+        return table
+    
+    def __len__(self):
+        return len(self.prn)
+    
+    @property
+    def nbytes(self) -> int:
+        labels = sum(len(str(v)) + 50 for v in (*self.prns, *self.exams, *self.names))
+        return self.prn.nbytes + self.exam.nbytes + self.sgpa.nbytes + self.passed.nbytes + labels
+    
+    def _latest_rows(self, rows: np.ndarray) -> np.ndarray:
+        """rows with one row per (PRN, exam), the latest upload's; unique over the reversed
+        keys returns each key's last occurrence."""
+        keys = self.prn[rows].astype(np.int64) * max(len(self.exams), 1) + self.exam[rows]
+        _, last = np.unique(keys[::-1], return_index=True)
+        return rows[::-1][last]
+    
+    def rank_all(self, ranks: "ExamRanks", exam_tags=None) -> pd.DataFrame:
+        """Rank and percentile of every student in every (selected) exam that ranks covers,
+        one row per PRN per exam."""
+        # Fact exam code -> ExamRanks code, -1 for exams it does not cover or that were not selected
+        code = np.array([ranks.position.get(tag, -1) for tag in self.exams] or [-1], dtype=np.int64)
+        if exam_tags is not None:
+            code[~np.isin(np.array(self.exams, dtype=object), list(exam_tags))] = -1
+        rows = self._latest_rows(np.arange(len(self.prn)))
+        rows = rows[code[self.exam[rows]] >= 0]
+        standing = ranks.standing(code[self.exam[rows]], np.where(self.passed[rows], self.sgpa[rows], np.nan))
+        # Exams in upload order, best rank first; ties keep upload order
+        order = np.lexsort((rows, standing['Rank'], self.exam[rows]))
+        rows, prn = rows[order], self.prn[rows[order]]
+        frame = pd.DataFrame({
+            'Exam': np.array(self.exams, dtype=object)[self.exam[rows]], 'PRN': np.array(self.prns, dtype=object)[prn],
+            'Name': np.array(self.names, dtype=object)[prn], 'SGPA': self.sgpa[rows],
+            'Result': np.where(self.passed[rows], "Pass", "Fail"), **{key: values[order] for key, values in standing.items()},
+        })
+        frame['Pass Rank'] = frame['Pass Rank'].astype('Int64')
+        return frame
+    
+    def progression(self, exam_tags, min_change: float = 0.0) -> Dict:
+        """Follow the students of the selected exams (taken in upload order) from one to the next.
+
+        The join is on the PRN codes factorized when the table was built, so it is a scatter
+        into a dense PRN x exam matrix rather than a per-query hash join. An SGPA change
+        counts as improved/declined beyond +/- min_change. Returns
+        {'exams', 'summary', 'steps' (one row per consecutive pair), 'students' (one row per PRN)}.
+        """
+        wanted = set(exam_tags)
+        order = [code for code, tag in enumerate(self.exams) if tag in wanted]
+        k = len(order)
+        column = np.full(len(self.exams), -1, dtype=np.int64)
+        column[order] = np.arange(k)
+        col = column[self.exam]
+        rows = np.flatnonzero(col >= 0)
+        rows = self._latest_rows(rows)
+        cohort, student = np.unique(self.prn[rows], return_inverse=True)
+        n = len(cohort)
+        present = np.zeros((n, k), dtype=bool)
+        sgpa = np.full((n, k), np.nan)
+        passed = np.zeros((n, k), dtype=bool)
+        present[student, col[rows]] = True
+        sgpa[student, col[rows]] = self.sgpa[rows]
+        passed[student, col[rows]] = self.passed[rows]
+        exams = [self.exams[code] for code in order]
+        
+        steps = []
+        for a in range(k - 1):
+            b = a + 1
+            both = present[:, a] & present[:, b]
+            delta = sgpa[both, b] - sgpa[both, a]
+            delta = delta[~np.isnan(delta)]
+            steps.append({
+                'From': exams[a], 'To': exams[b], 'Students': int(present[:, a].sum()), 'Continued': int(both.sum()),
+                'Left': int((present[:, a] & ~present[:, b]).sum()), 'Joined': int((~present[:, a] & present[:, b]).sum()),
+                'Mean Δ SGPA': round(float(delta.mean()), 2) if delta.size else np.nan,
+                'Improved': int((delta > min_change).sum()), 'Declined': int((delta < -min_change).sum()),
+                'Pass→Fail': int((both & passed[:, a] & ~passed[:, b]).sum()),
+                'Fail→Pass': int((both & ~passed[:, a] & passed[:, b]).sum()),
+            })
+        
+        # Per student: change from the first to the last valid SGPA among the selected exams
+        valid = ~np.isnan(sgpa)
+        first = valid.argmax(axis=1)
+        last_valid = k - 1 - valid[:, ::-1].argmax(axis=1)
+        index = np.arange(n)
+        change = np.where(valid.sum(axis=1) >= 2, sgpa[index, last_valid] - sgpa[index, first], np.nan)
+        trend = np.select([change > min_change, change < -min_change, ~np.isnan(change)], ["Improved", "Declined", "Steady"], default="—")
+        last_seen = k - 1 - present[:, ::-1].argmax(axis=1)
+        students = pd.DataFrame({'PRN': np.array(self.prns, dtype=object)[cohort],
+                                 'Name': np.array(self.names, dtype=object)[cohort]})
+        for i, tag in enumerate(exams): students[f"SGPA {tag}"] = sgpa[:, i]
+        students['Exams Sat'] = present.sum(axis=1)
+        students['Fails'] = (present & ~passed).sum(axis=1)
+        students['Δ SGPA'] = np.round(change, 2)
+        students['Trend'] = trend
+        students['Last Exam'] = np.array(exams, dtype=object)[last_seen] if k else None
+        
+        started = present[:, 0] if k else np.zeros(n, dtype=bool)
+        summary = {
+            'students': n, 'started': int(started.sum()),
+            'retained': int((started & present[:, -1]).sum()) if k else 0,
+            'attrition': int((started & ~present[:, -1]).sum()) if k else 0,
+            'improved': int((trend == "Improved").sum()), 'declined': int((trend == "Declined").sum()),
+            'pass_to_fail': sum(step['Pass→Fail'] for step in steps), 'fail_to_pass': sum(step['Fail→Pass'] for step in steps),
+            'mean_sgpa': [round(float(np.nanmean(sgpa[:, i])), 2) if valid[:, i].any() else None for i in range(k)],
+        }
+        return {'exams': exams, 'summary': summary, 'steps': pd.DataFrame(steps), 'students': students}
+
+class ExamRanks:
+    """Each exam's passing SGPAs as one sorted array, so a rank or percentile is a binary search.
+
+    Built from the rank tables saved with each upload (see merge_exam_ranks), one per exam,
+    so a profile reads only its own exams. Overall standings are among everyone who sat the
+    exam, with fails below every pass; "Pass" standings are among passed students only. Ties
+    share the best rank (1, 2, 2, 4) and a percentile is the share of students at or below the SGPA.
+    """
+    def __init__(self, tables: Dict[str, Dict]):
+        """tables: exam tag -> rank table."""
+        self.exams = list(tables)
+        self.position = {tag: code for code, tag in enumerate(self.exams)}
+        sgpa = [np.array([np.nan if v is None else v for v in table.get('sgpa', {}).values()], dtype=float) for table in tables.values()]
+        self.sat = np.array([len(values) for values in sgpa], dtype=np.int64)
+        self.sorted_sgpa = [np.sort(values[~np.isnan(values)]) for values in sgpa]
+        self.passed = np.array([len(values) for values in self.sorted_sgpa], dtype=np.int64)
+    
+    def standing(self, exam: np.ndarray, sgpa: np.ndarray) -> Dict[str, np.ndarray]:
+        """Rank, Of, Percentile, Pass Rank, Passed and Pass Percentile for each (exam code, SGPA) pair."""
+        at_or_below = np.zeros(len(exam), dtype=np.int64)
+        valid = ~np.isnan(sgpa)
+        order = np.argsort(exam, kind='stable')
+        codes, starts = np.unique(exam[order], return_index=True)
+        for code, rows in zip(codes, np.split(order, starts[1:])):
+            rows = rows[valid[rows]]
+            # Tables hold SGPAs to two places; round so a float read back compares equal
+            at_or_below[rows] = np.searchsorted(self.sorted_sgpa[code], np.round(sgpa[rows], 2), side='right')
+        sat, passed = self.sat[exam], self.passed[exam]
+        rank = np.where(valid, passed - at_or_below + 1, passed + 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {
+                'Rank': rank, 'Of': sat, 'Percentile': np.round(100 * (at_or_below + sat - passed) / sat, 1),
+                'Pass Rank': np.where(valid, rank, np.nan), 'Passed': passed,
+                'Pass Percentile': np.where(valid, np.round(100 * at_or_below / passed, 1), np.nan),
+            }
+    
+    def lookup(self, exam_tag: str, sgpa: Optional[float]) -> Optional[Dict]:
+        """Standing of one SGPA (None for a fail) in an exam; None if the exam has no saved results."""
+        code = self.position.get(exam_tag)
+        if code is None or not self.sat[code]: return None
+        standing = self.standing(np.array([code]), np.array([np.nan if sgpa is None else sgpa], dtype=float))
+        found = {key: (None if np.isnan(values[0]) else values[0].item()) for key, values in standing.items()}
+        if found['Pass Rank'] is not None: found['Pass Rank'] = int(found['Pass Rank'])
+        return found
+
 class AdvancedResultAnalyzer:
     def __init__(self):
         self.students_data = []
         self.raw_text = ""
     
-    def extract_text_from_pdf(self, uploaded_file):
+    @property
+    def students_data(self) -> List[Dict]:
+        return self._students_data
+    
+    @students_data.setter
+    def students_data(self, value: List[Dict]):
+        self._students_data = value
+        self._table = None
+    
+    @property
+    def table(self) -> StudentTable:
+        if self._table is None:
+            self._table = StudentTable(self._students_data)
+        return self._table
+    
+    @table.setter
+    def table(self, value: StudentTable):
+        self._table = value
+    
+    def extract_text_from_pdf(self, uploaded_file, progress_callback=None, workers: Optional[int] = None):
+        """Extract the text of every page, in page order.
+
+        progress_callback(done_pages, total_pages) is called as pages complete.
+        """
         try:
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
+            pdf_bytes = _read_pdf_bytes(uploaded_file)
+            text = "".join(timed_iter("pdf extract", self.iter_page_texts(pdf_bytes, progress_callback, workers),
+                                      count_as='pages', bytes=len(pdf_bytes)))
             self.raw_text = text
             return text
         except Exception as e:
             st.error(f"❌ Error reading PDF: {str(e)}")
             return None
     
+    def iter_page_texts(self, pdf_bytes: bytes, progress_callback=None, workers: Optional[int] = None):
+        """Yield page texts in order, fanning page ranges out to a process pool for large PDFs."""
+        reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        total = len(reader.pages)
+        workers = PDF_WORKERS if workers is None else workers
+        done = 0
+        
+        if total >= PDF_PARALLEL_MIN_PAGES and workers > 1:
+            ranges = iter([(i, min(i + PDF_PAGES_PER_TASK, total)) for i in range(0, total, PDF_PAGES_PER_TASK)])
+            try:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=_pdf_pool_context(),
+                                         initializer=_init_pdf_worker, initargs=(pdf_bytes,)) as pool:
+                    # A fixed window of in-flight ranges keeps finished-but-unconsumed pages bounded
+                    # when the consumer (the streaming parser) is slower than extraction.
+                    pending = deque(pool.submit(_extract_page_range, bounds) for _, bounds in zip(range(2 * workers), ranges))
+                    while pending:
+                        texts = pending.popleft().result()
+                        next_bounds = next(ranges, None)
+                        if next_bounds: pending.append(pool.submit(_extract_page_range, next_bounds))
+                        for page_text in texts:
+                            yield page_text
+                            done += 1
+                        if progress_callback: progress_callback(done, total)
+            except Exception:
+                # Pool unavailable or broken (e.g. restricted host); finish the remaining pages in-process
+                _pool_fallback("page extraction")
+        
+        for i in range(done, total):
+            yield reader.pages[i].extract_text() or ""
+            if progress_callback: progress_callback(i + 1, total)
+    
     def is_valid_sgpa(self, sgpa_value):
         try: return float(sgpa_value) > 0
         except: return False
     
     def parse_comprehensive_data(self, text):
-        students = []
-        blocks = re.split(r'(?=SEAT NO\.:)', text)
-        
-        for block in blocks:
-            if "SEAT NO.:" not in block: continue
-            try:
-                seat_match = re.search(r'SEAT NO\.:\s*([A-Z0-9]+)', block)
-                seat_no = seat_match.group(1) if seat_match else "Unknown"
-                name_match = re.search(r'NAME\s*:\s*(.*?)\s+MOTHER', block)
-                name = name_match.group(1).strip() if name_match else "Unknown"
-                mother_match = re.search(r'MOTHER\s*:\s*(.*?)\s+PRN', block)
-                mother = mother_match.group(1).strip() if mother_match else "Unknown"
-                prn_match = re.search(r'PRN\s*:\s*([A-Z0-9]+)', block)
-                prn = prn_match.group(1).strip() if prn_match else "Unknown"
-                sgpa_match = re.search(r'(?:FIRST|SECOND|THIRD|FOURTH)?\s*YEAR\s*SGPA\s*:\s*([0-9\.]+|--)', block)
-                sgpa_raw = sgpa_match.group(1) if sgpa_match else "0.0"
-                try: sgpa = float(sgpa_raw)
-                except: sgpa = 0.0
-                credits_match = re.search(r'TOTAL CREDITS EARNED\s*:\s*(\d+)', block)
-                credits = int(credits_match.group(1)) if credits_match else 0
-                
-                subjects = self.parse_subject_grades(block)
-                passed_subjects = sum(1 for sub in subjects if sub['Grade'] not in ['F', 'FF', 'AB', 'IC', 'ABS', 'Fail'])
-                total_subjects = len(subjects)
-                has_valid_sgpa = sgpa > 0
-                result_status = 'Pass' if has_valid_sgpa else 'Fail'
-                
-                students.append({
-                    'Seat No': seat_no, 'Name': name, 'Mother Name': mother, 'PRN': prn,
-                    'SGPA': sgpa, 'SGPA_Raw': sgpa_raw, 'Credits': credits,
-                    'Subjects': subjects, 'Passed Subjects': passed_subjects,
-                    'Total Subjects': total_subjects, 'Result Status': result_status,
-                    'Has Valid SGPA': has_valid_sgpa
-                })
-            except Exception: continue
-        return students
+        return list(self.iter_students([text]))
+    
+    def stream_students(self, uploaded_file, progress_callback=None, workers: Optional[int] = None):
+        """Yield student records while the PDF is still being read.
+
+        Only the current page and the partial block carried across it are held in memory.
+        """
+        pdf_bytes = _read_pdf_bytes(uploaded_file)
+        pages = timed_iter("pdf extract", self.iter_page_texts(pdf_bytes, progress_callback, workers),
+                           count_as='pages', bytes=len(pdf_bytes))
+        return self.iter_students(pages)
+    
+    def iter_students(self, page_texts):
+        # Only parse_student_block is timed: pulling the next block may wait on PDF extraction
+        parse_seconds, parsed = 0.0, 0
+        try:
+            for block in self.iter_student_blocks(page_texts):
+                start = time.perf_counter()
+                student = self.parse_student_block(block)
+                parse_seconds += time.perf_counter() - start
+                if student:
+                    parsed += 1
+                    yield student
+        finally:
+            record_span("parse", parse_seconds * 1000, docs=parsed)
+    
+    def iter_student_blocks(self, page_texts):
+        """Split a stream of page texts into 'SEAT NO.:' blocks.
+
+        The last block of each page may continue on the next one, so it is carried over
+        until the next marker (or the end of the stream) is seen. A marker split across two
+        pages is still found because the carried text is searched together with the new page.
+        """
+        buffer = ""
+        for page_text in page_texts:
+            buffer += page_text
+            start = buffer.find(SEAT_MARKER)
+            if start < 0:
+                # Keep just enough text to complete a marker that straddles the page break
+                buffer = buffer[-(len(SEAT_MARKER) - 1):]
+                continue
+            end = buffer.find(SEAT_MARKER, start + 1)
+            while end != -1:
+                yield buffer[start:end]
+                start, end = end, buffer.find(SEAT_MARKER, end + 1)
+            buffer = buffer[start:]
+        if buffer.startswith(SEAT_MARKER):
+            yield buffer
+    
+    def parse_student_block(self, block):
+        """Parse one 'SEAT NO.:' block with precompiled patterns.
+
+        Each header field is its own search (see STUDENT_HEADER_FIELDS); subject rows are
+        collected in order by one findall instead of a split-and-match loop over lines.
+        """
+        try:
+            fields = {}
+            for key, pattern in STUDENT_HEADER_FIELDS:
+                match = pattern.search(block)
+                if match: fields[key] = match.group(1)
+            subjects = [subject for subject in map(self._subject_from_row, SUBJECT_ROW.findall(block)) if subject]
+            
+            sgpa_raw = fields.get('sgpa', "0.0")
+            try: sgpa = float(sgpa_raw)
+            except ValueError: sgpa = 0.0
+            passed_subjects = sum(1 for sub in subjects if sub['Grade'] not in FAIL_GRADES)
+            has_valid_sgpa = sgpa > 0
+            
+            return {
+                'Seat No': fields.get('seat', "Unknown"), 'Name': fields.get('name', "Unknown").strip(),
+                'Mother Name': fields.get('mother', "Unknown").strip(), 'PRN': fields.get('prn', "Unknown"),
+                'SGPA': sgpa, 'SGPA_Raw': sgpa_raw, 'Credits': int(fields.get('credits', 0)),
+                'Subjects': subjects, 'Passed Subjects': passed_subjects,
+                'Total Subjects': len(subjects), 'Result Status': 'Pass' if has_valid_sgpa else 'Fail',
+                'Has Valid SGPA': has_valid_sgpa
+            }
+        except Exception: return None
     
     def parse_subject_grades(self, block_text):
         subjects = []
-        lines = block_text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if re.match(r'^\d{5,}[A-Z]?', line):
-                parts = line.split()
-                if len(parts) > 6:
-                    grade = parts[-5]
-                    course_code = parts[0]
-                    course_name = " ".join(parts[1:min(len(parts), 4)]) 
-                    subjects.append({'Course Code': course_code, 'Course Name': course_name, 'Grade': grade})
+        for match in SUBJECT_ROW.finditer(block_text):
+            subject = self._subject_from_row(match.group('row'))
+            if subject: subjects.append(subject)
         return subjects
     
+    def _subject_from_row(self, row):
+        parts = row.split()
+        if len(parts) > 6:
+            return {'Course Code': parts[0], 'Course Name': " ".join(parts[1:4]), 'Grade': parts[-5]}
+        return None
+    
     def get_result_summary(self):
-        if not self.students_data: return {}
-        total = len(self.students_data)
-        passed = sum(1 for s in self.students_data if s['Result Status'] == 'Pass')
-        valid_sgpa_students = [s for s in self.students_data if s.get('Has Valid SGPA')]
-        avg_sgpa = sum(s['SGPA'] for s in valid_sgpa_students) / len(valid_sgpa_students) if valid_sgpa_students else 0
-        return {
-            'total_students': total, 'passed_students': passed,
-            'failed_students': total - passed, 'average_sgpa': round(avg_sgpa, 2),
-            'pass_percentage': round((passed / total * 100) if total > 0 else 0, 1)
-        }
+        return self.table.summary()
 
     def get_top_students(self, n=10):
-        valid = [s for s in self.students_data if s.get('Has Valid SGPA')]
-        return sorted(valid, key=lambda x: x['SGPA'], reverse=True)[:n]
+        return [self.students_data[i] for i in self.table.top_indices(n)]
     
     def get_failed_students(self):
-        return [s for s in self.students_data if s['Result Status'] == 'Fail']
+        return [self.students_data[i] for i in self.table.failed_indices()]
 
 # -----------------------------------------------------------------------------
 # 4. VISUALIZATIONS & PROFILE RENDERER
 # -----------------------------------------------------------------------------
-def render_student_profile(student_history):
+def format_standing(standing, rank_key, of_key, percentile_key):
+    if not standing or standing[percentile_key] is None: return "—", None
+    return f"{standing[rank_key]} / {standing[of_key]}", standing[percentile_key]
+
+@perf_timed("render student profile")
+def render_student_profile(student_history, ranks=None):
     # FIXED: Added color classes to h2 and p to make them visible in dark mode
     st.markdown(f"""
     <div class="profile-card">
@@ -420,12 +3140,16 @@ def render_student_profile(student_history):
         
         if not results_df.empty:
             st.subheader("📈 Academic Progression")
-            fig = px.line(results_df, x='Exam', y='SGPA', markers=True, 
-                          title="SGPA Progression", range_y=[0, 10])
+            fig = plotly_figure("line", data_frame=results_df[['Exam', 'SGPA']], x='Exam', y='SGPA', markers=True,
+                                title="SGPA Progression", range_y=[0, 10])
             st.plotly_chart(fig, use_container_width=True)
             
             st.subheader("📚 Result History")
             summary_df = results_df[['Exam', 'Seat', 'SGPA', 'Result', 'Credits']].copy()
+            if ranks is not None:
+                standings = [ranks.lookup(r['Exam'], r['SGPA'] if r['Result'] == 'Pass' else None) for r in student_history['Results']]
+                summary_df['Rank'], summary_df['Percentile'] = zip(*(format_standing(s, 'Rank', 'Of', 'Percentile') for s in standings))
+                summary_df['Rank (Passed)'], summary_df['Percentile (Passed)'] = zip(*(format_standing(s, 'Pass Rank', 'Passed', 'Pass Percentile') for s in standings))
             st.dataframe(summary_df, use_container_width=True)
             
             st.subheader("📝 Detailed Marksheets")
@@ -441,70 +3165,300 @@ def render_student_profile(student_history):
     else:
         st.info("No detailed result history available.")
 
-def render_overview_dashboard(analyzer):
-    st.markdown("### 📈 Performance Overview")
-    summary = analyzer.get_result_summary()
+def render_summary_metrics(summary):
     m1, m2, m3, m4 = st.columns(4)
     m1.metric("Total Students", summary['total_students'])
     m2.metric("Passed", summary['passed_students'], f"{summary['pass_percentage']}%")
     m3.metric("Failed", summary['failed_students'], delta_color="inverse")
     m4.metric("Avg SGPA", summary['average_sgpa'])
+
+@st.cache_resource(max_entries=PLOTLY_FIGURE_CACHE_ENTRIES, show_spinner=False)
+def plotly_figure(kind: str, layout: Optional[Dict] = None, **kwargs):
+    """px.<kind>(**kwargs), built once per distinct data and options and then shared.
+
+    Plotly Express spends 25-45 ms validating each figure, which every rerun (a slider move,
+    a page change) would otherwise pay again for unchanged charts. st.plotly_chart only
+    serializes the figure, so sharing it is safe; callers must not modify it.
+    """
+    fig = getattr(px, kind)(**kwargs)
+    if layout: fig.update_layout(**layout)
+    return fig
+
+def render_sgpa_histogram(counts, key=None):
+    """Bar chart of pre-binned SGPA counts; the browser gets SGPA_HISTOGRAM_BINS points whatever the class size."""
+    width = 10 / SGPA_HISTOGRAM_BINS
+    fig = plotly_figure("bar", layout={'bargap': 0}, x=[(i + 0.5) * width for i in range(len(counts))], y=list(counts),
+                        title="📊 SGPA Distribution", labels={'x': 'SGPA', 'y': 'Students'}, color_discrete_sequence=['#1f77b4'])
+    st.plotly_chart(fig, use_container_width=True, key=key)
+
+def render_status_pie(summary, key=None):
+    labels = ['Pass', 'Fail']
+    values = [summary['passed_students'], summary['failed_students']]
+    fig = plotly_figure("pie", values=values, names=labels, title="🎯 Result Status", color=labels, color_discrete_map={'Pass':'#4CAF50', 'Fail':'#F44336'})
+    st.plotly_chart(fig, use_container_width=True, key=key)
+
+@perf_timed("render overview dashboard")
+def render_overview_dashboard(analyzer):
+    st.markdown("### 📈 Performance Overview")
+    summary = analyzer.get_result_summary()
+    render_summary_metrics(summary)
     
     c1, c2 = st.columns(2)
     with c1:
-        valid_students = [s for s in analyzer.students_data if s.get('Has Valid SGPA')]
-        sgpas = [s['SGPA'] for s in valid_students]
-        if sgpas:
-            fig = px.histogram(x=sgpas, nbins=20, title="📊 SGPA Distribution", color_discrete_sequence=['#1f77b4'])
-            st.plotly_chart(fig, use_container_width=True)
-    with c2:
-        labels = ['Pass', 'Fail']
-        values = [summary['passed_students'], summary['failed_students']]
-        fig = px.pie(values=values, names=labels, title="🎯 Result Status", color=labels, color_discrete_map={'Pass':'#4CAF50', 'Fail':'#F44336'})
-        st.plotly_chart(fig, use_container_width=True)
+        counts = analyzer.table.sgpa_histogram()
+        if counts.any(): render_sgpa_histogram(counts.tolist())
+    with c2: render_status_pie(summary)
+
+@perf_timed("render aggregate overview")
+def render_aggregate_overview(aggregates, key):
+    """Overview of an upload header's or exam rollup's stored aggregates; needs no student records."""
+    summary = aggregate_summary(aggregates)
+    if not summary:
+        st.info("No students in this result.")
+        return
+    render_summary_metrics(summary)
+    
+    c1, c2 = st.columns(2)
+    with c1: render_sgpa_histogram(aggregates.get('sgpa_histogram') or [], key=f"{key}_hist")
+    with c2: render_status_pie(summary, key=f"{key}_pie")
+    
+    subjects = aggregates.get('subject_grades') or {}
+    if subjects:
+        rows = [{'Subject': f"{code} {entry.get('name', '')}".strip(), 'Grade': grade, 'Students': count}
+                for code, entry in sorted(subjects.items()) for grade, count in entry.get('grades', {}).items()]
+        fig = plotly_figure("bar", data_frame=pd.DataFrame(rows), x='Subject', y='Students', color='Grade', title="📚 Grade Distribution by Subject")
+        st.plotly_chart(fig, use_container_width=True, key=f"{key}_subjects")
+    
+    if aggregates.get('top_students'):
+        st.markdown("#### 🏆 Top Performers")
+        top_df = pd.DataFrame(aggregates['top_students'])
+        st.dataframe(top_df[[c for c in ['Seat No', 'Name', 'PRN', 'SGPA'] if c in top_df]], use_container_width=True)
 
+@perf_timed("render top performers")
 def render_top_performers(analyzer):
     st.markdown("### 🏆 Top Performers")
-    top_students = analyzer.get_top_students(10)
-    if top_students:
-        df = pd.DataFrame(top_students)
+    top = analyzer.table.top_indices(10)
+    if top.size:
+        df = analyzer.table.frame.iloc[top].reset_index(drop=True)
         st.dataframe(df[['Seat No', 'Name', 'SGPA', 'Result Status', 'Passed Subjects']], use_container_width=True)
 
+@perf_timed("render failed analysis")
 def render_failed_analysis(analyzer):
     st.markdown("### ❌ Failure Analysis")
-    failed = analyzer.get_failed_students()
-    if not failed:
+    table = analyzer.table
+    if not table.failed.any():
         st.success("🎉 All students passed!")
         return
-    df = pd.DataFrame(failed)
-    st.dataframe(df[['Seat No', 'Name', 'SGPA_Raw', 'Passed Subjects']], use_container_width=True)
+    st.write(f"{int(table.failed.sum())} students failed")
+    render_table_page(table.frame[['Seat No', 'Name', 'SGPA_Raw', 'Passed Subjects']], table.failed_indices(), key="failed_list")
 
+@perf_timed("render detailed data")
 def render_detailed_data(analyzer):
     st.markdown("### 📋 Student List")
-    df = pd.DataFrame([ {k:v for k,v in s.items() if k!='Subjects'} for s in analyzer.students_data ])
+    table = analyzer.table
     
     c1, c2, c3 = st.columns(3)
     with c1: min_sgpa = st.slider("Min SGPA", 0.0, 10.0, 0.0)
     with c2: status = st.selectbox("Status", ["All", "Pass", "Fail"])
     with c3: sort_order = st.selectbox("Sort", ["High to Low", "Low to High"])
-        
-    filtered = df[df['SGPA'] >= min_sgpa]
-    if status != "All": filtered = filtered[filtered['Result Status'] == status]
-    if sort_order == "High to Low": filtered = filtered.sort_values(by='SGPA', ascending=False)
-    else: filtered = filtered.sort_values(by='SGPA', ascending=True)
     
-    st.write(f"Showing {len(filtered)} students")
-    st.dataframe(filtered, use_container_width=True)
+    rows = table.select(min_sgpa, status, descending=sort_order == "High to Low")
+    st.write(f"Showing {len(rows)} students")
+    render_table_page(table.frame, rows, key="student_list", reset_on=(min_sgpa, status, sort_order))
+
+def render_table_page(frame, rows, key, reset_on=None):
+    """Show one page of frame.iloc[rows]; filtering and sorting stay on the server.
+
+    reset_on is any value describing the current filters; when it changes the view goes
+    back to the first page.
+    """
+    size_col, page_col, info_col = st.columns([1, 1, 2])
+    with size_col: size = st.selectbox("Rows per page", STUDENT_LIST_PAGE_SIZES, key=f"{key}_size")
+    pages = max(1, -(-len(rows) // size))
+    page_key, filter_key = f"{key}_page", f"{key}_filters"
+    if st.session_state.get(filter_key) != reset_on or st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = 1
+    st.session_state[filter_key] = reset_on
+    with page_col: page = st.number_input("Page", min_value=1, max_value=pages, step=1, key=page_key)
+    start = (page - 1) * size
+    with info_col: st.caption(f"Rows {min(start + 1, len(rows))}–{min(start + size, len(rows))} of {len(rows)} (page {page} of {pages})")
+    st.dataframe(frame.iloc[rows[start:start + size]], use_container_width=True)
+
+@perf_timed("render subject analytics")
+def render_subject_analytics(facts):
+    st.markdown("### 📚 Subject Analytics")
+    if facts is None or not len(facts):
+        st.info("No subject grades saved yet.")
+        return
+    selected = st.multiselect("Exams", facts.exams, default=facts.exams)
+    if not selected:
+        st.warning("Select at least one exam.")
+        return
+    mask = facts.mask_for_exams(selected)
+    stats = facts.subject_stats(mask)
+    
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Subjects", len(stats))
+    m2.metric("Grade Records", int(stats['Graded'].sum()))
+    m3.metric("Students", facts.distinct_students(mask))
+    
+    st.markdown("#### 🔥 Hardest Subjects (F/AB rate)")
+    min_graded = st.slider("Minimum students graded", 1, max(1, int(stats['Graded'].max())), min(10, max(1, int(stats['Graded'].max()))))
+    hardest = facts.hardest_subjects(15, min_graded, mask).reset_index()
+    if not hardest.empty:
+        hardest['Subject'] = hardest['Course Code'] + " " + hardest['Course Name']
+        fig = plotly_figure("bar", data_frame=hardest, x='Subject', y='Fail %', hover_data=['Graded', 'Failing'], color='Fail %', color_continuous_scale='Reds')
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(hardest[['Course Code', 'Course Name', 'Graded', 'Failing', 'Fail %']], use_container_width=True)
+    
+    st.markdown("#### 📊 Grade Distribution")
+    codes = stats.index.tolist()
+    course = st.selectbox("Subject", codes, format_func=lambda c: f"{c} {stats.at[c, 'Course Name']}")
+    distribution = facts.grade_distribution(mask).loc[course]
+    distribution = distribution[distribution > 0]
+    c1, c2 = st.columns(2)
+    with c1:
+        fig = plotly_figure("bar", x=distribution.index.tolist(), y=distribution.values.tolist(), labels={'x': 'Grade', 'y': 'Students'}, title=f"Grades in {course}")
+        st.plotly_chart(fig, use_container_width=True)
+    with c2:
+        across = facts.pass_rate_by_exam(mask).loc[course, [e for e in facts.exams if e in selected]].dropna()
+        if len(across) > 1:
+            fig = plotly_figure("line", x=across.index.tolist(), y=across.values.tolist(), markers=True, range_y=[0, 100],
+                                labels={'x': 'Exam', 'y': 'Pass %'}, title=f"{course} pass rate across exams")
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("Pass rate across exams needs this subject in two or more selected exams.")
+    
+    with st.expander("All subjects × grades"):
+        st.dataframe(facts.grade_distribution(mask).loc[codes], use_container_width=True)
+
+@perf_timed("render cohort progression")
+def render_cohort_progression(facts):
+    st.markdown("### 📈 Cohort Progression")
+    if facts is None or len(facts.exams) < 2:
+        st.info("Cohort progression needs results saved for two or more exams.")
+        return
+    selected = st.multiselect("Exams (in upload order)", facts.exams, default=facts.exams)
+    if len(selected) < 2:
+        st.warning("Select at least two exams.")
+        return
+    min_change = st.slider("Count SGPA changes larger than", 0.0, 2.0, 0.25, 0.05)
+    result = facts.progression(selected, min_change)
+    summary, steps, students = result['summary'], result['steps'], result['students']
+    
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("Started", summary['started'])
+    m2.metric("Retained", summary['retained'])
+    m3.metric("Attrition", summary['attrition'], delta=f"-{100 * summary['attrition'] / max(summary['started'], 1):.1f}%", delta_color="inverse")
+    m4.metric("Improved / Declined", f"{summary['improved']} / {summary['declined']}")
+    m5.metric("Pass → Fail", summary['pass_to_fail'])
+    
+    st.dataframe(steps, use_container_width=True)
+    fig = plotly_figure("line", x=result['exams'], y=summary['mean_sgpa'], markers=True,
+                        labels={'x': 'Exam', 'y': 'Mean SGPA'}, title="Mean SGPA across exams")
+    st.plotly_chart(fig, use_container_width=True)
+    
+    ranked = students.dropna(subset=['Δ SGPA']).sort_values('Δ SGPA')
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("#### 🚀 Top Improvers")
+        st.dataframe(ranked[ranked['Trend'] == "Improved"].iloc[::-1].head(10), use_container_width=True)
+    with c2:
+        st.markdown("#### 📉 Top Decliners")
+        st.dataframe(ranked[ranked['Trend'] == "Declined"].head(10), use_container_width=True)
+    st.download_button("📥 Download Progression CSV", students.to_csv(index=False), file_name="cohort_progression.csv", mime="text/csv")
+
+def render_rank_export(fm, facts):
+    """Every student's rank and percentile per exam as one CSV."""
+    with st.expander("🏅 Rank everyone (export)"):
+        selected = st.multiselect("Exams to rank", facts.exams, default=facts.exams, key="rank_export_exams")
+        if not selected:
+            st.info("Select at least one exam.")
+            return
+        ranked = facts.rank_all(fm.get_exam_ranks(selected), selected)
+        st.caption(f"{len(ranked)} results ranked across {len(selected)} exam(s); fails rank below every pass.")
+        st.dataframe(ranked.head(100), use_container_width=True)
+        st.download_button("📥 Download Rankings CSV", ranked.to_csv(index=False), file_name="exam_rankings.csv", mime="text/csv")
+
+def render_perf_panel(trace):
+    """Sidebar breakdown of the spans recorded so far in this rerun, with both exports."""
+    with st.sidebar.expander("⏱️ Performance (this rerun)"):
+        rows = trace.breakdown()
+        st.caption(f"{trace.elapsed_ms():.0f} ms so far, {sum(r['calls'] for r in rows)} spans (nested spans overlap)")
+        if rows:
+            df = pd.DataFrame(rows).set_index('span')
+            df['total_ms'] = df['total_ms'].round(1)
+            df['max_ms'] = df['max_ms'].round(1)
+            st.dataframe(df.rename(columns={'calls': 'Calls', 'total_ms': 'Total ms', 'max_ms': 'Max ms', 'bytes': 'Bytes', 'docs': 'Docs'}),
+                         use_container_width=True)
+        if trace.counters:
+            st.caption(" | ".join(f"{name.replace('_', ' ')}: {n}" for name, n in sorted(trace.counters.items())))
+        c1, c2 = st.columns(2)
+        with c1: st.download_button("JSON line", json.dumps(trace.to_record()) + "\n", file_name="perf.jsonl", key="perf_jsonl")
+        with c2: st.download_button("Prometheus", get_perf_stats().to_prometheus(), file_name="perf.prom", key="perf_prom")
+
+SAVE_JOB_LABELS = {"pending": "⏸️ Waiting", "queued": "🕒 Queued", "running": "⏳ Saving", "retrying": "🔁 Retrying",
+                   "done": "✅ Saved", "failed": "❌ Failed"}
+
+def backfill_exam_ranks_once(fm):
+    """Bring exam_ranks up to date with uploads saved before it existed, once per teacher sign-in."""
+    if st.session_state.get('exam_ranks_backfilled_for', ()) == fm.user_id: return
+    with st.spinner("Updating exam rank tables..."):
+        fm.backfill_exam_ranks()
+    st.session_state['exam_ranks_backfilled_for'] = fm.user_id
+
+def render_save_jobs(fm):
+    """Background saves started by this teacher, polled while any is still in flight."""
+    queue = get_save_queue()
+    if st.session_state.get('save_jobs_resumed_for') != fm.user_id:
+        # This teacher's jobs left over from a restart, once per sign-in
+        queue.resume(fm.store, fm.user_id)
+        st.session_state['save_jobs_resumed_for'] = fm.user_id
+    jobs = queue.statuses(fm.user_id)
+    if not jobs: return
+    active = any(j['state'] not in ("done", "failed") for j in jobs)
+    st.fragment(_save_jobs_panel, run_every=SAVE_JOB_POLL_SECONDS if active else None)(fm)
+
+def _save_jobs_panel(fm):
+    queue = get_save_queue()
+    jobs = queue.statuses(fm.user_id)
+    with st.expander(f"💾 Background saves ({sum(j['state'] not in ('done', 'failed') for j in jobs)} in progress)", expanded=True):
+        for job in jobs:
+            label = f"{SAVE_JOB_LABELS[job['state']]} — {job['file_name']} [{job['exam_tag']}], {job['total_students']} students"
+            if job['attempts'] > 1: label += f" (attempt {job['attempts']})"
+            if job['state'] in ("running", "retrying") and job['total']:
+                st.progress(job['done'] / job['total'], text=f"{label}: {job['done']}/{job['total']} writes")
+            else:
+                st.caption(label + (f": {job['error']}" if job['error'] and job['state'] != "done" else ""))
+            for warning in job.get('warnings') or (): st.warning(f"⚠️ {warning}")
+            if job['state'] in ("done", "failed"):
+                c1, c2 = st.columns(2)
+                if job['state'] == "failed" and c1.button("Retry", key=f"retry_{job['doc_id']}"):
+                    queue.retry(job['doc_id'], fm.store, fm.user_id)
+                    st.rerun()
+                if c2.button("Dismiss", key=f"dismiss_{job['doc_id']}"):
+                    queue.dismiss(job['doc_id'])
+                    st.rerun()
 
 # -----------------------------------------------------------------------------
 # 5. AUTHENTICATION & MAIN FLOW
 # -----------------------------------------------------------------------------
+def pick_name_match(fm, search_term, key):
+    """For a name search, list ranked matches and return the chosen student's PRN."""
+    if prn_key(search_term): return search_term
+    matches = fm.search_names(search_term)
+    if not matches: return search_term
+    labels = {f"{m['name']} — {m['prn']}": m['prn'] for m in matches}
+    picked = st.selectbox(f"{len(matches)} matching student(s)", list(labels), key=key)
+    return labels[picked]
+
 class AuthenticationManager:
     def __init__(self, firebase_manager):
         self.fm = firebase_manager
 
     def show_login_page(self):
         st.markdown('<h1 class="main-header">🎓 Student Result Portal</h1>', unsafe_allow_html=True)
+        if not self.fm.connected: st.warning("⚠️ The result database could not be reached; sign-in may fail.")
         t1, t2 = st.tabs(["🔐 Login", "📝 Register"])
         
         with t1:
@@ -544,24 +3498,86 @@ class AuthenticationManager:
                     else:
                         st.error("Password must be > 6 chars")
 
+def load_upload_cohort(analyzer, uploads) -> tuple:
+    """Parse the uploaded PDFs and merge them into one cohort: (students, issues, ok).
+
+    A single new file is streamed with live counts (its pages spread over the pool); several
+    new files are parsed a file per worker. The merged list is kept in the session for as long
+    as the same files are selected, so reruns hand cached_student_table the same list.
+    """
+    pdfs = [u.getvalue() for u in uploads]
+    parse_cache = get_parse_cache()
+    keys = tuple(parse_cache.key_for(pdf_bytes) for pdf_bytes in pdfs)
+    cohort = st.session_state.get('upload_cohort')
+    if cohort and cohort[0] == keys: return cohort[1], cohort[2], True
+    
+    found = [parse_cache.get(key) for key in keys]
+    missing = [i for i, students in enumerate(found) if students is None]
+    if len(missing) == 1:
+        progress = st.progress(0.0, text="Reading PDF...")
+        live = st.empty()
+        data, passed, sgpa_total = [], 0, 0.0
+        try:
+            for student in analyzer.stream_students(
+                    pdfs[missing[0]], progress_callback=lambda done, total: progress.progress(done / total, text=f"Reading page {done}/{total}")):
+                data.append(student)
+                if student['Has Valid SGPA']:
+                    passed += 1
+                    sgpa_total += student['SGPA']
+                if len(data) % 100 == 0:
+                    live.caption(f"Parsed {len(data)} students so far | Passed: {passed} | Avg SGPA: {sgpa_total / passed if passed else 0:.2f}")
+            parse_cache.put(keys[missing[0]], data)
+            found[missing[0]] = data
+        except Exception as e:
+            st.error(f"❌ Error reading {uploads[missing[0]].name}: {str(e)}")
+            return [], [], False
+        finally:
+            progress.empty()
+            live.empty()
+    
+    progress = st.progress(0.0, text="Reading PDFs...") if len(missing) > 1 else None
+    results = parse_pdf_files(pdfs, progress_callback=progress and (
+        lambda done, total: progress.progress(done / total, text=f"Parsed {done}/{total} files")), cached=(keys, found))
+    if progress: progress.empty()
+    failed = [f"{u.name}: {error}" for u, (_, error) in zip(uploads, results) if error]
+    if failed:
+        st.error("❌ Error reading PDF: " + "; ".join(failed))
+        return [], [], False
+    for u, (students, _) in zip(uploads, results):
+        if not students and len(uploads) > 1: st.warning(f"⚠️ No students found in {u.name}")
+    
+    data, issues = merge_cohort([(u.name, students) for u, (students, _) in zip(uploads, results)])
+    st.session_state['upload_cohort'] = (keys, data, issues)
+    return data, issues, True
+
 def show_teacher_dashboard(fm):
     st.markdown(f'<h1 class="main-header">👨‍🏫 Teacher Dashboard <span class="role-badge teacher-badge">TEACHER</span></h1>', unsafe_allow_html=True)
-    menu = ["📤 Upload & Analyze", "📁 Saved Results", "👥 Global Search (History)"]
+    menu = ["📤 Upload & Analyze", "📁 Saved Results", "📚 Subject Analytics", "📈 Cohort Progression", "👥 Global Search (History)"]
     choice = st.sidebar.selectbox("Menu", menu)
+    if current_trace(): current_trace().label = f"teacher {choice}"
+    render_save_jobs(fm)
+    backfill_exam_ranks_once(fm)
+    with st.sidebar.expander("🗄️ Result Cache"):
+        stats = fm.cache.stats()
+        st.caption(f"Hits: {stats['hits']} | Misses: {stats['misses']} | Hit rate: {stats['hit_rate']}%")
+        st.caption(f"{stats['entries']} docs, {stats['bytes'] / 1e6:.1f} / {stats['max_bytes'] / 1e6:.0f} MB, {stats['evictions']} evicted")
     
     if choice == "📤 Upload & Analyze":
-        st.header("Upload New Result PDF")
-        uploaded = st.file_uploader("Choose PDF", type="pdf")
+        st.header("Upload New Result PDFs")
+        uploads = st.file_uploader("Choose PDFs (one per division for a combined exam)", type="pdf", accept_multiple_files=True)
         exam_tag = st.text_input("Exam Name (e.g., 'SE 2024', 'TE 2025')", placeholder="SE May 2024")
         
-        if uploaded and exam_tag:
+        if uploads and exam_tag:
             analyzer = AdvancedResultAnalyzer()
-            text = analyzer.extract_text_from_pdf(uploaded)
-            if text:
-                data = analyzer.parse_comprehensive_data(text)
+            data, issues, ok = load_upload_cohort(analyzer, uploads)
+            if ok:
                 if data:
                     analyzer.students_data = data
-                    st.success(f"Processed {len(data)} students")
+                    analyzer.table = cached_student_table(data)
+                    st.success(f"Processed {len(data)} students" + (f" from {len(uploads)} files" if len(uploads) > 1 else ""))
+                    if issues:
+                        with st.expander(f"⚠️ {len(issues)} duplicate PRNs / seat numbers resolved"):
+                            st.dataframe(pd.DataFrame(issues), use_container_width=True, hide_index=True)
                     t1, t2, t3, t4 = st.tabs(["Overview", "Top Performers", "Failures", "Detailed List"])
                     with t1: render_overview_dashboard(analyzer)
                     with t2: render_top_performers(analyzer)
@@ -570,15 +3586,30 @@ def show_teacher_dashboard(fm):
                     
                     if st.button("💾 Save to Database", type="primary"):
                         summary = analyzer.get_result_summary()
-                        fm.save_result_data(uploaded.name, exam_tag, data, st.session_state.user['name'], summary)
+                        job = fm.queue_result_data(batch_file_name([u.name for u in uploads]), exam_tag, data,
+                                                   st.session_state.user['name'], summary, aggregates=analyzer.table.aggregates())
+                        if job: st.info("💾 Saving in the background; progress is shown at the top of the dashboard.")
                 else:
                     st.error("No data found")
-        elif uploaded and not exam_tag:
+        elif uploads and not exam_tag:
             st.warning("⚠️ Please enter an Exam Name (e.g., 'SE 2023') to enable saving.")
 
     elif choice == "📁 Saved Results":
         st.header("Previous Uploads")
-        files = fm.get_all_result_files()
+        exams = fm.list_exam_aggregates()
+        if exams:
+            with st.expander("📊 Exam Overview (all uploads of an exam combined)"):
+                labels = {f"{e.get('exam_tag')} ({e.get('total_students', 0)} students, {len(e.get('file_ids', []))} files)": e.get('exam_tag') for e in exams}
+                picked = st.selectbox("Exam", list(labels))
+                rollup = fm.get_exam_aggregate(labels[picked])
+                if rollup: render_aggregate_overview(rollup, key="exam_overview")
+        
+        # Page tokens seen so far; index i holds the token that fetches page i
+        if 'saved_results_tokens' not in st.session_state:
+            st.session_state.saved_results_tokens = [None]
+            st.session_state.saved_results_page = 0
+        page = st.session_state.saved_results_page
+        files, next_token = fm.list_result_files(page_token=st.session_state.saved_results_tokens[page])
         if not files: st.info("No saved results found.")
         for f in files:
             time_str = f.get('uploaded_at', datetime.datetime.now())
@@ -589,18 +3620,52 @@ def show_teacher_dashboard(fm):
                 with col1:
                     st.write(f"**Total Students:** {f.get('total_students', 0)}")
                 with col2:
+                    if f.get('aggregates') and st.button("📊 Overview", key=f"overview_{f['id']}"):
+                        st.session_state.current_overview = f['id']
                     if st.button(f"Load Analysis", key=f['id']):
-                        st.session_state.current_analysis = f
+                        # students_data is only downloaded for the file being analysed
+                        st.session_state.current_analysis = fm.get_result_file(f['id'], f.get('update_time'))
+                
+                if st.session_state.get('current_overview') == f['id'] and f.get('aggregates'):
+                    st.markdown("---")
+                    render_aggregate_overview(f['aggregates'], key=f"overview_{f['id']}")
                 
-                if st.session_state.get('current_analysis', {}).get('id') == f['id']:
+                current = st.session_state.get('current_analysis') or {}
+                if current.get('id') == f['id']:
                     analyzer = AdvancedResultAnalyzer()
-                    analyzer.students_data = f['students_data']
+                    analyzer.students_data = current.get('students_data', [])
+                    analyzer.table = cached_student_table(analyzer.students_data)
                     st.markdown("---")
                     t1, t2, t3, t4 = st.tabs(["Overview", "Top Performers", "Failures", "Detailed List"])
                     with t1: render_overview_dashboard(analyzer)
                     with t2: render_top_performers(analyzer)
                     with t3: render_failed_analysis(analyzer)
                     with t4: render_detailed_data(analyzer)
+        
+        p1, p2, p3 = st.columns([1, 2, 1])
+        with p1:
+            if page > 0 and st.button("⬅️ Previous"):
+                st.session_state.saved_results_page -= 1
+                st.rerun()
+        with p2: st.caption(f"Page {page + 1}")
+        with p3:
+            if next_token and st.button("Next ➡️"):
+                tokens = st.session_state.saved_results_tokens
+                del tokens[page + 1:]
+                tokens.append(next_token)
+                st.session_state.saved_results_page += 1
+                st.rerun()
+
+    elif choice == "📚 Subject Analytics":
+        with st.spinner("Loading subject grades..."):
+            facts = fm.get_grade_facts()
+        render_subject_analytics(facts)
+
+    elif choice == "📈 Cohort Progression":
+        with st.spinner("Loading student results..."):
+            facts = fm.get_student_facts()
+        render_cohort_progression(facts)
+        if facts is not None and len(facts): render_rank_export(fm, facts)
 
     elif choice == "👥 Global Search (History)":
         st.header("🌍 Global Student Search & History")
@@ -608,13 +3673,15 @@ def show_teacher_dashboard(fm):
         search_term = st.text_input("Enter PRN (Recommended) or Name")
         
         if search_term:
+            search_term = pick_name_match(fm, search_term, key="teacher_name_match")
             with st.spinner("Searching database..."):
                 history_results = fm.get_student_history(search_term)
+                ranks = fm.get_exam_ranks(r['Exam'] for h in history_results for r in h['Results']) if history_results else None
                 
                 if history_results:
                     st.success(f"Found {len(history_results)} student profile(s)!")
                     for student_history in history_results:
-                        render_student_profile(student_history)
+                        render_student_profile(student_history, ranks)
                 else:
                     st.warning("No student found.")
 
@@ -624,39 +3691,54 @@ def show_student_dashboard(fm):
     search_term = st.text_input("Enter your PRN (Preferred) or Name")
     
     if search_term:
+        search_term = pick_name_match(fm, search_term, key="student_name_match")
         with st.spinner("Searching records..."):
             history_results = fm.get_student_history(search_term)
+            ranks = fm.get_exam_ranks(r['Exam'] for h in history_results for r in h['Results']) if history_results else None
             
             if history_results:
                 for student_history in history_results:
-                    render_student_profile(student_history)
+                    render_student_profile(student_history, ranks)
             else:
                 st.error("No records found. Check PRN.")
 
+def get_firebase_manager() -> FirebaseManager:
+    """The session's FirebaseManager, built on its first rerun and reused by later ones."""
+    fm = st.session_state.get('firebase_manager')
+    if fm is None:
+        fm = st.session_state['firebase_manager'] = FirebaseManager()
+    fm.bind_session()
+    return fm
+
 def main():
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
         st.session_state.user = None
     
-    fm = FirebaseManager()
-    auth = AuthenticationManager(fm)
-    
-    if not st.session_state.logged_in:
-        auth.show_login_page()
-    else:
-        with st.sidebar:
-            st.write(f"👤 **{st.session_state.user['name']}**")
-            if st.button("🚪 Logout"):
-                st.session_state.logged_in = False
-                st.session_state.pop('id_token', None)
-                st.session_state.pop('user_id', None)
-                st.session_state.user = None
-                st.rerun()
+    trace = start_perf_trace(st.session_state.get('role', "login") if st.session_state.logged_in else "login")
+    try:
+        fm = get_firebase_manager()
+        auth = AuthenticationManager(fm)
         
-        if st.session_state.role == 'teacher':
-            show_teacher_dashboard(fm)
+        if not st.session_state.logged_in:
+            auth.show_login_page()
         else:
-            show_student_dashboard(fm)
+            with st.sidebar:
+                st.write(f"👤 **{st.session_state.user['name']}**")
+                if st.button("🚪 Logout"):
+                    st.session_state.logged_in = False
+                    st.session_state.pop('id_token', None)
+                    st.session_state.pop('user_id', None)
+                    st.session_state.user = None
+                    st.rerun()
+            
+            if st.session_state.role == 'teacher':
+                show_teacher_dashboard(fm)
+                render_perf_panel(trace)
+            else:
+                show_student_dashboard(fm)
+    finally:
+        finish_perf_trace(trace)
 
 if __name__ == "__main__":
     main()
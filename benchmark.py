@@ -0,0 +1,832 @@
+"""Synthetic result sheets and benchmarks for the result analyzer.
+
+Run with the same environment as the app:
+
+    python benchmark.py generate --students 100000 --out sheet.pdf   # or sheet.txt
+    python benchmark.py parse --students 10000
+    python benchmark.py all --students 5000 --save bench.json
+    python benchmark.py compare baseline.json bench.json --threshold 10
+
+Suites: extract (PDF text extraction; building the PDF needs reportlab),
+parse, summary, codec (Firestore encode/decode), search (history search
+against a local Firestore stub server) and startup (time to first render of
+the login page and each dashboard, one fresh process per sample, through
+streamlit.testing's AppTest on a seeded SQLite store). --save writes the suite's metrics as
+JSON for `compare`; metrics ending in _per_s are better higher, _ms lower.
+
+Importing app.py outside `streamlit run` prints "missing ScriptRunContext"
+warnings; they can be ignored.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+from app import (AdvancedResultAnalyzer, ExamRanks, FirebaseManager, FirestoreResultStore, HttpTransport, ResultFileCache,
+                 StudentFactTable, StudentTable, UploadSnapshot, decode_firestore_fields, decode_student_fields, encode_firestore_fields,
+                 encode_student_fields, merge_exam_ranks, prn_key)
+
+GRADES = ['O', 'A+', 'A', 'B+', 'B', 'C', 'P', 'F', 'AB']
+GRADE_WEIGHTS = [8, 14, 18, 18, 14, 10, 8, 7, 3]
+GRADE_POINTS = {'O': 10, 'A+': 9, 'A': 8, 'B+': 7, 'B': 6, 'C': 5, 'P': 4, 'F': 0, 'AB': 0}
+YEARS = ['FIRST', 'SECOND', 'THIRD', 'FOURTH']
+FIRST_NAMES = ("AARAV VIVAAN ADITYA VIHAAN ARJUN SAI REYANSH AYAAN KRISHNA ISHAAN SHAURYA ATHARV OM PRANAV "
+               "SHREYAS TANMAY YASH ROHAN SIDDHARTH OMKAR AADHYA ANANYA DIYA PARI SAANVI MYRA AAROHI ANIKA "
+               "NAVYA KAVYA RIYA SNEHA POOJA SAKSHI TANVI GAYATRI MRUNAL SHRUTI VAISHNAVI NEHA").split()
+MOTHER_NAMES = "ANITA SUNITA KAVITA MEENA ASHA REKHA SANGITA VANDANA MANISHA SUREKHA JYOTI SEEMA".split()
+LAST_NAMES = ("KUMAR SHARMA PATIL DESHMUKH JOSHI KULKARNI PAWAR JADHAV SHINDE MORE GAIKWAD CHAVAN KALE "
+              "BHOSALE NAIK RAO REDDY IYER NAIR MENON WAGH SALUNKHE MANE KADAM GHOSH").split()
+SUBJECTS = [
+    ('210241', 'DISCRETE MATHEMATICS'), ('210242', 'FUNDAMENTALS OF DATA STRUCTURES'),
+    ('210243', 'OBJECT ORIENTED PROGRAMMING'), ('210244', 'COMPUTER GRAPHICS'),
+    ('210245', 'DIGITAL ELECTRONICS AND LOGIC DESIGN'), ('210246', 'DATA STRUCTURES LABORATORY'),
+    ('210247', 'OOP AND COMPUTER GRAPHICS LABORATORY'), ('210248', 'DIGITAL ELECTRONICS LABORATORY'),
+    ('210249', 'BUSINESS COMMUNICATION SKILLS'), ('210250', 'HUMANITY AND SOCIAL SCIENCE'),
+    ('210251', 'ENGINEERING MATHEMATICS III'), ('210252', 'DATA STRUCTURES AND ALGORITHMS'),
+    ('210253', 'SOFTWARE ENGINEERING'), ('210254', 'MICROPROCESSOR'),
+    ('210255', 'PRINCIPLES OF PROGRAMMING LANGUAGES'), ('210256', 'DATA STRUCTURES AND ALGORITHMS LABORATORY'),
+]
+STUDENTS_PER_PAGE = 5
+
+
+# -----------------------------------------------------------------------------
+# Synthetic SPPU result sheets
+# -----------------------------------------------------------------------------
+def iter_student_texts(n_students: int, subjects_per_student: int = 8, seed: int = 0):
+    """One 'SEAT NO.:' block per student, in the layout parse_comprehensive_data expects.
+
+    Grades follow a skewed distribution and a student with an F or AB gets no SGPA ("--").
+    Student i always has PRN 7226{i:06d}F, so sheets generated with different seeds read as
+    the same cohort sitting different exams.
+    """
+    rng = random.Random(seed)
+    subjects = SUBJECTS[:min(subjects_per_student, len(SUBJECTS))]
+    for i in range(n_students):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        lines = [f"SEAT NO.: S{1000000 + i}  NAME : {name}  MOTHER : {rng.choice(MOTHER_NAMES)}  PRN : 7226{i:06d}F",
+                 "COURSE CODE COURSE NAME ISE ESE TOTAL TW PR OR TUT Tot% Crd Grd GP CP P&R ORD"]
+        points = []
+        for code, course in subjects:
+            grade = rng.choices(GRADES, GRADE_WEIGHTS)[0]
+            gp = GRADE_POINTS[grade]
+            ise, ese = (0, 0) if grade == 'AB' else (rng.randint(8, 30), rng.randint(10, 70))
+            points.append(gp)
+            lines.append(f"{code} {course} {ise:02d}/030 {ese:02d}/070 {ise + ese:03d}/100 -- -- -- -- "
+                         f"{ise + ese} 03 {grade} {gp} {gp * 3} - -")
+        sgpa = "--" if not points or 0 in points else f"{sum(points) / len(points):.2f}"
+        lines.append(f"{rng.choice(YEARS)} YEAR SGPA : {sgpa}  TOTAL CREDITS EARNED : {3 * sum(1 for gp in points if gp)}")
+        yield "\n".join(lines) + "\n"
+
+
+def iter_result_pages(n_students: int, students_per_page: int = STUDENTS_PER_PAGE, **kwargs):
+    """Page texts of a synthetic sheet, for the streaming parser and PDF output."""
+    page = []
+    for block in iter_student_texts(n_students, **kwargs):
+        page.append(block)
+        if len(page) == students_per_page:
+            yield "".join(page)
+            page = []
+    if page: yield "".join(page)
+
+
+def generate_result_text(n_students: int, subjects_per_student: int = 8, seed: int = 0) -> str:
+    """SPPU-style result text in the layout parse_comprehensive_data expects."""
+    return "".join(iter_student_texts(n_students, subjects_per_student, seed))
+
+
+def write_result_pdf(path: str, n_students: int, students_per_page: int = STUDENTS_PER_PAGE, **kwargs) -> int:
+    """Write a text-layer PDF of a synthetic sheet with reportlab; returns the page count."""
+    try:
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.pdfgen import canvas
+    except ImportError:
+        sys.exit("PDF output needs reportlab: pip install reportlab")
+    width, height = landscape(A4)
+    pdf = canvas.Canvas(path, pagesize=(width, height))
+    pages = 0
+    for page_text in iter_result_pages(n_students, students_per_page, **kwargs):
+        pdf.setFont("Courier", 7)
+        y = height - 30
+        for line in page_text.splitlines():
+            pdf.drawString(20, y, line)
+            y -= 15 if line.startswith(tuple(YEARS)) else 9
+        pdf.showPage()
+        pages += 1
+    pdf.save()
+    return pages
+
+
+# -----------------------------------------------------------------------------
+# Baselines: the implementations the current code replaced
+# -----------------------------------------------------------------------------
+def legacy_parse_student_block(block):
+    """The seven-search parser that parse_student_block replaced, kept as the baseline."""
+    seat_match = re.search(r'SEAT NO\.:\s*([A-Z0-9]+)', block)
+    name_match = re.search(r'NAME\s*:\s*(.*?)\s+MOTHER', block)
+    mother_match = re.search(r'MOTHER\s*:\s*(.*?)\s+PRN', block)
+    prn_match = re.search(r'PRN\s*:\s*([A-Z0-9]+)', block)
+    sgpa_match = re.search(r'(?:FIRST|SECOND|THIRD|FOURTH)?\s*YEAR\s*SGPA\s*:\s*([0-9\.]+|--)', block)
+    sgpa_raw = sgpa_match.group(1) if sgpa_match else "0.0"
+    try: sgpa = float(sgpa_raw)
+    except ValueError: sgpa = 0.0
+    credits_match = re.search(r'TOTAL CREDITS EARNED\s*:\s*(\d+)', block)
+    subjects = []
+    for line in block.split('\n'):
+        line = line.strip()
+        if re.match(r'^\d{5,}[A-Z]?', line):
+            parts = line.split()
+            if len(parts) > 6:
+                subjects.append({'Course Code': parts[0], 'Course Name': " ".join(parts[1:min(len(parts), 4)]), 'Grade': parts[-5]})
+    has_valid_sgpa = sgpa > 0
+    return {
+        'Seat No': seat_match.group(1) if seat_match else "Unknown",
+        'Name': name_match.group(1).strip() if name_match else "Unknown",
+        'Mother Name': mother_match.group(1).strip() if mother_match else "Unknown",
+        'PRN': prn_match.group(1).strip() if prn_match else "Unknown",
+        'SGPA': sgpa, 'SGPA_Raw': sgpa_raw, 'Credits': int(credits_match.group(1)) if credits_match else 0,
+        'Subjects': subjects,
+        'Passed Subjects': sum(1 for sub in subjects if sub['Grade'] not in ['F', 'FF', 'AB', 'IC', 'ABS', 'Fail']),
+        'Total Subjects': len(subjects), 'Result Status': 'Pass' if has_valid_sgpa else 'Fail',
+        'Has Valid SGPA': has_valid_sgpa
+    }
+
+
+# Layouts where fields overlap; the generator never produces them, so parity is checked on these too
+_EDGE_ROW = "210241 DISCRETE MATHEMATICS 23/030 35/070 058/100 -- -- -- -- 58 03 A 8 24 - -"
+PARSE_EDGE_BLOCKS = [
+    # Totals on the same line as the last subject row
+    f"SEAT NO.: S1  NAME : A B  MOTHER : C  PRN : 72260001F\n{_EDGE_ROW}\n{_EDGE_ROW}  THIRD YEAR SGPA : 8.10  TOTAL CREDITS EARNED : 9\n",
+    # A PRN token inside the name
+    f"SEAT NO.: S2  NAME : PRN : 5 X  MOTHER : M  PRN : 1234567F\n{_EDGE_ROW}\nTHIRD YEAR SGPA : 7.00  TOTAL CREDITS EARNED : 3\n",
+    # An SGPA token inside the name
+    f"SEAT NO.: S3  NAME : YEAR SGPA : 9 Q  MOTHER : M  PRN : 7226000003F\n{_EDGE_ROW}\nTHIRD YEAR SGPA : 5.00  TOTAL CREDITS EARNED : 3\n",
+    # Year prefixes with odd spacing, and a later SGPA that must not win
+    f"SEAT NO.: S5  NAME : D  MOTHER : E  PRN : 7226000005F\n{_EDGE_ROW}\nFOURTH  YEAR   SGPA:9.25 SECOND YEAR SGPA : 4.00\n",
+    # Missing fields and no subject rows
+    "SEAT NO.: S4  NAME : ONLY NAME\nTOTAL CREDITS EARNED : 0\n",
+]
+
+
+def legacy_result_summary(students_data):
+    """get_result_summary + get_top_students as list scans, before StudentTable."""
+    if not students_data: return {}, []
+    total = len(students_data)
+    passed = sum(1 for s in students_data if s['Result Status'] == 'Pass')
+    valid_sgpa_students = [s for s in students_data if s.get('Has Valid SGPA')]
+    avg_sgpa = sum(s['SGPA'] for s in valid_sgpa_students) / len(valid_sgpa_students) if valid_sgpa_students else 0
+    summary = {
+        'total_students': total, 'passed_students': passed,
+        'failed_students': total - passed, 'average_sgpa': round(avg_sgpa, 2),
+        'pass_percentage': round((passed / total * 100) if total > 0 else 0, 1)
+    }
+    return summary, sorted(valid_sgpa_students, key=lambda x: x['SGPA'], reverse=True)[:10]
+
+
+def legacy_to_firestore_value(value):
+    """FirebaseManager._to_firestore_value before the dispatch-table codec."""
+    if value is None: return {"nullValue": None}
+    elif isinstance(value, bool): return {"booleanValue": value}
+    elif isinstance(value, int): return {"integerValue": str(value)}
+    elif isinstance(value, float): return {"doubleValue": value}
+    elif isinstance(value, str): return {"stringValue": value}
+    elif isinstance(value, datetime.datetime): return {"timestampValue": value.isoformat() + "Z"}
+    elif isinstance(value, list): return {"arrayValue": {"values": [legacy_to_firestore_value(v) for v in value]}}
+    elif isinstance(value, dict): return {"mapValue": {"fields": {k: legacy_to_firestore_value(v) for k, v in value.items()}}}
+    else: return {"stringValue": str(value)}
+
+
+def legacy_convert_from_firestore(doc):
+    """FirebaseManager._convert_from_firestore before the dispatch-table codec."""
+    result = {}
+    for key, value in doc.get('fields', {}).items():
+        if 'stringValue' in value: result[key] = value['stringValue']
+        elif 'integerValue' in value: result[key] = int(value['integerValue'])
+        elif 'doubleValue' in value: result[key] = float(value['doubleValue'])
+        elif 'booleanValue' in value: result[key] = value['booleanValue']
+        elif 'timestampValue' in value:
+            try: result[key] = datetime.datetime.fromisoformat(value['timestampValue'].replace('Z', '+00:00'))
+            except ValueError: result[key] = value['timestampValue']
+        elif 'arrayValue' in value:
+            result[key] = [legacy_convert_single_value(i) for i in value['arrayValue'].get('values', [])]
+        elif 'mapValue' in value:
+            result[key] = legacy_convert_from_firestore({'fields': value['mapValue']['fields']})
+    return result
+
+
+def legacy_convert_single_value(value):
+    if 'stringValue' in value: return value['stringValue']
+    elif 'integerValue' in value: return int(value['integerValue'])
+    elif 'doubleValue' in value: return float(value['doubleValue'])
+    elif 'booleanValue' in value: return value['booleanValue']
+    elif 'mapValue' in value: return legacy_convert_from_firestore({'fields': value['mapValue']['fields']})
+    return None
+
+
+def legacy_progression_steps(columns, exam_tags, min_change):
+    """Consecutive-exam transitions as one pandas merge on PRN per pair, without a fact table."""
+    import pandas as pd
+    frame = pd.DataFrame(columns).drop_duplicates(['prn', 'exam_tag'], keep='last')
+    steps = []
+    for before, after in zip(exam_tags, exam_tags[1:]):
+        a, b = frame[frame['exam_tag'] == before], frame[frame['exam_tag'] == after]
+        both = a.merge(b, on='prn', suffixes=('_a', '_b'))
+        delta = (both['sgpa_b'].astype(float) - both['sgpa_a'].astype(float)).dropna()
+        steps.append({'From': before, 'To': after, 'Students': len(a), 'Continued': len(both),
+                      'Left': len(a) - len(both), 'Joined': len(b) - len(both),
+                      'Improved': int((delta > min_change).sum()), 'Declined': int((delta < -min_change).sum()),
+                      'Pass→Fail': int((both['passed_a'] & ~both['passed_b']).sum())})
+    return steps
+
+
+def generate_student_columns(n_students: int, n_exams: int, seed: int = 0, attrition: float = 0.04) -> dict:
+    """Columns shaped like ResultStore.student_facts for one cohort sitting n_exams exams in turn.
+
+    Each exam loses about `attrition` of the remaining students; about 10% of sittings fail
+    (no valid SGPA).
+    """
+    rng = random.Random(seed)
+    columns = {'prn': [], 'name': [], 'exam_tag': [], 'sgpa': [], 'passed': []}
+    ability = [rng.uniform(5.0, 9.5) for _ in range(n_students)]
+    remaining = list(range(n_students))
+    for exam in range(n_exams):
+        if exam: remaining = [i for i in remaining if rng.random() > attrition]
+        for i in remaining:
+            passed = rng.random() > 0.1
+            columns['prn'].append(f"72{i:07d}F")
+            columns['name'].append(f"STUDENT {i}")
+            columns['exam_tag'].append(f"SEM {exam + 1}")
+            columns['sgpa'].append(round(min(10.0, max(0.0, ability[i] + rng.gauss(0, 0.6))), 2) if passed else None)
+            columns['passed'].append(passed)
+    return columns
+
+
+def rank_tables_from_columns(columns: dict) -> dict:
+    """Exam tag -> rank table as saves would have folded it, one upload per exam."""
+    entries = defaultdict(dict)
+    for prn, tag, sgpa, passed in zip(columns['prn'], columns['exam_tag'], columns['sgpa'], columns['passed']):
+        entries[tag][prn_key(prn)] = sgpa if passed else None
+    return {tag: merge_exam_ranks(None, f"result_{tag}", tag, exam) for tag, exam in entries.items()}
+
+
+# -----------------------------------------------------------------------------
+# Local Firestore stub
+# -----------------------------------------------------------------------------
+STUB_DB_PATH = "projects/bench/databases/(default)/documents"
+
+
+class StubFirestore:
+    """In-memory stand-in for the Firestore REST endpoints FirestoreResultStore calls.
+
+    Covers document GET with field masks, collection listing (pageSize, pageToken, a
+    single-field orderBy, masks), :batchGet and :commit with updateMask,
+    appendMissingElements and currentDocument preconditions. Tokens are not checked.
+    It is served over HTTP on localhost so the app's real transport is part of the timing.
+    """
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.server = None
+        self._clock = datetime.datetime(2024, 1, 1)
+
+    def start(self) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            def log_message(self, *args): pass
+            def do_GET(self): self._dispatch("GET")
+            def do_POST(self): self._dispatch("POST")
+            def do_PATCH(self): self._dispatch("PATCH")
+
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, payload = stub.handle(method, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}/v1/{STUB_DB_PATH}"
+
+    def stop(self):
+        if self.server: self.server.shutdown()
+
+    def handle(self, method, raw_path, body):
+        with self.lock:
+            self.requests += 1
+            url = urllib.parse.urlsplit(raw_path)
+            query = urllib.parse.parse_qs(url.query)
+            rest = urllib.parse.unquote(url.path)[len(f"/v1/{STUB_DB_PATH}"):]
+            if rest.startswith(":"):
+                return getattr(self, "_rpc_" + rest[1:])(body)
+            rest = rest.lstrip("/")
+            name = f"{STUB_DB_PATH}/{rest}"
+            if len(rest.split("/")) % 2 == 1:
+                return self._list(name, query)
+            if method == "GET":
+                doc = self.docs.get(name)
+                return (200, self._mask(doc, query.get("mask.fieldPaths"))) if doc else (404, {"error": {"code": 404}})
+            self._put(name, (body or {}).get("fields", {}))
+            return 200, self.docs[name]
+
+    def _put(self, name, fields):
+        self._clock += datetime.timedelta(microseconds=1)
+        now = self._clock.isoformat(timespec="microseconds") + "Z"
+        old = self.docs.get(name)
+        self.docs[name] = {"name": name, "fields": fields, "createTime": old["createTime"] if old else now, "updateTime": now}
+
+    def _mask(self, doc, paths):
+        if not paths: return doc
+        return {**doc, "fields": {k: v for k, v in doc["fields"].items() if k in paths}}
+
+    def _list(self, collection, query):
+        prefix = collection + "/"
+        names = [n for n in self.docs if n.startswith(prefix) and "/" not in n[len(prefix):]]
+        order = (query.get("orderBy") or [""])[0].split()
+        if order:
+            names.sort(key=lambda n: json.dumps(self.docs[n]["fields"].get(order[0])), reverse=order[-1] == "desc")
+        else:
+            names.sort()
+        start, size = int((query.get("pageToken") or ["0"])[0]), int((query.get("pageSize") or ["20"])[0])
+        page = names[start:start + size]
+        result = {"documents": [self._mask(self.docs[n], query.get("mask.fieldPaths")) for n in page]} if page else {}
+        if start + size < len(names): result["nextPageToken"] = str(start + size)
+        return 200, result
+
+    def _rpc_batchGet(self, body):
+        paths = (body.get("mask") or {}).get("fieldPaths")
+        return 200, [{"found": self._mask(self.docs[n], paths)} if n in self.docs else {"missing": n} for n in body["documents"]]
+
+    def _rpc_commit(self, body):
+        for write in body["writes"]:
+            name = write["update"]["name"]
+            precondition = write.get("currentDocument", {})
+            if precondition.get("exists") is False and name in self.docs:
+                return 409, {"error": {"status": "ALREADY_EXISTS"}}
+            if "updateTime" in precondition and self.docs.get(name, {}).get("updateTime") != precondition["updateTime"]:
+                return 400, {"error": {"status": "FAILED_PRECONDITION"}}
+            fields = dict(self.docs[name]["fields"]) if "updateMask" in write and name in self.docs else {}
+            fields.update(write["update"].get("fields", {}))
+            for transform in write.get("updateTransforms", []):
+                values = fields.get(transform["fieldPath"], {"arrayValue": {}})["arrayValue"].get("values", [])
+                values = values + [v for v in transform["appendMissingElements"]["values"] if v not in values]
+                fields[transform["fieldPath"]] = {"arrayValue": {"values": values}}
+            self._put(name, fields)
+        return 200, {"writeResults": [{} for _ in body["writes"]]}
+
+    def _rpc_runQuery(self, body):
+        # Only what delta sync sends: one collection, an optional GREATER_THAN, one orderBy, select
+        query = body["structuredQuery"]
+        prefix = f"{STUB_DB_PATH}/{query['from'][0]['collectionId']}/"
+        docs = [d for n, d in self.docs.items() if n.startswith(prefix) and "/" not in n[len(prefix):]]
+        value = lambda doc, path: json.dumps(doc["fields"].get(path))
+        condition = (query.get("where") or {}).get("fieldFilter")
+        if condition:
+            path, bound = condition["field"]["fieldPath"], list(condition["value"].values())[0]
+            docs = [d for d in docs if path in d["fields"] and list(d["fields"][path].values())[0] > bound]
+        for order in query.get("orderBy", []):
+            docs.sort(key=lambda d: value(d, order["field"]["fieldPath"]), reverse=order.get("direction") == "DESCENDING")
+        paths = [f["fieldPath"] for f in (query.get("select") or {}).get("fields", [])] or None
+        read_time = self._clock.isoformat(timespec="microseconds") + "Z"
+        return 200, [{"document": self._mask(d, paths), "readTime": read_time} for d in docs] or [{"readTime": read_time}]
+
+
+def stub_manager(stub_url: str, snapshot: "UploadSnapshot" = None) -> FirebaseManager:
+    """A signed-in FirebaseManager whose Firestore store talks to the stub."""
+    app.FIREBASE_DB_PATH = STUB_DB_PATH
+    app.FIREBASE_REST_URL = stub_url
+    store = FirestoreResultStore(HttpTransport(), ResultFileCache(), snapshot=snapshot)
+    fm = FirebaseManager(store=store)
+    fm.cache = store.cache
+    fm.id_token = store.id_token = "bench"
+    return fm
+
+
+# -----------------------------------------------------------------------------
+# Suites
+# -----------------------------------------------------------------------------
+def best_of(fn, repeat: int) -> float:
+    # GC off while timing, as timeit does: the codec suites allocate millions of small dicts
+    # and collector passes would otherwise land on whichever variant happens to run next
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(timings)
+
+
+def median_ms(fn, repeat: int) -> float:
+    """Median wall time; for network round trips, where the minimum flatters the client."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def bench_extract(args):
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        print("extract: skipped, building the PDF needs reportlab (pip install reportlab)")
+        return {}
+    analyzer = AdvancedResultAnalyzer()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sheet.pdf")
+        pages = write_result_pdf(path, args.students, seed=args.seed)
+        with open(path, "rb") as fh: pdf_bytes = fh.read()
+    serial_text = "".join(analyzer.iter_page_texts(pdf_bytes, workers=1))
+    assert serial_text == "".join(analyzer.iter_page_texts(pdf_bytes)), "parallel extraction differs from serial"
+    assert len(analyzer.parse_comprehensive_data(serial_text)) == args.students, "extracted text lost students"
+
+    repeat = max(1, min(args.repeat, 3))
+    serial = best_of(lambda: "".join(analyzer.iter_page_texts(pdf_bytes, workers=1)), repeat)
+    parallel = best_of(lambda: "".join(analyzer.iter_page_texts(pdf_bytes)), repeat)
+    streamed = best_of(lambda: sum(1 for _ in analyzer.stream_students(pdf_bytes)), repeat)
+    print(f"Extracted {pages} pages ({len(pdf_bytes) / 1e6:.1f} MB PDF, {args.students} students), best of {repeat}")
+    print(f"  serial                          : {pages / serial:>10,.1f} pages/s")
+    print(f"  {app.PDF_WORKERS:>2} workers                      : {pages / parallel:>10,.1f} pages/s  ({serial / parallel:.2f}x)")
+    print(f"  extract + parse, streamed       : {args.students / streamed:>10,.0f} students/s")
+    return {"serial_pages_per_s": pages / serial, "parallel_pages_per_s": pages / parallel,
+            "stream_students_per_s": args.students / streamed}
+
+
+def bench_parse(args):
+    analyzer = AdvancedResultAnalyzer()
+    text = generate_result_text(args.students, seed=args.seed)
+    blocks = list(analyzer.iter_student_blocks([text]))
+
+    legacy = [legacy_parse_student_block(b) for b in blocks]
+    current = [analyzer.parse_student_block(b) for b in blocks]
+    assert legacy == current, "parse_student_block output differs from the legacy parser"
+    for block in PARSE_EDGE_BLOCKS:
+        assert legacy_parse_student_block(block) == analyzer.parse_student_block(block), f"parsers differ on {block!r}"
+
+    pages = list(iter_result_pages(args.students, seed=args.seed))
+    before = best_of(lambda: [legacy_parse_student_block(b) for b in blocks], args.repeat)
+    after = best_of(lambda: [analyzer.parse_student_block(b) for b in blocks], args.repeat)
+    streamed = best_of(lambda: sum(1 for _ in analyzer.iter_students(pages)), args.repeat)
+    print(f"Parsed {len(blocks)} students ({len(text) / 1e6:.1f} MB of text), best of {args.repeat}")
+    print(f"  before (7 searches + line split): {len(blocks) / before:>10,.0f} students/s")
+    print(f"  after  (compiled, one findall)  : {len(blocks) / after:>10,.0f} students/s  ({before / after:.2f}x)")
+    print(f"  split + parse over {len(pages):>6} pages: {len(blocks) / streamed:>10,.0f} students/s")
+    return {"legacy_students_per_s": len(blocks) / before, "students_per_s": len(blocks) / after,
+            "stream_students_per_s": len(blocks) / streamed}
+
+
+def bench_summary(args):
+    students = AdvancedResultAnalyzer().parse_comprehensive_data(generate_result_text(args.students, seed=args.seed))
+    table = StudentTable(students)
+    legacy_summary, legacy_top = legacy_result_summary(students)
+    assert table.summary() == legacy_summary, "StudentTable summary differs from the legacy summary"
+    assert [students[i]['SGPA'] for i in table.top_indices(10)] == [s['SGPA'] for s in legacy_top], "top students differ"
+
+    legacy = best_of(lambda: legacy_result_summary(students), args.repeat)
+    build = best_of(lambda: StudentTable(students), args.repeat)
+    summary = best_of(lambda: (table.summary(), table.top_indices(10), table.failed_indices()), args.repeat)
+    aggregates = best_of(lambda: table.aggregates(), args.repeat)
+    print(f"Summary of {len(students)} students, best of {args.repeat}")
+    print(f"  legacy list scans + sort        : {legacy * 1000:>10.2f} ms")
+    print(f"  StudentTable build (once)       : {build * 1000:>10.2f} ms")
+    print(f"  summary + top 10 + failed       : {summary * 1000:>10.2f} ms")
+    # A one-off summary pays for the build; the table wins once the dashboard tabs reuse it
+    print(f"  build + summary, first use      : {(build + summary) * 1000:>10.2f} ms ({(build + summary) / legacy:.1f}x legacy)")
+    print(f"  save-time aggregates            : {aggregates * 1000:>10.2f} ms")
+    return {"legacy_ms": legacy * 1000, "table_build_ms": build * 1000, "summary_ms": summary * 1000,
+            "aggregates_ms": aggregates * 1000}
+
+
+def bench_codec(args):
+    analyzer = AdvancedResultAnalyzer()
+    students = analyzer.parse_comprehensive_data(generate_result_text(args.students, seed=args.seed))
+    n = len(students)
+
+    legacy_encoded = [{k: legacy_to_firestore_value(v) for k, v in s.items()} for s in students]
+    generic_encoded = [encode_firestore_fields(s) for s in students]
+    student_encoded = [encode_student_fields(s) for s in students]
+    assert legacy_encoded == generic_encoded == student_encoded, "encoders disagree"
+    assert [decode_student_fields(f) for f in student_encoded] == students, "student codec does not round-trip"
+    assert [decode_firestore_fields(f) for f in generic_encoded] == students, "generic codec does not round-trip"
+
+    rows = [
+        ("legacy_encode", "encode  legacy isinstance chain", lambda: [{k: legacy_to_firestore_value(v) for k, v in s.items()} for s in students]),
+        ("encode", "encode  dispatch table         ", lambda: [encode_firestore_fields(s) for s in students]),
+        ("student_encode", "encode  student fast path      ", lambda: [encode_student_fields(s) for s in students]),
+        ("legacy_decode", "decode  legacy isinstance chain", lambda: [legacy_convert_from_firestore({'fields': f}) for f in legacy_encoded]),
+        ("decode", "decode  dispatch table         ", lambda: [decode_firestore_fields(f) for f in generic_encoded]),
+        ("student_decode", "decode  student fast path      ", lambda: [decode_student_fields(f) for f in student_encoded]),
+    ]
+    print(f"Firestore codec on {n} students ({sum(len(s['Subjects']) for s in students)} subjects), best of {args.repeat}")
+    metrics = {}
+    for key, label, fn in rows:
+        metrics[f"{key}_students_per_s"] = n / best_of(fn, args.repeat)
+        print(f"  {label}: {metrics[f'{key}_students_per_s']:>10,.0f} students/s")
+    return metrics
+
+
+def bench_search(args):
+    stub = StubFirestore()
+    fm = stub_manager(stub.start())
+    analyzer = AdvancedResultAnalyzer()
+    try:
+        # One cohort sitting several exams: every upload holds the same PRNs
+        seed_start = time.perf_counter()
+        for exam in range(args.exams):
+            students = analyzer.parse_comprehensive_data(generate_result_text(args.students, seed=args.seed + exam))
+            fm.store.save_upload(f"result_bench_{exam}", {
+                "file_name": f"sem{exam + 1}.pdf", "exam_tag": f"SEM {exam + 1}", "uploaded_by": "bench",
+                "uploaded_at": datetime.datetime(2024, 1, 1) + datetime.timedelta(days=180 * exam),
+                "total_students": len(students), "summary": {},
+                "aggregates": StudentTable(students).aggregates()}, students)
+        print(f"History search over {args.exams} uploads x {args.students} students on a local stub "
+              f"(seeded in {time.perf_counter() - seed_start:.1f}s, {len(stub.docs)} documents), median of {args.repeat}")
+
+        prn = f"7226{random.Random(args.seed).randrange(args.students):06d}F"
+        name = students[len(students) // 2]['Name']
+        metrics = {}
+
+        def timed(label, key, fn, cold=False):
+            def run():
+                if cold: fm.cache.clear()
+                return fn()
+            before = stub.requests
+            result = run()
+            requests_made = stub.requests - before
+            metrics[key] = median_ms(run, args.repeat)
+            print(f"  {label:<32}: {metrics[key]:>10.2f} ms  ({requests_made} requests)")
+            return result
+
+        history = timed("PRN via prn_index, cold cache", "prn_cold_ms", lambda: fm.get_student_history(prn), cold=True)
+        assert history and len(history[0]['Results']) == args.exams, "PRN history is missing exams"
+        timed("PRN via prn_index, warm cache", "prn_warm_ms", lambda: fm.get_student_history(prn))
+
+        index = app.get_name_index()
+        timed("name index build", "name_index_build_ms", lambda: index.rebuild(fm.store.name_directory()))
+        matches = timed("name lookup in NameIndex", "name_lookup_ms", lambda: fm.search_names(name))
+        assert any(m['name'] == name for m in matches), "name search missed an exact name"
+        timed("name history, warm cache", "name_history_ms", lambda: fm.get_student_history(name))
+        timed("full scan by name, cold cache", "scan_cold_ms", lambda: list(fm.store.search_students(name.lower())), cold=True)
+        timed("full scan by name, warm cache", "scan_warm_ms", lambda: list(fm.store.search_students(name.lower())))
+
+        # Listing uploads: paging the whole collection vs one runQuery past the synced watermark
+        timed("upload listing, full scan", "list_full_ms", fm.store.get_all_uploads, cold=True)
+        fm.store.snapshot = UploadSnapshot(interval_seconds=0)
+        fm.store.snapshot.sync(fm.store)
+        listed = timed("upload listing, delta sync", "list_delta_ms", fm.store.get_all_uploads)
+        assert len(listed) == args.exams, "delta sync lost uploads"
+        return metrics
+    finally:
+        stub.stop()
+
+
+# Runs in a fresh interpreter so the first render pays for imports, as a cold server does
+STARTUP_PROBE = r"""
+import json, sys, time
+config = json.loads(sys.argv[1])
+from streamlit.testing.v1 import AppTest
+result = {}
+def timed_run(at, key):
+    start = time.perf_counter()
+    at.run()
+    result[key] = (time.perf_counter() - start) * 1000
+    if at.exception: sys.exit(f"{key}: {at.exception[0].value}")
+at = AppTest.from_file(config["app"], default_timeout=300)
+for key, value in config["session"].items(): at.session_state[key] = value
+timed_run(at, "first_ms")
+result["lazy_modules_loaded"] = sum(m in sys.modules for m in ("numpy", "pandas", "plotly.express", "PyPDF2", "requests"))
+timed_run(at, "rerun_ms")
+if config["role"] == "teacher":
+    for option in at.sidebar.selectbox[0].options[1:]:
+        at.sidebar.selectbox[0].select(option)
+        timed_run(at, option + "|first_ms")
+        timed_run(at, option + "|rerun_ms")
+elif config["role"] == "student":
+    at.text_input[0].input(config["prn"])
+    timed_run(at, "profile|first_ms")
+    timed_run(at, "profile|rerun_ms")
+print(json.dumps(result))
+"""
+
+
+def bench_startup(args):
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    db_path = os.path.join(workdir, "results.db")
+    store = app.SQLiteResultStore(db_path)
+    analyzer = AdvancedResultAnalyzer()
+    for exam in range(args.exams):
+        students = analyzer.parse_comprehensive_data(generate_result_text(args.students, seed=args.seed + exam))
+        store.save_upload(f"result_bench_{exam}", {
+            "file_name": f"sem{exam + 1}.pdf", "exam_tag": f"SEM {exam + 1}", "uploaded_by": "bench",
+            "uploaded_at": datetime.datetime(2024, 1, 1) + datetime.timedelta(days=180 * exam),
+            "total_students": len(students), "summary": {}, "aggregates": StudentTable(students).aggregates()}, students)
+    env = {**os.environ, "RESULT_STORE": "sqlite", "RESULT_SQLITE_PATH": db_path,
+           "RESULT_SAVE_JOBS_DIR": os.path.join(workdir, "save_jobs")}
+    for key in ("PERF_LOG_PATH", "PERF_PROMETHEUS_PATH", "RESULT_PARSE_CACHE_DIR"): env.pop(key, None)
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    signed_in = {"logged_in": True, "id_token": "bench", "user_id": "bench"}
+    scenarios = [
+        ("login", {"role": "login", "session": {}}),
+        ("teacher", {"role": "teacher", "session": {**signed_in, "role": "teacher", "user": {"name": "Bench", "role": "teacher"}}}),
+        ("student", {"role": "student", "prn": "7226000001F",
+                     "session": {**signed_in, "role": "student", "user": {"name": "Bench", "role": "student"}}}),
+    ]
+    print(f"Time to first render in a fresh process ({args.exams} uploads x {args.students} students in SQLite), median of {args.repeat}")
+    metrics = {}
+    for name, config in scenarios:
+        samples = defaultdict(list)
+        for _ in range(args.repeat):
+            proc = subprocess.run([sys.executable, "-c", STARTUP_PROBE, json.dumps({**config, "app": app_path})],
+                                  capture_output=True, text=True, cwd=os.path.dirname(app_path), env=env)
+            if proc.returncode != 0:
+                sys.exit(f"startup probe for {name} failed:\n{proc.stderr[-2000:]}")
+            for key, value in json.loads(proc.stdout.strip().splitlines()[-1]).items(): samples[key].append(value)
+        for key, values in samples.items():
+            page, _, stat = key.rpartition("|")
+            slug = "_".join(filter(None, [name, re.sub(r"\W+", "_", page).strip("_").lower()]))
+            metrics[f"{slug}_{stat}"] = statistics.median(values)
+            if stat == "lazy_modules_loaded":
+                print(f"  {slug:<32}: {metrics[f'{slug}_{stat}']:>10.0f} of numpy/pandas/plotly/PyPDF2/requests imported")
+            else:
+                print(f"  {slug + ' ' + stat.replace('_ms', ''):<32}: {metrics[f'{slug}_{stat}']:>10.1f} ms")
+    return metrics
+
+
+def bench_progression(args):
+    columns = generate_student_columns(args.students, args.exams, seed=args.seed)
+    tags = [f"SEM {exam + 1}" for exam in range(args.exams)]
+    table = StudentFactTable(columns)
+    keys = ['From', 'To', 'Students', 'Continued', 'Left', 'Joined', 'Improved', 'Declined', 'Pass→Fail']
+    steps = table.progression(tags, 0.25)['steps'][keys].to_dict('records')
+    assert steps == legacy_progression_steps(columns, tags, 0.25), "progression differs from the pandas merge"
+
+    # Rank lookups: sorting the exam's passing SGPAs per question vs a binary search in ExamRanks
+    last = tags[-1]
+    passing = [v for tag, v, ok in zip(columns['exam_tag'], columns['sgpa'], columns['passed']) if tag == last and ok]
+    probes = passing[:200]
+    rank_tables = rank_tables_from_columns(columns)
+    ranks = ExamRanks({last: rank_tables[last]})
+    assert [ranks.lookup(last, v)['Pass Rank'] for v in probes[:20]] == \
+           [sum(1 for other in passing if other > v) + 1 for v in probes[:20]], "ranks differ from a linear count"
+    legacy = best_of(lambda: legacy_progression_steps(columns, tags, 0.25), args.repeat)
+    build = best_of(lambda: StudentFactTable(columns), args.repeat)
+    query = best_of(lambda: table.progression(tags, 0.25), args.repeat)
+    sorted_rank = best_of(lambda: [sorted(passing, reverse=True).index(v) + 1 for v in probes], args.repeat) / len(probes)
+    # A profile builds ExamRanks from the tables of its own exams on every lookup
+    rank_build = best_of(lambda: ExamRanks({last: rank_tables[last]}), args.repeat)
+    lookup = best_of(lambda: [ranks.lookup(last, v) for v in probes], args.repeat) / len(probes)
+    every_exam = ExamRanks(rank_tables)
+    rank_all = best_of(lambda: table.rank_all(every_exam), args.repeat)
+    print(f"Progression of {args.students} students over {args.exams} exams ({len(table)} results), best of {args.repeat}")
+    print(f"  pandas merge per exam pair      : {legacy * 1000:>10.2f} ms  (steps only)")
+    print(f"  StudentFactTable build (once)   : {build * 1000:>10.2f} ms")
+    print(f"  progression (steps + students)  : {query * 1000:>10.2f} ms")
+    print(f"  rank by sorting per lookup      : {sorted_rank * 1e6:>10.1f} us")
+    print(f"  ExamRanks build (one exam)      : {rank_build * 1000:>10.2f} ms")
+    print(f"  rank by binary search           : {lookup * 1e6:>10.1f} us  ({sorted_rank / lookup:.0f}x)")
+    print(f"  {f'rank everyone ({len(table)} rows)':<32}: {rank_all * 1000:>10.2f} ms")
+    return {"legacy_ms": legacy * 1000, "table_build_ms": build * 1000, "progression_ms": query * 1000,
+            "sorted_rank_us": sorted_rank * 1e6, "ranks_build_ms": rank_build * 1000, "rank_lookup_us": lookup * 1e6,
+            "rank_all_ms": rank_all * 1000}
+
+
+SUITES = {"extract": bench_extract, "parse": bench_parse, "summary": bench_summary, "codec": bench_codec, "search": bench_search,
+          "progression": bench_progression, "startup": bench_startup}
+
+
+def bench_all(args):
+    results = {}
+    for suite, fn in SUITES.items():
+        print(f"\n== {suite}")
+        results[suite] = fn(args)
+    return results
+
+
+def save_results(path: str, suite: str, metrics: dict, args):
+    """Write metrics with the context (arguments, host, commit) needed to read a comparison."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    record = {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit, "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("func", "save")},
+        "results": metrics if suite == "all" else {suite: metrics},
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(record, fh, indent=2)
+    print(f"\nSaved results to {path}")
+
+
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as fh: baseline = json.load(fh)
+    with open(args.current, encoding="utf-8") as fh: current = json.load(fh)
+    print(f"{args.baseline} ({baseline.get('commit') or '?'}) -> {args.current} ({current.get('commit') or '?'})")
+    if baseline.get("args", {}).get("students") != current.get("args", {}).get("students"):
+        print("  note: the runs used different --students; timings are not directly comparable")
+    regressions = 0
+    for suite, metrics in current["results"].items():
+        for key, value in metrics.items():
+            old = baseline["results"].get(suite, {}).get(key)
+            if not old or not value: continue
+            # Positive means faster, whichever direction the metric runs
+            change = (value / old - 1) * 100 if key.endswith("_per_s") else (old / value - 1) * 100
+            flag = ""
+            if change < -args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {suite + '.' + key:<40} {old:>12,.2f} -> {value:>12,.2f}  {change:+7.1f}%{flag}")
+    print(f"{regressions} regression(s) beyond {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+def generate(args):
+    options = {"seed": args.seed, "subjects_per_student": args.subjects}
+    if args.out.lower().endswith(".pdf"):
+        pages = write_result_pdf(args.out, args.students, args.students_per_page, **options)
+        print(f"Wrote {args.students} students on {pages} pages to {args.out}")
+    else:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            for page_text in iter_result_pages(args.students, args.students_per_page, **options):
+                fh.write(page_text)
+        print(f"Wrote {args.students} students to {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="suite", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--repeat", type=int, default=5)
+    common.add_argument("--seed", type=int, default=0)
+    common.add_argument("--save", metavar="PATH", help="write the metrics as JSON for `compare`")
+
+    suites = [
+        ("extract", bench_extract, 2000, "PDF text extraction, serial vs process pool"),
+        ("parse", bench_parse, 10000, "Block parser throughput, legacy vs current"),
+        ("summary", bench_summary, 50000, "Summary, top students and aggregates, list scans vs StudentTable"),
+        ("codec", bench_codec, 5000, "Firestore encode/decode throughput, legacy vs current"),
+        ("search", bench_search, 2000, "PRN and name history search against a local Firestore stub"),
+        ("progression", bench_progression, 20000, "Cohort progression and exam ranks across --exams uploads"),
+        ("startup", bench_startup, 500, "Time to first render of the login page and each dashboard"),
+        ("all", bench_all, 5000, "Every suite"),
+    ]
+    for name, fn, students, help_text in suites:
+        p = sub.add_parser(name, help=help_text, parents=[common])
+        p.add_argument("--students", type=int, default=students)
+        # Not on `common`: subparsers share parent actions, so one suite's default would apply to all
+        p.add_argument("--exams", type=int, default=8 if name == "progression" else 4,
+                       help="uploads of the same cohort (search, progression and startup suites)")
+        p.set_defaults(func=fn)
+
+    p = sub.add_parser("generate", help="Write a synthetic result sheet (.pdf needs reportlab, anything else is text)")
+    p.add_argument("--students", type=int, default=1000)
+    p.add_argument("--subjects", type=int, default=8)
+    p.add_argument("--students-per-page", type=int, default=STUDENTS_PER_PAGE)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", required=True)
+    p.set_defaults(func=generate)
+
+    p = sub.add_parser("compare", help="Compare two --save files, exit 1 on regressions")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=10.0, help="slowdown in percent counted as a regression")
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    metrics = args.func(args)
+    if getattr(args, "save", None) and metrics is not None:
+        save_results(args.save, args.suite, metrics, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Headless batch ingest of SPPU result PDFs.
+
+Parses every PDF in a directory across a process pool and saves each one the
+same way the "💾 Save to Database" button does:
+
+    python ingest.py results/ --email teacher@college.edu --password ...
+    python ingest.py results/ --tag-pattern "(?P<tag>[A-Z]{2}_\\d{4})" --dry-run out/
+
+Exam tags come from, in order: a --manifest entry for the file name, the
+`tag` group of --tag-pattern matched against the file stem, or the file stem
+itself with underscores turned into spaces. Credentials may also be given as
+FIREBASE_EMAIL / FIREBASE_PASSWORD.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app import AdvancedResultAnalyzer, FirebaseManager, PDF_WORKERS, _pdf_pool_context
+
+
+def parse_pdf(path: str):
+    """Worker: parse one PDF in-process. Returns (path, students, summary, pages, seconds, error)."""
+    start = time.perf_counter()
+    pages = [0]
+    try:
+        analyzer = AdvancedResultAnalyzer()
+        # workers=1: the files themselves are already spread over the pool
+        students = list(analyzer.stream_students(path, progress_callback=lambda done, total: pages.__setitem__(0, total), workers=1))
+        analyzer.students_data = students
+        return path, students, analyzer.get_result_summary(), pages[0], time.perf_counter() - start, None
+    except Exception as e:
+        return path, [], {}, pages[0], time.perf_counter() - start, str(e)
+
+
+def load_manifest(path: str) -> dict:
+    """File name -> exam tag, from a JSON object or a two-column CSV (file_name, exam_tag)."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        if path.lower().endswith(".json"):
+            return json.load(fh)
+        return {row[0].strip(): row[1].strip() for row in csv.reader(fh) if len(row) >= 2 and row[0].strip() != "file_name"}
+
+
+def derive_exam_tag(file_name: str, manifest: dict, tag_pattern) -> str:
+    if file_name in manifest:
+        return manifest[file_name]
+    stem = os.path.splitext(file_name)[0]
+    if tag_pattern:
+        match = tag_pattern.search(stem)
+        if match:
+            return (match.groupdict().get("tag") or match.group(0)).replace("_", " ")
+    return stem.replace("_", " ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse a directory of result PDFs and save them in bulk.")
+    parser.add_argument("directory")
+    parser.add_argument("--manifest", help="JSON or CSV mapping file name to exam tag")
+    parser.add_argument("--tag-pattern", help="regex applied to the file stem; the 'tag' group (or whole match) is the exam tag")
+    parser.add_argument("--workers", type=int, default=PDF_WORKERS)
+    parser.add_argument("--dry-run", metavar="OUT_DIR", help="write parsed JSON here instead of saving to Firestore")
+    parser.add_argument("--email", default=os.environ.get("FIREBASE_EMAIL"))
+    parser.add_argument("--password", default=os.environ.get("FIREBASE_PASSWORD"))
+    parser.add_argument("--uploaded-by", default="Batch Ingest")
+    args = parser.parse_args()
+
+    pdfs = sorted(os.path.join(args.directory, f) for f in os.listdir(args.directory) if f.lower().endswith(".pdf"))
+    if not pdfs:
+        sys.exit(f"No PDFs found in {args.directory}")
+    manifest = load_manifest(args.manifest) if args.manifest else {}
+    tag_pattern = re.compile(args.tag_pattern) if args.tag_pattern else None
+
+    fm = None
+    if args.dry_run:
+        os.makedirs(args.dry_run, exist_ok=True)
+    else:
+        if not (args.email and args.password):
+            sys.exit("--email/--password (or FIREBASE_EMAIL/FIREBASE_PASSWORD) are required unless --dry-run is given")
+        fm = FirebaseManager()
+        success, result = fm.verify_user(args.email, args.password)
+        if not success:
+            sys.exit(result)
+        if result['role'] != 'teacher':
+            sys.exit("Only teacher accounts can save results.")
+
+    wall_start = time.perf_counter()
+    totals = {"files": 0, "failed": 0, "pages": 0, "students": 0, "parse_seconds": 0.0, "save_seconds": 0.0}
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(pdfs))), mp_context=_pdf_pool_context()) as pool:
+        futures = [pool.submit(parse_pdf, path) for path in pdfs]
+        for future in as_completed(futures):
+            path, students, summary, pages, seconds, error = future.result()
+            file_name = os.path.basename(path)
+            totals["parse_seconds"] += seconds
+            if error or not students:
+                totals["failed"] += 1
+                print(f"✗ {file_name}: {error or 'no students found'}")
+                continue
+
+            exam_tag = derive_exam_tag(file_name, manifest, tag_pattern)
+            save_start = time.perf_counter()
+            if args.dry_run:
+                out_path = os.path.join(args.dry_run, os.path.splitext(file_name)[0] + ".json")
+                with open(out_path, "w", encoding="utf-8") as fh:
+                    json.dump({"file_name": file_name, "exam_tag": exam_tag, "summary": summary, "students_data": students}, fh)
+                saved = out_path
+            else:
+                saved = fm.save_result_data(file_name, exam_tag, students, args.uploaded_by, summary)
+            totals["save_seconds"] += time.perf_counter() - save_start
+            if not saved:
+                totals["failed"] += 1
+                print(f"✗ {file_name}: save failed")
+                continue
+
+            totals["files"] += 1
+            totals["pages"] += pages
+            totals["students"] += len(students)
+            print(f"✓ {file_name} [{exam_tag}] {len(students)} students, {pages} pages, {seconds:.2f}s -> {saved}")
+
+    wall = time.perf_counter() - wall_start
+    print(f"\n{totals['files']} files ingested, {totals['failed']} failed in {wall:.2f}s")
+    print(f"  {totals['pages']} pages, {totals['students']} students"
+          f" | {totals['pages'] / wall:.1f} pages/s, {totals['students'] / wall:.1f} students/s")
+    print(f"  parse CPU time {totals['parse_seconds']:.2f}s, save time {totals['save_seconds']:.2f}s")
+    sys.exit(1 if totals["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()